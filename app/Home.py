@@ -1,5 +1,10 @@
 import streamlit as st
 
+import resources
+
 st.set_page_config(page_title='Tysight', layout='wide', initial_sidebar_state='expanded')
 
 st.title('Home')
+
+# Build shared services now so the first page that needs them is fast
+resources.warm_up()
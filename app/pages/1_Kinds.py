@@ -1,5 +1,6 @@
 import streamlit as st
-from insight_agent.kind_manager import create_kind
+
+import resources
 
 st.title('Create a New Kind')
 
@@ -12,6 +13,8 @@ kind_options = ["NIQ POS", "Circana POS", "NIQ Panel", "Media", "Walmart POS", "
 kind_name = st.selectbox('Kind Name', options=kind_options)
 kind_description = st.text_area('Kind Description')
 
+sheet, header_row = resources.excel_options(sample)
+
 if st.button('Create Kind'):
     if mapping is None:
         st.error('Please upload the Required Mapping Workbook before creating a Kind.')
@@ -20,8 +23,9 @@ if st.button('Create Kind'):
     elif not kind_name or kind_name.strip() == '':
         st.error('Please select a valid Kind Name.')
     else:
-        success, message = create_kind(mapping, kind_name.strip(), sample, kind_description)
-        if success:
-            st.success(message)
-        else:
-            st.error(message)
+        # Runs in a background process; progress and the outcome show on the Runs page
+        job_id = resources.job_runner().submit('create_kind', kind_name.strip(),
+                                               {'mapping_file': mapping, 'sample_file': sample},
+                                               kind_description=kind_description, sheet=sheet,
+                                               header_row=header_row)
+        st.success(f"Kind creation queued as job {job_id[:8]}. Follow it on the Runs page.")
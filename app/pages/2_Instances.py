@@ -1,31 +1,51 @@
 import streamlit as st
-import os
+
+import resources
 
 st.title('Onboard a New Instance')
 
 # Find existing kinds
-kinds_dir = os.path.join('domain', 'catalog', 'kinds')
-kinds = []
-if os.path.exists(kinds_dir):
-    try:
-        kinds = [d for d in os.listdir(kinds_dir) if os.path.isdir(os.path.join(kinds_dir, d))]
-    except Exception:
-        kinds = []
+kinds = resources.catalog().kinds()
 
 selected_kind = st.selectbox('Select a Kind to onboard', options=kinds if kinds else ['No kinds available'])
 
 data_file = st.file_uploader('Upload instance data file', type=['csv', 'xlsx', 'xls'])
+mode = st.radio('Onboarding mode', options=['replace', 'append', 'upsert'], horizontal=True,
+                help='Append adds the file as new partitions; it requires partition keys (partition_order) in the mapping. '
+                     'Upsert replaces rows whose key columns (key_order) match and adds the rest, '
+                     'rewriting only the partitions the file touches.')
+
+sheet, header_row = resources.excel_options(data_file)
+
+preview_col, onboard_col = st.columns(2)
+
+if preview_col.button('Preview', help='Check the header and a sample of values against the mapping without loading the file.'):
+    if selected_kind == 'No kinds available' or data_file is None:
+        st.error('Select a kind and upload an instance data file to preview.')
+    else:
+        from insight_agent.instance_manager import preview_instance
 
-from insight_agent.instance_manager import onboard_instance
+        ok, message, report = preview_instance(selected_kind, data_file, sheet=sheet, header_row=header_row)
+        if not ok:
+            st.error(message)
+        else:
+            (st.warning if any(r['failed'] for r in report) else st.success)(message)
+            st.dataframe([dict(r, examples=', '.join(r['examples'])) for r in report], hide_index=True)
 
-if st.button('Onboard Instance'):
+if onboard_col.button('Onboard Instance'):
     if selected_kind == 'No kinds available':
         st.error('No Kind available to onboard against.')
     elif data_file is None:
         st.error('Please upload an instance data file.')
     else:
-        success, message = onboard_instance(selected_kind, data_file)
-        if success:
-            st.success(message)
-        else:
+        from insight_agent.instance_manager import check_header
+
+        # Reject a wrong file here, from its header, instead of in a queued job
+        ok, message = check_header(selected_kind, data_file, sheet, header_row)
+        if not ok:
             st.error(message)
+        else:
+            # Runs in a background process, so a refresh does not lose the work
+            job_id = resources.job_runner().submit('onboard_instance', selected_kind, {'instance_file': data_file},
+                                                   mode=mode, sheet=sheet, header_row=header_row)
+            st.success(f"Onboarding queued as job {job_id[:8]}. Follow its progress on the Runs page.")
@@ -1,6 +1,6 @@
 import streamlit as st
-import os
-import json
+
+import resources
 
 st.title('Ask & Analyze')
 
@@ -8,72 +8,262 @@ st.title('Ask & Analyze')
 if 'sql_query' not in st.session_state:
     st.session_state.sql_query = ''
 
-# List available kinds
-kinds_dir = os.path.join('domain','catalog','kinds')
-kind_options = []
-if os.path.exists(kinds_dir):
-    for p in os.listdir(kinds_dir):
-        if os.path.isdir(os.path.join(kinds_dir,p)):
-            kind_options.append(p)
+# Kind metadata is indexed once per process and shared across sessions
+catalog = resources.catalog()
+resources.warm_up()
+kind_options = catalog.kinds()
 
 selected_kind = st.selectbox('Select a Kind', options=[''] + kind_options)
 
-profile = {}
+# For all filterable columns in the dataset profile, show their unique values and capture selections
+selected_filters_ui = {}
 if selected_kind:
-    # Load profile.json from the datasets directory for the selected kind
-    datasets_dir = os.path.join('domain','catalog','datasets')
-    profile_path = os.path.join(datasets_dir, selected_kind, 'profile.json')
-    if os.path.exists(profile_path):
-        try:
-            with open(profile_path,'r') as pf:
-                profile = json.load(pf)
-        except Exception:
-            profile = {}
-
-    # For all filterable columns in profile_data, show their unique values and capture selections
-    selected_filters_ui = {}
-    if profile:
-        # Sort filters by filter_display_order when present (None treated as large)
-        def order_key(item):
-            col, info = item
-            order = info.get('filter_display_order') if isinstance(info, dict) else None
-            return (order is None, order if order is not None else 999999)
-
-        for col, info in sorted(profile.items(), key=order_key):
-            values = info['values'] if isinstance(info, dict) else info
-            key = f"filter_{col}"
-            val = st.selectbox(f"Filter by {col}", options=[''] + list(values), key=key)
-            if val:
-                selected_filters_ui[col] = val
+    for col, info in catalog.get(selected_kind).filters():
+        key = f"filter_{col}"
+        val = st.selectbox(f"Filter by {col}", options=[''] + list(info['values']), key=key)
+        if val:
+            selected_filters_ui[col] = val
+
+# Other kinds to join in one query; each becomes a table named after its kind
+join_kinds = []
+if selected_kind:
+    join_kinds = st.multiselect('Join with other kinds', options=[k for k in kind_options if k != selected_kind],
+                                help='Questions spanning several kinds (e.g. POS sales with store attributes) '
+                                     'are answered with a join over their datasets. Filters apply to the first kind.')
+query_kinds = [selected_kind] + join_kinds if join_kinds else selected_kind
+
+# Kinds with a sample (built at onboarding) can answer from it first while the exact query runs
+fast_preview = False
+if selected_kind and not join_kinds:
+    from insight_agent.sampling import load_sample
+    if load_sample(selected_kind):
+        fast_preview = st.toggle('Fast preview', help='Answer from a stratified sample of the data in about a '
+                                                      'second, with estimated totals and margins of error; the '
+                                                      'exact result replaces it when it finishes.')
+
+# A click on "Cancel query" reruns the script; the query keeps running in the
+# pool until it is interrupted here.
+if st.session_state.get('cancel_query') and st.session_state.get('running_query'):
+    resources.query_pool().cancel(st.session_state.running_query)
+    st.session_state.running_query = None
+    st.warning('Query cancelled.')
 
 # Question input
 question = st.text_area('Type your question')
 
+from insight_agent import tracing
 from insight_agent.prompt_builder import build_prompt
 
 if st.button('Ask'):
-    # collect selected filters from all filter widgets
-    selected_filters = selected_filters_ui if isinstance(selected_filters_ui, dict) else {}
+    # The exact query behind an earlier preview is no longer wanted
+    pending = st.session_state.get('exact_query')
+    if pending is not None:
+        handle = pending['handle']
+        resources.query_pool().cancel(handle.id)
+        st.session_state.exact_query = None
+        # A result that finished meanwhile holds an open cursor
+        if handle.done() and not handle.future.cancelled() and handle.future.exception() is None:
+            handle.result().close()
+    # One trace per question (see insight_agent.tracing; recorded when tracing is on)
+    with tracing.span('ask', kind=', '.join([selected_kind] + join_kinds), question=question[:200]) as ask_span:
+        # collect selected filters from all filter widgets
+        selected_filters = selected_filters_ui if isinstance(selected_filters_ui, dict) else {}
+
+        prompt = build_prompt(query_kinds, question, selected_filters)
+        st.code(prompt)
 
-    prompt = build_prompt(selected_kind, question, selected_filters)
-    st.code(prompt)
+        # Reuse SQL generated earlier for the same prompt before paying for an LLM call
+        from insight_agent.result_cache import get_cache
+        from insight_agent.semantic_cache import get_semantic_cache
+        cache = get_cache()
+        semantic = get_semantic_cache()
+        sql = cache.get_sql(selected_kind, prompt)
+        sql_cached = sql is not None
+        semantic_hit = None
+        llm_latency = 0.0
+        # Past questions and cached results are per kind; joins skip them
+        if not sql_cached and not join_kinds:
+            # Near-identical questions asked before can reuse their validated SQL
+            semantic_hit = semantic.lookup(selected_kind, question, selected_filters)
+        if semantic_hit:
+            sql = semantic_hit['sql']
+        elif not sql_cached:
+            # Otherwise give the LLM the closest past questions as examples
+            examples = [] if join_kinds else semantic.examples(selected_kind, question, selected_filters)
+            llm_prompt = build_prompt(query_kinds, question, selected_filters, examples=examples) if examples else prompt
+            # Now call the LLM client to get SQL
+            import time
+            from insight_agent.llm_client import generate_sql
+            started = time.perf_counter()
+            sql = generate_sql(llm_prompt)
+            llm_latency = time.perf_counter() - started
+        ask_span.set_attributes(sql_cache_hit=sql_cached, semantic_cache_hit=bool(semantic_hit))
+        # save SQL to session state for persistent display
+        st.session_state.sql_query = sql
 
-    # Now call the LLM client to get SQL
-    from insight_agent.llm_client import get_sql_from_prompt
-    sql = get_sql_from_prompt(prompt)
-    # save SQL to session state for persistent display
-    st.session_state.sql_query = sql
+        # Execute the SQL against the selected kind's parquet (if available)
+        import time
+        import pyarrow as pa
+        from insight_agent.query_result import QueryResult, DEFAULT_PAGE_SIZE
+        try:
+            # Selected filters are enforced server-side, not left to the generated SQL
+            df_result = None if join_kinds else cache.get_result(selected_kind, sql, selected_filters)
+            result_cached = df_result is not None
+            ask_span.set_attribute('result_cache_hit', result_cached)
+            if result_cached:
+                result = QueryResult.from_table(pa.Table.from_pandas(df_result, preserve_index=False))
+            else:
+                # Run on the shared worker pool so a runaway query can time out or be cancelled;
+                # only the first page is fetched, the rest streams in on demand
+                pool = resources.query_pool()
+                handle = pool.submit(query_kinds, sql, filters=selected_filters, page_size=DEFAULT_PAGE_SIZE,
+                                     approximate=fast_preview)
+                st.session_state.running_query = handle.id
+                st.button('Cancel query', key='cancel_query')
+                status = st.empty()
+                while not handle.done():
+                    depth = pool.stats()['queue_depth']
+                    if handle.started_at is None:
+                        status.caption(f"Waiting for a query worker ({depth} queued)...")
+                    else:
+                        status.caption(f"Running for {handle.run_s:.1f}s...")
+                    time.sleep(0.1)
+                status.empty()
+                st.session_state.running_query = None
+                result = handle.result()
+                if result.sample is not None:
+                    # Estimates are never cached; the exact query follows in the background
+                    from insight_agent.query_pool import QueryQueueFull
+                    try:
+                        st.session_state.exact_query = {
+                            'handle': pool.submit(query_kinds, sql, filters=selected_filters, page_size=DEFAULT_PAGE_SIZE),
+                            'kind': selected_kind, 'sql': sql, 'filters': selected_filters}
+                    except QueryQueueFull:
+                        st.warning('The query engine is busy, so the exact query was not started; ask again '
+                                   'without the fast preview for exact results.')
+                # Results that fit in the first page are cheap to keep
+                elif result.complete and not join_kinds:
+                    cache.put_result(selected_kind, sql, result.to_table().to_pandas(), selected_filters)
+            # Only SQL that executed successfully is worth reusing
+            if not sql_cached:
+                cache.put_sql(selected_kind, prompt, sql)
+            if not sql_cached and not semantic_hit and not join_kinds:
+                semantic.add(selected_kind, question, sql, selected_filters, latency=llm_latency)
+            notes = []
+            if semantic_hit:
+                notes.append(f"SQL reused from similar question \"{semantic_hit['question']}\" (similarity {semantic_hit['similarity']:.2f})")
+            if sql_cached or result_cached:
+                notes.append(f"Served from cache (SQL: {'hit' if sql_cached else 'miss'}, result: {'hit' if result_cached else 'miss'})")
+            sample = result.sample
+            if sample is not None:
+                note = (f"Fast preview: estimated from a {sample['rate']:.1%} sample ({sample['sample_rows']:,} of "
+                        f"{sample['source_rows']:,} rows), stratified by {', '.join(sample['strata_columns']) or 'nothing'}. "
+                        "Counts, sums and averages are scaled to the full data")
+                if sample['error_column']:
+                    note += (f"; {sample['error_column']} is a rough, count-based 95% relative margin from how many "
+                             "sampled rows each row rests on. It ignores how spread the values are, so take it as "
+                             "a rough guide only for sums and averages")
+                notes.append(note + '.')
+                if sample['unscaled']:
+                    notes.append('Other aggregates (MIN, MAX, distinct counts, quantiles) describe the sampled rows only.')
+            previous = st.session_state.get('query_result')
+            if previous is not None:
+                previous.close()
+            st.session_state.query_result = result
+            st.session_state.result_notes = notes
+            st.session_state.result_page = 0
+            st.session_state.result_export = None
+        except Exception as e:
+            ask_span.record_error(e)
+            st.error(f"Error executing query: {e}")
 
-    # Execute the SQL against the selected kind's parquet (if available)
-    from insight_agent.query_executor import execute_query
+# Swap in the exact result behind a fast preview once it has finished
+pending = st.session_state.get('exact_query')
+if pending is not None and pending['handle'].done():
+    st.session_state.exact_query = None
     try:
-        df_result = execute_query(selected_kind, sql)
-        st.markdown('**Query Results:**')
-        st.dataframe(df_result)
+        exact = pending['handle'].result()
     except Exception as e:
-        st.error(f"Error executing query: {e}")
+        st.session_state.result_notes = st.session_state.get('result_notes', []) + [
+            f"The exact query did not finish ({e}); the results below are estimates."]
+    else:
+        previous = st.session_state.get('query_result')
+        if previous is not None:
+            previous.close()
+        st.session_state.query_result = exact
+        st.session_state.result_notes = ['Exact result (replaced the fast preview).']
+        st.session_state.result_page = 0
+        st.session_state.result_export = None
+        if exact.complete:
+            from insight_agent.result_cache import get_cache
+            get_cache().put_result(pending['kind'], pending['sql'], exact.to_table().to_pandas(), pending['filters'])
+
+# Results stay in session state so paging and downloads do not re-run the query
+result = st.session_state.get('query_result')
+if result is not None:
+    st.markdown('**Query Results:**')
+    if st.session_state.get('exact_query') is not None:
+        st.caption(f"Exact query running in the background ({st.session_state.exact_query['handle'].run_s:.1f}s)...")
+    for note in st.session_state.get('result_notes', []):
+        st.caption(note)
+    page = st.session_state.get('result_page', 0)
+    first_row = page * result.page_size
+    try:
+        # Later pages are read on a query worker, under the pool's timeout
+        table = result.page(page)
+        more = result.has_page(page + 1)
+    except Exception as e:
+        st.error(f"Could not fetch more rows: {e}")
+        table, more = result.page(0).slice(0, 0), False
+    if result.complete:
+        st.caption(f"Rows {first_row + 1:,}-{first_row + table.num_rows:,} of {result.total_rows():,}")
+    else:
+        st.caption(f"Rows {first_row + 1:,}-{first_row + table.num_rows:,} of at least {result.fetched_rows:,}")
+    st.dataframe(table)
+
+    def turn_page(step):
+        st.session_state.result_page = page + step
+
+    prev_col, next_col, count_col = st.columns(3)
+    prev_col.button('Previous page', disabled=page == 0, on_click=turn_page, args=(-1,))
+    next_col.button('Next page', disabled=not more, on_click=turn_page, args=(1,))
+    if not result.complete and count_col.button('Count all rows'):
+        try:
+            count_col.caption(f"{result.total_rows():,} rows in total")
+        except Exception as e:
+            count_col.error(f"Could not count the rows: {e}")
+
+    export_format = st.radio('Download format', options=['parquet', 'csv'], horizontal=True)
+    if st.button('Prepare download'):
+        import os
+        import uuid
+        previous_export = st.session_state.get('result_export')
+        if previous_export and os.path.exists(previous_export):
+            os.remove(previous_export)
+        export_path = os.path.join('domain', 'cache', 'exports', f"{uuid.uuid4().hex}.{export_format}")
+        try:
+            st.session_state.result_export = result.export(export_path, export_format)
+        except Exception as e:
+            st.error(f"Could not prepare the download: {e}")
+    export_path = st.session_state.get('result_export')
+    if export_path:
+        with open(export_path, 'rb') as fh:
+            st.download_button('Download full result', data=fh, file_name=f"result.{export_path.rsplit('.', 1)[-1]}")
 
 # If a SQL query has been stored in session state, display it
 if st.session_state.sql_query:
     st.markdown('**Generated SQL:**')
     st.code(st.session_state.sql_query)
+
+with st.expander('Question cache statistics'):
+    from insight_agent.semantic_cache import get_semantic_cache
+    st.json(get_semantic_cache().stats())
+
+with st.expander('Query engine statistics'):
+    st.json(resources.query_pool().stats())
+
+# Poll the exact query behind a fast preview until it replaces the estimates
+if st.session_state.get('exact_query') is not None:
+    import time
+    time.sleep(1)
+    st.rerun()
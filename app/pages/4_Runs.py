@@ -1,3 +1,134 @@
+import time
+from datetime import datetime
+
 import streamlit as st
 
-st.title('4_Runs.py')
+import resources
+from insight_agent.job_runner import ACTIVE_STATUSES
+
+st.title('Runs')
+st.markdown('Kind creation and onboarding jobs run in background processes; this page follows them live.')
+
+# Stages shown as columns of the Ask traces table: column -> span names
+TRACE_STAGES = {
+    'prompt_ms': ('build_prompt',),
+    'llm_ms': ('llm.generate_sql',),
+    'open_db_ms': ('duckdb.open_database',),
+    'scan_ms': ('query.execute', 'query.first_page'),
+    'to_pandas_ms': ('query.to_pandas',),
+}
+
+
+def _when(ts):
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S') if ts else ''
+
+
+def _show_traces():
+    """Per-stage timings of recent Ask requests (see insight_agent.tracing)."""
+    import pandas as pd
+
+    from insight_agent import tracing
+
+    st.subheader('Ask traces')
+    traces = tracing.load_traces(limit=50)
+    if not traces:
+        state = 'on' if tracing.enabled() else 'off (turn it on in Settings)'
+        st.caption(f"No traces recorded yet. Tracing is {state}.")
+        return
+    rows = []
+    for trace in traces:
+        root = trace['spans'][0]['attributes']
+        row = {'started': _when(trace['started']), 'kind': root.get('kind'), 'question': root.get('question'),
+               'status': trace['status'], 'total_ms': round(trace['duration_ms'], 1)}
+        for column, names in TRACE_STAGES.items():
+            spans = [sp for sp in trace['spans'] if sp['name'] in names]
+            row[column] = round(sum(sp['duration_ms'] for sp in spans), 1) if spans else None
+        scans = [sp['attributes'] for sp in trace['spans'] if sp['name'] in TRACE_STAGES['scan_ms']]
+        row['rows_scanned'] = sum(a.get('rows_scanned', 0) for a in scans) if scans else None
+        row['bytes_read'] = sum(a.get('bytes_read', 0) for a in scans) if scans else None
+        rows.append(row)
+    st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+    labels = {f"{t['trace_id'][:8]} · {_when(t['started'])} · {t['duration_ms']:.0f} ms": t for t in traces}
+    trace = labels[st.selectbox('Trace', options=list(labels))]
+    st.dataframe(pd.DataFrame([{
+        'span': '  ' * sp['depth'] + sp['name'],
+        'start_ms': round(sp['start_ms'], 1),
+        'duration_ms': round(sp['duration_ms'], 1),
+        'status': sp['status'],
+        'attributes': ', '.join(f"{k}={v}" for k, v in sp['attributes'].items()),
+    } for sp in trace['spans']]), hide_index=True, use_container_width=True)
+
+
+runner = resources.job_runner()
+jobs = runner.jobs(limit=200)
+
+if not jobs:
+    st.info('No runs yet. Create a Kind or onboard an Instance to start one.')
+    _show_traces()
+    st.stop()
+
+
+def _duration(job):
+    if job['duration_s'] is not None:
+        return job['duration_s']
+    if job['status'] == 'running' and job['started_at']:
+        return round(time.time() - job['started_at'], 1)
+    return None
+
+
+def _show_jobs(jobs):
+    """Table of runs with their progress and throughput."""
+    import pandas as pd
+
+    rows = []
+    for job in jobs:
+        duration = _duration(job)
+        rows_per_s = job['rows_per_s']
+        if rows_per_s is None and job['status'] == 'running' and job['rows'] and duration:
+            rows_per_s = round(job['rows'] / duration, 1)
+        rows.append({
+            'job': job['id'][:8],
+            'type': job['job_type'],
+            'kind': job['kind_name'],
+            'status': job['status'],
+            'progress': job['progress'] or 0.0,
+            'rows': job['rows'] or 0,
+            'duration_s': duration,
+            'rows_per_s': rows_per_s,
+            'peak_memory_mb': job['peak_memory_mb'],
+            'attempts': job['attempts'],
+            'created': _when(job['created_at']),
+            'message': job['message'] or '',
+        })
+    st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True,
+                 column_config={'progress': st.column_config.ProgressColumn('progress', min_value=0.0, max_value=1.0)})
+
+
+_show_jobs(jobs)
+
+st.subheader('Manage a run')
+labels = {f"{job['id'][:8]} · {job['job_type']} · {job['kind_name']} · {job['status']}": job for job in jobs}
+selected = labels[st.selectbox('Run', options=list(labels))]
+col_cancel, col_retry = st.columns(2)
+if col_cancel.button('Cancel', disabled=selected['status'] not in ACTIVE_STATUSES):
+    # Shown after the rerun that refreshes the table
+    if runner.cancel(selected['id']):
+        st.session_state.runs_notice = ('success', 'Cancellation requested; a running job stops at its next '
+                                                   'progress update.')
+    else:
+        st.session_state.runs_notice = ('warning', 'The run already finished.')
+    st.rerun()
+if col_retry.button('Retry', disabled=selected['status'] not in ('failed', 'cancelled')):
+    if runner.retry(selected['id']):
+        st.rerun()
+    else:
+        st.error('This run cannot be retried; its uploaded files are no longer available.')
+notice = st.session_state.pop('runs_notice', None)
+if notice is not None:
+    getattr(st, notice[0])(notice[1])
+
+_show_traces()
+
+if any(job['status'] in ACTIVE_STATUSES for job in jobs) and st.toggle('Live updates', value=True):
+    time.sleep(2)
+    st.rerun()
@@ -1,3 +1,28 @@
 import streamlit as st
 
-st.title('5_Settings.py')
+import resources
+
+st.title('Settings')
+
+st.subheader('Query Engine')
+st.markdown('DuckDB resource limits applied to each pooled kind database.')
+
+manager = resources.query_engine()
+current = manager.settings
+
+memory_limit = st.text_input('Memory limit (e.g. 4GB)', value=str(current.get('memory_limit', '')))
+threads = st.number_input('Threads', min_value=0, value=int(current.get('threads', 0)), help='0 keeps the DuckDB default.')
+
+if st.button('Apply'):
+    manager.configure(memory_limit=memory_limit.strip() or None, threads=int(threads) or None)
+    st.success('Query engine settings updated.')
+
+st.subheader('Tracing')
+from insight_agent import tracing
+
+st.markdown(f"Time each stage of Ask requests and write the traces (OpenTelemetry JSON) to `{tracing.TRACES_FILE}`. "
+            "Recent traces are listed on the Runs page.")
+tracing_on = st.toggle('Record traces', value=tracing.enabled(), help='Also enabled by INSIGHT_TRACING=1.')
+if tracing_on != tracing.enabled():
+    tracing.set_enabled(tracing_on)
+    st.success(f"Tracing {'enabled' if tracing_on else 'disabled'}.")
@@ -0,0 +1,84 @@
+"""Services shared by every page and session of the app.
+
+Each getter is wrapped in st.cache_resource, so the service is built once per
+server process on first use and later page loads (and reruns) only look it up.
+Pages import this module instead of the insight_agent modules behind it; that
+keeps their own imports cheap and defers pandas, DuckDB and litellm until a
+page actually needs them. Widgets more than one page shows live here too.
+"""
+import streamlit as st
+
+
+@st.cache_resource
+def config():
+    """Load .env into the environment once; returns whether a file was read."""
+    from insight_agent.config import load_env
+
+    return load_env()
+
+
+@st.cache_resource
+def catalog():
+    from insight_agent.catalog import get_catalog
+
+    return get_catalog()
+
+
+@st.cache_resource
+def query_engine():
+    """The per-kind DuckDB database pool (connection_manager.ConnectionManager)."""
+    from insight_agent.connection_manager import get_manager
+
+    config()
+    return get_manager()
+
+
+@st.cache_resource
+def query_pool():
+    from insight_agent.query_pool import get_pool
+
+    config()
+    return get_pool()
+
+
+@st.cache_resource
+def job_runner():
+    from insight_agent.job_runner import get_runner
+
+    config()
+    return get_runner()
+
+
+@st.cache_resource
+def warm_up():
+    """Build the shared services and start importing litellm in the background.
+
+    Called by the Home page, so the first question asked does not pay for
+    the LLM client's import.
+    """
+    from insight_agent.llm_client import prewarm
+
+    config()
+    catalog()
+    query_engine()
+    prewarm()
+    return True
+
+
+def excel_options(uploaded):
+    """Sheet and header-row widgets for an uploaded Excel file.
+
+    Returns:
+        tuple: (sheet, header_row) for ingest.iter_chunks; sheet is a name,
+        a 0-based position or None for the first sheet, header_row is 0-based.
+        (None, 0) when the upload is not an Excel file.
+    """
+    if uploaded is None or not uploaded.name.lower().endswith(('.xlsx', '.xls')):
+        return None, 0
+    with st.expander('Excel options'):
+        sheet = st.text_input('Sheet', help='Sheet name or 1-based position; the first sheet by default.').strip() or None
+        header_row = st.number_input('Header row', min_value=1, value=1,
+                                     help='Row holding the column names; rows above it are skipped.') - 1
+    if sheet is not None and sheet.isdigit():
+        sheet = int(sheet) - 1
+    return sheet, header_row
@@ -0,0 +1,281 @@
+import os
+import re
+import json
+import time
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+
+CATALOG_DIR = os.path.join('domain', 'catalog')
+# Seconds a cached entry is served without re-checking file mtimes; 0 stats
+# the underlying files on every access (still no listing or JSON parsing).
+DEFAULT_CHECK_INTERVAL = 0.0
+
+
+def _order(value):
+    """Parse an optional integer order field (blank or invalid -> None)."""
+    try:
+        if value is not None and str(value).strip() != '':
+            return int(value)
+    except Exception:
+        pass
+    return None
+
+
+def _file_token(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, 'r') as fh:
+            return json.load(fh)
+    except Exception:
+        return default
+
+
+@dataclass(frozen=True)
+class ColumnSpec:
+    """One mapping record of a kind."""
+
+    original_name: str
+    canonical_name: str
+    type: str = ''
+    description: str = ''
+    data_type: str = ''
+    format_hint: str = ''
+    filter_display_order: Optional[int] = None
+    partition_order: Optional[int] = None
+    key_order: Optional[int] = None
+
+    @property
+    def is_measure(self):
+        return 'measure' in (self.type or '').lower()
+
+    @classmethod
+    def from_record(cls, rec):
+        orig = str(rec.get('original_name', '') or '')
+        return cls(
+            original_name=orig,
+            canonical_name=str(rec.get('canonical_name', orig) or orig),
+            type=str(rec.get('type', '') or ''),
+            description=str(rec.get('description', '') or ''),
+            data_type=str(rec.get('data_type', '') or ''),
+            format_hint=str(rec.get('format_hint', '') or ''),
+            filter_display_order=_order(rec.get('filter_display_order')),
+            partition_order=_order(rec.get('partition_order')),
+            key_order=_order(rec.get('key_order')),
+        )
+
+
+@dataclass(frozen=True, eq=False)
+class KindVersion:
+    """Metadata of one version of a kind and its dataset.
+
+    Instances are immutable and replaced as a whole when a file changes, so
+    they hash by identity and can key caches of derived data.
+    """
+
+    kind: str
+    version: str
+    kind_dir: str
+    dataset_dir: str
+    records: Tuple[dict, ...]
+    columns: Tuple[ColumnSpec, ...]
+    description: str
+    profile: Dict[str, dict]
+    token: tuple = field(default=())
+
+    @property
+    def mapping(self):
+        """The raw mapping_effective.json records."""
+        return list(self.records)
+
+    def column(self, canonical_name):
+        for col in self.columns:
+            if col.canonical_name == canonical_name:
+                return col
+        return None
+
+    def filters(self):
+        """Filterable profile entries as (column, info) sorted by filter_display_order."""
+        items = [(col, info) for col, info in self.profile.items()
+                 if isinstance(info, dict) and 'values' in info]
+
+        def order_key(item):
+            order = item[1].get('filter_display_order')
+            return (order is None, order if order is not None else 999999)
+
+        return sorted(items, key=order_key)
+
+    @property
+    def has_dataset(self):
+        return (os.path.exists(os.path.join(self.dataset_dir, 'latest.parquet'))
+                or os.path.exists(os.path.join(self.dataset_dir, 'manifest.json')))
+
+
+class Catalog:
+    """In-memory index of kinds, their mappings, descriptions and profiles.
+
+    Entries are loaded once and revalidated by file mtime/size (at most every
+    `check_interval` seconds), so widget changes on a page do not rescan the
+    catalog or re-parse JSON.
+
+    Args:
+        root (str): catalog directory containing kinds/ and datasets/.
+        check_interval (float): minimum seconds between revalidations.
+    """
+
+    def __init__(self, root=CATALOG_DIR, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.root = root
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._kinds = None
+        self._kinds_token = None
+        self._kinds_checked = 0.0
+        self._entries = {}
+        # kind -> (version names, kind directory token, monotonic time checked)
+        self._versions = {}
+
+    @property
+    def kinds_dir(self):
+        return os.path.join(self.root, 'kinds')
+
+    @property
+    def datasets_dir(self):
+        return os.path.join(self.root, 'datasets')
+
+    def kinds(self) -> List[str]:
+        """Names of all kinds, sorted."""
+        with self._lock:
+            now = time.monotonic()
+            if self._kinds is not None and now - self._kinds_checked < self.check_interval:
+                return list(self._kinds)
+            self._kinds_checked = now
+            token = _file_token(self.kinds_dir)
+            if self._kinds is None or token != self._kinds_token:
+                kinds = []
+                if os.path.exists(self.kinds_dir):
+                    try:
+                        kinds = sorted(d for d in os.listdir(self.kinds_dir)
+                                       if os.path.isdir(os.path.join(self.kinds_dir, d)))
+                    except Exception:
+                        kinds = []
+                self._kinds = kinds
+                self._kinds_token = token
+            return list(self._kinds)
+
+    def versions(self, kind_name):
+        """Version directories (v1, v2, ...) of a kind, oldest first.
+
+        Cached like kinds(): the directory is listed again only when its
+        mtime changes, checked at most every `check_interval` seconds.
+        """
+        kind_dir = os.path.join(self.kinds_dir, kind_name)
+        with self._lock:
+            now = time.monotonic()
+            cached = self._versions.get(kind_name)
+            if cached is not None and now - cached[2] < self.check_interval:
+                return list(cached[0])
+            token = _file_token(kind_dir)
+            if cached is not None and cached[1] == token:
+                self._versions[kind_name] = (cached[0], token, now)
+                return list(cached[0])
+            try:
+                names = sorted((d for d in os.listdir(kind_dir) if re.fullmatch(r'v\d+', d)),
+                               key=lambda v: int(v[1:]))
+            except OSError:
+                names = []
+            self._versions[kind_name] = (names, token, now)
+            return list(names)
+
+    def latest_version(self, kind_name):
+        """The kind's newest version ('v1' for a kind without versions yet)."""
+        versions = self.versions(kind_name)
+        return versions[-1] if versions else 'v1'
+
+    def _paths(self, kind_name, version):
+        kind_dir = os.path.join(self.kinds_dir, kind_name, version)
+        dataset_dir = os.path.join(self.datasets_dir, kind_name)
+        return kind_dir, dataset_dir, (
+            os.path.join(kind_dir, 'mapping_effective.json'),
+            os.path.join(kind_dir, 'description.md'),
+            os.path.join(dataset_dir, 'profile.json'),
+        )
+
+    def get(self, kind_name, version=None) -> KindVersion:
+        """Return the metadata of a kind version (latest version by default)."""
+        if version is None:
+            version = self.latest_version(kind_name)
+        key = (kind_name, version)
+        with self._lock:
+            now = time.monotonic()
+            cached = self._entries.get(key)
+            if cached is not None and now - cached[1] < self.check_interval:
+                return cached[0]
+            kind_dir, dataset_dir, paths = self._paths(kind_name, version)
+            token = tuple(_file_token(p) for p in paths)
+            if cached is not None and cached[0].token == token:
+                self._entries[key] = (cached[0], now)
+                return cached[0]
+            entry = self._load(kind_name, version, kind_dir, dataset_dir, paths, token)
+            self._entries[key] = (entry, now)
+            return entry
+
+    @staticmethod
+    def _load(kind_name, version, kind_dir, dataset_dir, paths, token):
+        mapping_path, desc_path, profile_path = paths
+        records = _read_json(mapping_path, [])
+        if not isinstance(records, list):
+            records = []
+        description = ''
+        if os.path.exists(desc_path):
+            try:
+                with open(desc_path, 'r') as fh:
+                    description = fh.read()
+            except Exception:
+                description = ''
+        profile = _read_json(profile_path, {})
+        return KindVersion(
+            kind=kind_name,
+            version=version,
+            kind_dir=kind_dir,
+            dataset_dir=dataset_dir,
+            records=tuple(records),
+            columns=tuple(ColumnSpec.from_record(r) for r in records if isinstance(r, dict)),
+            description=description,
+            profile=profile if isinstance(profile, dict) else {},
+            token=token,
+        )
+
+    def invalidate(self, kind_name=None):
+        """Forget cached metadata for a kind, or for the whole catalog."""
+        with self._lock:
+            self._kinds = None
+            if kind_name is None:
+                self._entries.clear()
+                self._versions.clear()
+            else:
+                self._versions.pop(kind_name, None)
+                for key in [k for k in self._entries if k[0] == kind_name]:
+                    del self._entries[key]
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """Return the process-wide Catalog."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = Catalog()
+        return _catalog
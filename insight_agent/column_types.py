@@ -0,0 +1,293 @@
+import re
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+# Distinct values up to which a string dimension is dictionary-encoded.
+DICTIONARY_MAX_DISTINCT = 10_000
+# Scale of currency measures stored as decimals.
+CURRENCY_SCALE = 2
+
+# Words in a mapping data_type that select a storage type, checked in order.
+# They match whole words (or their plural) only, so "account" is no count
+# and "weekday" no week.
+_DATA_TYPE_WORDS = [
+    ('datetime', 'timestamp'), ('timestamp', 'timestamp'),
+    ('date', 'date'), ('period', 'date'), ('week', 'date'),
+    ('bool', 'boolean'), ('boolean', 'boolean'), ('flag', 'boolean'),
+    ('currency', 'currency'), ('money', 'currency'), ('dollar', 'currency'),
+    ('percent', 'float'), ('percentage', 'float'), ('decimal', 'float'), ('float', 'float'),
+    ('double', 'float'), ('real', 'float'),
+    ('int', 'integer'), ('integer', 'integer'), ('bigint', 'integer'), ('smallint', 'integer'),
+    ('whole', 'integer'), ('count', 'integer'),
+    ('numeric', 'float'), ('number', 'float'),
+    ('text', 'string'), ('string', 'string'), ('char', 'string'), ('varchar', 'string'),
+    ('character', 'string'), ('category', 'string'), ('categorical', 'string'),
+]
+_INFERRED = {
+    'integer': 'integer', 'decimal': 'float', 'percent': 'float', 'currency': 'currency',
+    'date': 'date', 'datetime': 'timestamp', 'boolean': 'boolean',
+    'categorical': 'string', 'string': 'string',
+}
+_TRUE = {'true', 'yes', 'y', 't', '1'}
+_FALSE = {'false', 'no', 'n', 'f', '0'}
+
+
+def storage_kind(rec):
+    """Storage kind of a mapping record: integer, float, currency, date,
+    timestamp, boolean, string, or None to keep the type pandas read.
+
+    The declared data_type wins; otherwise the type inferred from the sample
+    at kind creation, then the coarse format_hint.
+    """
+    declared = set(re.findall(r'[a-z]+', str(rec.get('data_type', '') or '').lower()))
+    for word, kind in _DATA_TYPE_WORDS:
+        if word in declared or word + 's' in declared:
+            return kind
+    inferred = str(rec.get('inferred_type', '') or '').strip().lower()
+    if inferred in _INFERRED:
+        return _INFERRED[inferred]
+    hint = str(rec.get('format_hint', '') or '').strip().lower()
+    return {'numeric': 'float', 'datetime': 'timestamp', 'string': 'string'}.get(hint)
+
+
+def _arrow_type(kind):
+    return {
+        'integer': pa.int64(),
+        'float': pa.float64(),
+        'currency': pa.decimal128(18, CURRENCY_SCALE),
+        'date': pa.date32(),
+        'timestamp': pa.timestamp('us'),
+        'boolean': pa.bool_(),
+        'string': pa.string(),
+    }[kind]
+
+
+def _to_number(series):
+    """Parse numbers written with thousands separators, currency signs, % or (negatives)."""
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return pd.to_numeric(series, errors='coerce')
+    text = series.astype('string').str.strip()
+    negative = text.str.startswith('(') & text.str.endswith(')')
+    cleaned = text.str.replace(r'[,$€£¥%()\s]', '', regex=True)
+    values = pd.to_numeric(cleaned.replace('', None), errors='coerce').astype('float64')
+    return values.where(~negative.fillna(False).astype(bool), -values)
+
+
+def _infer_kind(series):
+    """Storage kind of a text column with no declared type, from its first chunk.
+
+    Columns whose values all parse as numbers become integer or float, and
+    true/false columns boolean; anything else stays text.
+    """
+    text = series.dropna().astype('string').str.strip()
+    text = text[text != '']
+    if text.empty:
+        return 'string'
+    if text.str.lower().isin(['true', 'false']).all():
+        return 'boolean'
+    numbers = pd.to_numeric(text, errors='coerce')
+    if numbers.notna().all():
+        return 'integer' if numbers.mod(1).eq(0).all() else 'float'
+    return 'string'
+
+
+def _to_datetime(series, date_format):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    text = series.astype('string').str.strip()
+    if date_format:
+        return pd.to_datetime(text, format=date_format, errors='coerce')
+    return pd.to_datetime(text, errors='coerce', format='mixed')
+
+
+def _to_boolean(series):
+    if pd.api.types.is_bool_dtype(series):
+        return series
+    text = series.astype('string').str.strip().str.lower()
+    return text.map(lambda v: True if v in _TRUE else (False if v in _FALSE else None), na_action='ignore')
+
+
+class TableCaster:
+    """Cast streamed chunks to compact, stable Arrow types from the mapping.
+
+    Integers become int64, decimals float64, currency decimal128(18, 2),
+    dates date32 and timestamps timestamp[us]; low-cardinality string
+    dimensions are dictionary-encoded. Text columns without a declared type
+    (CSV chunks are read as text) get one from their first chunk. Types are
+    settled by the first chunk so every chunk shares one schema; a column
+    most of whose first-chunk values do not parse as the declared type is
+    kept as text instead. Later values that do not parse are stored as null
+    and counted in `coerced`.
+
+    Args:
+        mapping (list): mapping_effective.json records.
+        keep_plain (list): canonical columns never dictionary-encoded
+            (partition keys, which are compared value by value).
+    """
+
+    def __init__(self, mapping, keep_plain=()):
+        self.rules = {}
+        self.measures = set()
+        for rec in mapping:
+            orig = rec.get('original_name')
+            canon = rec.get('canonical_name', orig) or orig
+            kind = storage_kind(rec)
+            measure = 'measure' in str(rec.get('type', '') or '').lower()
+            if canon and measure:
+                self.measures.add(canon)
+            if canon and kind:
+                self.rules[canon] = {
+                    'kind': kind,
+                    'date_format': str(rec.get('date_format', '') or ''),
+                    'measure': measure,
+                }
+        self.keep_plain = set(keep_plain)
+        self.dictionary = {}
+        self.coerced = {}
+
+    def _use_dictionary(self, col, series):
+        if col not in self.dictionary:
+            rule = self.rules.get(col, {})
+            self.dictionary[col] = (col not in self.keep_plain and not rule.get('measure')
+                                    and series.nunique(dropna=True) <= DICTIONARY_MAX_DISTINCT)
+        return self.dictionary[col]
+
+    def _cast(self, series, rule):
+        kind = rule['kind']
+        if kind in ('integer', 'float', 'currency'):
+            values = _to_number(series)
+            if kind == 'currency':
+                values = values.round(CURRENCY_SCALE)
+            elif kind == 'integer':
+                fractional = values.notna() & values.mod(1).ne(0)
+                if fractional.any():
+                    if not rule.get('fixed'):
+                        # The first chunk has fractions: store the column as float
+                        rule['kind'] = 'float'
+                    else:
+                        values = values.mask(fractional)
+            return values
+        if kind in ('date', 'timestamp'):
+            values = _to_datetime(series, rule['date_format'])
+            return values.dt.normalize() if kind == 'date' else values
+        if kind == 'boolean':
+            return _to_boolean(series).astype('boolean')
+        return series.astype('string')
+
+    def cast_frame(self, df):
+        """Return a copy of a chunk with every mapped column parsed to its type."""
+        out = {}
+        for col in df.columns:
+            series = df[col]
+            rule = self.rules.get(col)
+            if rule is None and (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+                rule = self.rules[col] = {'kind': _infer_kind(series), 'date_format': '',
+                                          'measure': col in self.measures}
+            if rule is None:
+                out[col] = series
+                continue
+            values = self._cast(series, rule)
+            lost = int((values.isna() & series.notna()).sum())
+            if not rule.get('fixed'):
+                rule['fixed'] = True
+                if lost and lost > 0.5 * int(series.notna().sum()):
+                    # Most values do not fit: the declared type is wrong, keep the text
+                    rule['kind'] = 'string'
+                    values, lost = series.astype('string'), 0
+            if lost:
+                self.coerced[col] = self.coerced.get(col, 0) + lost
+            out[col] = values
+        return pd.DataFrame(out, index=df.index)
+
+    def check_frame(self, df, examples=3):
+        """Test a sample against the mapping's types without changing this caster.
+
+        Args:
+            df (pandas.DataFrame): rows with canonical column names.
+            examples (int): failing values reported per column.
+
+        Returns:
+            dict: mapped column -> {'kind': storage kind a first chunk like
+            this would settle on, 'checked': non-empty values, 'failed':
+            values that do not parse and would be stored as empty,
+            'examples': up to `examples` distinct such values}.
+        """
+        report = {}
+        for col in df.columns:
+            rule = self.rules.get(col)
+            if rule is None:
+                continue
+            rule = dict(rule)
+            series = df[col]
+            bad = self._cast(series, rule).isna() & series.notna()
+            checked, failed = int(series.notna().sum()), int(bad.sum())
+            report[col] = {
+                # cast_frame keeps a column as text when most values do not parse
+                'kind': 'string' if failed and failed > 0.5 * checked else rule['kind'],
+                'checked': checked,
+                'failed': failed,
+                'examples': [str(v) for v in series[bad].unique()[:examples]],
+            }
+        return report
+
+    def to_arrow(self, df):
+        """Convert a cast chunk (see cast_frame) to an Arrow table."""
+        arrays, names = [], []
+        for col in df.columns:
+            series = df[col]
+            rule = self.rules.get(col)
+            if rule is None:
+                arrays.append(pa.Array.from_pandas(series))
+            else:
+                target = _arrow_type(rule['kind'])
+                if rule['kind'] == 'integer':
+                    array = pa.array(series.astype('Int64'), type=target)
+                elif rule['kind'] in ('date', 'timestamp'):
+                    array = pa.Array.from_pandas(series).cast(target, safe=False)
+                elif rule['kind'] == 'currency':
+                    array = pa.array(series.astype('float64'), type=pa.float64(), from_pandas=True)
+                    array = pc.cast(array, target, safe=False)
+                else:
+                    array = pa.array(series, type=target, from_pandas=True)
+                if rule['kind'] == 'string' and self._use_dictionary(col, series):
+                    array = array.dictionary_encode()
+                arrays.append(array)
+            names.append(col)
+        return pa.Table.from_arrays(arrays, names=names)
+
+
+def sort_keys(mapping):
+    """Columns each chunk is sorted by before writing.
+
+    Records with a numeric `sort_order` define the order; without any, date
+    columns come first, so row-group min/max statistics prune period filters.
+    """
+    ordered = []
+    dates = []
+    for rec in mapping:
+        orig = rec.get('original_name')
+        canon = rec.get('canonical_name', orig) or orig
+        order_val = rec.get('sort_order')
+        try:
+            if order_val is not None and str(order_val).strip() != '':
+                ordered.append((int(order_val), canon))
+                continue
+        except Exception:
+            pass
+        if storage_kind(rec) in ('date', 'timestamp'):
+            dates.append(canon)
+    if ordered:
+        return [name for _, name in sorted(ordered)]
+    return dates
+
+
+def sort_table(table, keys):
+    """Sort an Arrow table by the given columns (those present), nulls last."""
+    keys = [k for k in keys if k in table.column_names]
+    if not keys or table.num_rows < 2:
+        return table
+    indices = pc.sort_indices(table, sort_keys=[(k, 'ascending') for k in keys])
+    return table.take(indices)
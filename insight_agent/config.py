@@ -0,0 +1,32 @@
+import threading
+
+
+_loaded = False
+_load_lock = threading.Lock()
+
+
+def load_env(path=None):
+    """Load the .env file into os.environ once per process.
+
+    Called where settings are first needed (LLM calls, the app's shared
+    resources) rather than at import time, so importing a module does not
+    pay for python-dotenv or the file search.
+
+    Args:
+        path (str): .env file to read; by default python-dotenv looks for
+            one from this package's directory upwards. Variables already set
+            in the environment win.
+
+    Returns:
+        bool: True if this call read a .env file.
+    """
+    global _loaded
+    if _loaded:
+        return False
+    with _load_lock:
+        if _loaded:
+            return False
+        from dotenv import load_dotenv
+
+        _loaded = True
+        return bool(load_dotenv(path))
@@ -0,0 +1,234 @@
+import os
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import duckdb
+
+from insight_agent.dataset_store import scan_source, dataset_dir
+from insight_agent import tracing
+from insight_agent.rollups import load_rollups, rollups_token
+from insight_agent.sampling import load_sample, sample_token, SAMPLE_TABLE
+
+# Bytes read from the end of a parquet file when fingerprinting it. The footer
+# (schema + row group metadata) lives there, so any rewrite changes this hash.
+FOOTER_BYTES = 64 * 1024
+
+
+def dataset_fingerprint(path):
+    """Fingerprint a dataset file by mtime, size and a hash of its tail.
+
+    Args:
+        path (str): path to the parquet file (or manifest).
+
+    Returns:
+        tuple: (mtime_ns, size, footer_sha1) identifying the file contents.
+    """
+    st = os.stat(path)
+    with open(path, 'rb') as fh:
+        fh.seek(max(st.st_size - FOOTER_BYTES, 0))
+        footer_hash = hashlib.sha1(fh.read()).hexdigest()
+    return (st.st_mtime_ns, st.st_size, footer_hash)
+
+
+def default_settings():
+    """Read DuckDB resource settings from the environment.
+
+    DUCKDB_MEMORY_LIMIT takes a DuckDB size string (e.g. '4GB') and
+    DUCKDB_THREADS an integer. Unset values leave DuckDB's defaults in place.
+    """
+    settings = {}
+    memory_limit = os.environ.get('DUCKDB_MEMORY_LIMIT')
+    if memory_limit:
+        settings['memory_limit'] = memory_limit
+    threads = os.environ.get('DUCKDB_THREADS')
+    if threads:
+        settings['threads'] = int(threads)
+    return settings
+
+
+def apply_settings(con, settings):
+    """Apply memory_limit/threads settings to a DuckDB connection."""
+    if settings.get('memory_limit'):
+        limit = str(settings['memory_limit']).replace("'", "''")
+        con.execute(f"SET memory_limit='{limit}'")
+    if settings.get('threads'):
+        con.execute(f"SET threads={int(settings['threads'])}")
+
+
+def as_kinds(kind_name):
+    """A kind name, or a list of kind names for a multi-kind query, as a tuple."""
+    if isinstance(kind_name, str):
+        return (kind_name,)
+    kinds = tuple(dict.fromkeys(kind_name))
+    if not kinds:
+        raise ValueError('No kind selected.')
+    return kinds
+
+
+def _rollup_source(kind_name, rollup):
+    path = os.path.join(dataset_dir(kind_name), rollup['file']).replace('\\', '/').replace("'", "''")
+    return f"read_parquet('{path}')"
+
+
+def _sample_views(kind_name):
+    """(SAMPLE_TABLE, scan) for a kind with a current sample (see sampling)."""
+    sample = load_sample(kind_name)
+    return [(SAMPLE_TABLE, _rollup_source(kind_name, sample))] if sample else []
+
+
+class _KindDatabase:
+    """One in-memory DuckDB database with views registered over Parquet files.
+
+    A single kind gets `data` plus a view per materialized rollup (see
+    rollups) and one over its sample (see sampling); a group of kinds gets
+    one view per kind, named by sql_analyzer.table_names, so queries can
+    join them.
+
+    Args:
+        key: kind name, or tuple of kind names.
+        from_sql (tuple): scan expression of each kind's dataset.
+        fingerprint (tuple): identifies the files the views read.
+        settings (dict): memory_limit/threads (see apply_settings).
+        views (list): (view_name, scan_expression) pairs.
+    """
+
+    def __init__(self, key, from_sql, fingerprint, settings, views):
+        self.key = key
+        self.from_sql = from_sql
+        self.fingerprint = fingerprint
+        self.con = duckdb.connect(database=':memory:')
+        # Keep parquet metadata cached between queries so repeat questions
+        # skip footer parsing.
+        self.con.execute("SET enable_object_cache=true")
+        apply_settings(self.con, settings)
+        for name, source in views:
+            self.con.execute(f"CREATE VIEW {name} AS SELECT * FROM {source}")
+
+
+class ConnectionManager:
+    """Process-wide pool holding one DuckDB database per kind.
+
+    Each kind gets a single in-memory database whose `data` view is created
+    once. Callers borrow a cursor per request; cursors are independent
+    connections to the shared database, so Streamlit script threads can query
+    the same kind concurrently. The database is rebuilt when the kind's
+    dataset changes on disk (its parquet file, or the manifest of a
+    partitioned dataset) or its rollups or sample are rebuilt. Multi-kind
+    queries get a database of their own per group of kinds, with a view per
+    kind.
+    """
+
+    def __init__(self, memory_limit=None, threads=None):
+        self._lock = threading.Lock()
+        self._databases = {}
+        self._settings = default_settings()
+        self.configure(memory_limit=memory_limit, threads=threads)
+
+    @property
+    def settings(self):
+        return dict(self._settings)
+
+    def configure(self, memory_limit=None, threads=None):
+        """Update resource settings and apply them to open databases.
+
+        Args:
+            memory_limit (str): DuckDB memory limit per kind database, e.g. '2GB'.
+            threads (int): worker threads per kind database.
+        """
+        with self._lock:
+            if memory_limit:
+                self._settings['memory_limit'] = memory_limit
+            if threads:
+                self._settings['threads'] = int(threads)
+            for db in self._databases.values():
+                apply_settings(db.con, self._settings)
+
+    def _database(self, kind_name):
+        from insight_agent.sql_analyzer import DATA_TABLE, table_names
+
+        kinds = as_kinds(kind_name)
+        key = kinds[0] if len(kinds) == 1 else kinds
+        try:
+            sources = [scan_source(kind) for kind in kinds]
+            fingerprint = tuple((dataset_fingerprint(path), rollups_token(kind), sample_token(kind))
+                                for kind, (_, path) in zip(kinds, sources))
+        except FileNotFoundError:
+            self.invalidate(key)
+            raise
+        from_sql = tuple(sql for sql, _ in sources)
+        with self._lock:
+            db = self._databases.get(key)
+            if db is None or db.fingerprint != fingerprint or db.from_sql != from_sql:
+                # Cursors handed out from a replaced database keep it alive
+                # until they close, so in-flight queries are not interrupted.
+                with tracing.span('duckdb.open_database', kind=', '.join(kinds)) as sp:
+                    if len(kinds) == 1:
+                        rollups = load_rollups(key) or {}
+                        views = [(DATA_TABLE, from_sql[0])]
+                        views += [(r['name'], _rollup_source(key, r)) for r in rollups.get('rollups', [])]
+                        views += _sample_views(key)
+                    else:
+                        views = list(zip(table_names(kinds).values(), from_sql))
+                    db = _KindDatabase(key, from_sql, fingerprint, self._settings, views)
+                    sp.set_attribute('views', len(views))
+                self._databases[key] = db
+            return db
+
+    @contextmanager
+    def cursor(self, kind_name):
+        """Borrow a cursor on the kind's database for the duration of a request.
+
+        Args:
+            kind_name (str): name of the kind (directory under domain/catalog/datasets),
+                or a list of kind names to query together.
+
+        Yields:
+            duckdb.DuckDBPyConnection: a cursor with the `data` view available,
+            or one view per kind (see sql_analyzer.table_names) for a list.
+        """
+        cur = self.open_cursor(kind_name)
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+    def open_cursor(self, kind_name):
+        """Open a cursor on the kind's database that the caller closes.
+
+        For results consumed across requests (see query_result.QueryResult);
+        the cursor keeps its database alive even if the kind is rebuilt.
+        """
+        return self._database(kind_name).con.cursor()
+
+    def invalidate(self, kind_name=None):
+        """Drop the cached databases of a kind (alone or in a group), or of every kind."""
+        with self._lock:
+            if kind_name is None:
+                self._databases.clear()
+                return
+            kinds = set(as_kinds(kind_name))
+            for key in list(self._databases):
+                if kinds & set(as_kinds(key)):
+                    del self._databases[key]
+
+    def close(self):
+        """Close every pooled database."""
+        with self._lock:
+            databases = list(self._databases.values())
+            self._databases.clear()
+        for db in databases:
+            db.con.close()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager():
+    """Return the process-wide ConnectionManager, creating it on first use."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ConnectionManager()
+        return _manager
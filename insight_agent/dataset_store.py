@@ -0,0 +1,491 @@
+import os
+import json
+import shutil
+import datetime
+from urllib.parse import quote
+
+
+DATASETS_DIR = os.path.join('domain', 'catalog', 'datasets')
+MANIFEST_NAME = 'manifest.json'
+SINGLE_FILE_NAME = 'latest.parquet'
+PARTS_DIR_NAME = 'parts'
+# Upserted rows are staged here before being merged into the live files.
+STAGING_DIR_NAME = 'staging'
+# Sketch state of each live file, kept next to it so an upsert only
+# re-profiles the files it rewrites.
+PROFILE_STATE_SUFFIX = '.profile.json'
+# Directory value hive readers (DuckDB included) decode as NULL
+HIVE_NULL = '__HIVE_DEFAULT_PARTITION__'
+# Rows per parquet row group; DuckDB parallelises and prunes per row group.
+DEFAULT_ROW_GROUP_SIZE = 122_880
+
+
+def dataset_dir(kind_name):
+    """Return the dataset directory of a kind."""
+    return os.path.join(DATASETS_DIR, kind_name)
+
+
+def _ordered_columns(mapping, field):
+    keys = []
+    for rec in mapping:
+        order_val = rec.get(field)
+        try:
+            if order_val is not None and str(order_val).strip() != '':
+                orig = rec.get('original_name')
+                keys.append((int(order_val), rec.get('canonical_name', orig)))
+        except Exception:
+            continue
+    return [name for _, name in sorted(keys)]
+
+
+def partition_keys(mapping):
+    """Canonical columns used as hive partition keys, in partition order.
+
+    A column is a partition key if its mapping record has a numeric
+    `partition_order`; blanks are ignored, like filter_display_order.
+    """
+    return _ordered_columns(mapping, 'partition_order')
+
+
+def key_columns(mapping):
+    """Canonical columns identifying a row (e.g. period, store, UPC), in key order.
+
+    A column is part of the row key if its mapping record has a numeric
+    `key_order`. Upserts replace existing rows with the same key.
+    """
+    return _ordered_columns(mapping, 'key_order')
+
+
+def load_manifest(kind_name):
+    """Load a kind's dataset manifest, or None if it has never been written."""
+    path = os.path.join(dataset_dir(kind_name), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as fh:
+        return json.load(fh)
+
+
+def _legacy_manifest(kind_name):
+    """Manifest of a dataset written before manifests existed, or None.
+
+    Such a dataset is a single latest.parquet; describing it as version 0
+    lets upserts merge into it instead of treating the dataset as empty.
+    """
+    import pyarrow.parquet as pq
+
+    path = os.path.join(dataset_dir(kind_name), SINGLE_FILE_NAME)
+    if not os.path.exists(path):
+        return None
+    return {'version': 0, 'layout': 'single', 'partition_keys': [], 'hive_types': {},
+            'rows': pq.ParquetFile(path).metadata.num_rows, 'files': [SINGLE_FILE_NAME], 'history': []}
+
+
+def _save_manifest(kind_name, manifest):
+    path = os.path.join(dataset_dir(kind_name), MANIFEST_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fh:
+        json.dump(manifest, fh, indent=2)
+    os.replace(tmp_path, path)
+
+
+def dataset_version(kind_name):
+    """Current dataset version of a kind (0 when no manifest exists)."""
+    manifest = load_manifest(kind_name)
+    return manifest['version'] if manifest else 0
+
+
+def find_onboarding(kind_name, source_hash, mode):
+    """Version that already holds this exact input, if re-onboarding it would change nothing.
+
+    Replace and upsert are no-ops when the latest version was made from the
+    same input (see ingest.content_hash) in the same mode. An append is a
+    no-op when the input was already added since the last replace.
+
+    Returns:
+        int: the matching dataset version, or None.
+    """
+    manifest = load_manifest(kind_name)
+    if not manifest or not source_hash:
+        return None
+    history = manifest.get('history', [])
+    if mode == 'append':
+        for entry in reversed(history):
+            if entry.get('source_hash') == source_hash:
+                return entry['version']
+            if entry.get('mode') == 'replace':
+                break
+        return None
+    last = history[-1] if history else {}
+    if last.get('source_hash') == source_hash and last.get('mode') == mode:
+        return last['version']
+    return None
+
+
+def _sql_str(value):
+    return "'" + str(value).replace('\\', '/').replace("'", "''") + "'"
+
+
+def _ident(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _parquet_scan(paths, hive_types=None):
+    """read_parquet call over explicit files, decoding hive keys with their types."""
+    file_list = '[' + ', '.join(_sql_str(p) for p in paths) + ']'
+    from_sql = f"read_parquet({file_list}, hive_partitioning=true, union_by_name=true"
+    types = ', '.join(f"{_sql_str(k)}: {t}" for k, t in (hive_types or {}).items())
+    if types:
+        from_sql += f", hive_types={{{types}}}"
+    return from_sql + ")"
+
+
+def scan_source(kind_name):
+    """Describe how DuckDB should scan a kind's dataset.
+
+    Partitioned datasets are read from the explicit file list in the manifest
+    with hive partitioning, so filters on partition keys prune whole files and
+    files of an uncommitted onboarding are never visible.
+
+    Returns:
+        tuple: (from_sql, fingerprint_path) where from_sql is a table function
+        call usable in a FROM clause and fingerprint_path is the file whose
+        change means the dataset changed.
+
+    Raises:
+        FileNotFoundError: if the kind has no dataset.
+    """
+    base = dataset_dir(kind_name)
+    manifest = load_manifest(kind_name)
+    if manifest and manifest.get('layout') == 'partitioned':
+        files = [os.path.join(base, f) for f in manifest['files']]
+        if not files:
+            raise FileNotFoundError(f"Dataset for kind '{kind_name}' has no files: {base}")
+        return _parquet_scan(files, manifest.get('hive_types')), os.path.join(base, MANIFEST_NAME)
+
+    parquet_path = os.path.join(base, SINGLE_FILE_NAME)
+    if not os.path.exists(parquet_path):
+        raise FileNotFoundError(f"Parquet file not found for kind '{kind_name}': {parquet_path}")
+    return f"read_parquet({_sql_str(parquet_path)})", parquet_path
+
+
+def file_scan(kind_name, rel_path, manifest=None):
+    """read_parquet call over one live file of a kind, partition keys included."""
+    manifest = manifest or load_manifest(kind_name) or {}
+    path = os.path.join(dataset_dir(kind_name), rel_path)
+    if manifest.get('layout') == 'partitioned':
+        return _parquet_scan([path], manifest.get('hive_types'))
+    return f"read_parquet({_sql_str(path)})"
+
+
+def _duckdb_type(arrow_type):
+    """DuckDB type name for a partition column so hive values keep their type."""
+    import pyarrow as pa
+
+    if pa.types.is_boolean(arrow_type):
+        return 'BOOLEAN'
+    if pa.types.is_integer(arrow_type):
+        return 'BIGINT'
+    if pa.types.is_floating(arrow_type):
+        return 'DOUBLE'
+    if pa.types.is_date(arrow_type):
+        return 'DATE'
+    if pa.types.is_timestamp(arrow_type):
+        return 'TIMESTAMP'
+    if pa.types.is_dictionary(arrow_type):
+        return _duckdb_type(arrow_type.value_type)
+    return 'VARCHAR'
+
+
+def _partition_dir(keys, values):
+    parts = []
+    for key, value in zip(keys, values):
+        encoded = HIVE_NULL if value is None else quote(str(value), safe='')
+        parts.append(f"{quote(key, safe='')}={encoded}")
+    return '/'.join(parts)
+
+
+def _prune_empty_dirs(path, stop):
+    """Remove empty partition directories from path up to (excluding) stop."""
+    stop = os.path.abspath(stop)
+    path = os.path.abspath(path)
+    while path != stop and path.startswith(stop) and not os.listdir(path):
+        os.rmdir(path)
+        path = os.path.dirname(path)
+
+
+class DatasetWriter:
+    """Write one onboarding of a kind as a new dataset version.
+
+    Kinds whose mapping declares partition keys are stored as hive-partitioned
+    parquet under `parts/`, one file per partition per version. With
+    mode='append' the new files are added to the live set, so appending a week
+    only writes that week. With mode='replace' the previous files are removed
+    once the new version is committed. Kinds without partition keys keep the
+    single `latest.parquet` file and only support replace and upsert.
+
+    With mode='upsert' the written rows are staged, and commit() merges them
+    into the live files by the mapping's key columns (key_order): existing
+    rows with a key present in the upload are replaced, the rest kept, and
+    only the partitions the upload touches are rewritten.
+
+    Each written table is sorted by `sort_by` first, and files carry column
+    statistics and page indexes, so min/max pruning skips row groups.
+
+    Nothing becomes visible to queries until commit() rewrites the manifest.
+    """
+
+    def __init__(self, kind_name, mapping, mode='replace', compression='zstd',
+                 row_group_size=DEFAULT_ROW_GROUP_SIZE, sort_by=None):
+        if mode not in ('replace', 'append', 'upsert'):
+            raise ValueError(f"Unknown onboarding mode: {mode}")
+        self.kind_name = kind_name
+        self.mode = mode
+        self.compression = compression
+        self.row_group_size = row_group_size
+        self.keys = partition_keys(mapping)
+        self.key_columns = key_columns(mapping)
+        self.sort_by = [k for k in (sort_by or []) if k not in self.keys]
+        self.base = dataset_dir(kind_name)
+        self.previous = load_manifest(kind_name) or _legacy_manifest(kind_name)
+        self.version = (self.previous['version'] if self.previous else 0) + 1
+        self.layout = 'partitioned' if self.keys else 'single'
+        self.hive_types = {}
+        # Outcome of an upsert: rows inserted/updated and files rewritten
+        self.stats = {}
+        self._key_types = {}
+        self._writers = {}
+        self._staged = {}
+        self._files = []
+
+        if mode == 'append' and self.layout != 'partitioned':
+            raise ValueError('Append requires partition keys (partition_order) in the mapping.')
+        if mode == 'upsert':
+            if not self.key_columns:
+                raise ValueError('Upsert requires key columns (key_order) in the mapping.')
+            if not set(self.keys) <= set(self.key_columns):
+                raise ValueError('Upsert requires every partition key to be a key column (key_order) too.')
+        if mode != 'replace' and self.previous and not self.previous['version'] and self.layout == 'partitioned':
+            # Its rows would have to be listed among the partition files
+            raise ValueError('The dataset was saved before partitioning (it has no manifest.json); '
+                             'onboard it with replace first.')
+        if mode != 'replace' and self.previous and self.previous.get('partition_keys') != self.keys:
+            raise ValueError('Partition keys changed since the last onboarding; use replace instead.')
+        os.makedirs(self.base, exist_ok=True)
+
+    def _open(self, rel_path, schema):
+        import pyarrow.parquet as pq
+
+        path = os.path.join(self.base, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._files.append(rel_path)
+        return pq.ParquetWriter(path, schema, compression=self.compression, write_statistics=True,
+                                write_page_index=True)
+
+    def _target(self, values):
+        """Relative path of this version's file for a partition (or the single file)."""
+        if self.layout == 'single':
+            return SINGLE_FILE_NAME + '.tmp'
+        return f"{PARTS_DIR_NAME}/{_partition_dir(self.keys, values)}/part-v{self.version:06d}.parquet"
+
+    def _write_part(self, values, table):
+        writer = self._writers.get(values)
+        if writer is None:
+            if self.mode == 'upsert':
+                # Staged in upload order, so the last row of a duplicated key wins
+                rel_path = f"{STAGING_DIR_NAME}/{_partition_dir(self.keys, values) or 'all'}/delta.parquet"
+                self._staged[values] = rel_path
+            else:
+                rel_path = self._target(values)
+            writer = self._writers[values] = self._open(rel_path, table.schema)
+        else:
+            table = table.cast(writer.schema)
+        writer.write_table(table, row_group_size=self.row_group_size)
+
+    def write(self, table):
+        """Append a pyarrow Table (canonical column names) to this version."""
+        import pyarrow.compute as pc
+        from insight_agent.column_types import sort_table
+
+        if self.mode != 'upsert':
+            table = sort_table(table, self.sort_by)
+        if self.layout == 'single':
+            self._write_part((), table)
+            return
+
+        if not self.hive_types:
+            self.hive_types = {k: _duckdb_type(table.schema.field(k).type) for k in self.keys}
+            self._key_types = {k: table.schema.field(k).type for k in self.keys}
+        combos = table.select(self.keys).group_by(self.keys).aggregate([]).to_pylist()
+        for combo in combos:
+            values = tuple(combo[k] for k in self.keys)
+            mask = None
+            for key, value in zip(self.keys, values):
+                cond = pc.is_null(table[key]) if value is None else pc.equal(table[key], value)
+                mask = cond if mask is None else pc.and_(mask, cond)
+            self._write_part(values, table.filter(mask).drop_columns(self.keys))
+
+    def _close_writers(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+    def _merge_part(self, con, values, staged, old_files, on_file):
+        """Merge one staged partition into its live files; returns (rows written, old rows, delta rows).
+
+        Old rows whose key appears in the upload are dropped with an anti-join,
+        the (deduplicated) upload is added, and the result is written sorted.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        from insight_agent.query_result import _reader
+
+        staged_path = os.path.join(self.base, staged)
+        schema = pq.read_schema(staged_path)
+        keys = [k for k in self.key_columns if k not in self.keys]
+        latest_first = 'ORDER BY file_row_number DESC'
+        if keys:
+            latest_first = 'PARTITION BY ' + ', '.join(_ident(k) for k in keys) + ' ' + latest_first
+        delta = (f"SELECT * EXCLUDE (file_row_number) FROM read_parquet({_sql_str(staged_path)}, "
+                 f"file_row_number=true) QUALIFY row_number() OVER ({latest_first}) = 1")
+        merged = 'SELECT * FROM delta'
+        # Without key columns beyond the partition keys, the upload replaces the whole partition
+        if old_files and keys:
+            old_list = '[' + ', '.join(_sql_str(os.path.join(self.base, f)) for f in old_files) + ']'
+            on = ' AND '.join(f"old.{_ident(k)} IS NOT DISTINCT FROM delta.{_ident(k)}" for k in keys)
+            merged = (f"SELECT old.* FROM read_parquet({old_list}, union_by_name=true) AS old "
+                      f"ANTI JOIN delta ON {on} UNION ALL BY NAME " + merged)
+        order = ' ORDER BY ' + ', '.join(_ident(k) for k in self.sort_by if k in schema.names)
+        sql = f"WITH delta AS ({delta}) SELECT * FROM ({merged})"
+        if order != ' ORDER BY ':
+            sql += order
+
+        rel_path = self._target(values)
+        live_path = SINGLE_FILE_NAME if self.layout == 'single' else rel_path
+        writer = self._open(rel_path, schema)
+        written = 0
+        try:
+            for batch in _reader(con, sql, None, self.row_group_size):
+                table = pa.Table.from_batches([batch]).select(schema.names).cast(schema)
+                writer.write_table(table, row_group_size=self.row_group_size)
+                written += table.num_rows
+                if on_file is not None:
+                    for key, value in zip(self.keys, values):
+                        table = table.append_column(key, pa.array([value] * table.num_rows, type=self._key_types[key]))
+                    on_file(live_path, table)
+        finally:
+            writer.close()
+        old_rows = sum(pq.ParquetFile(os.path.join(self.base, f)).metadata.num_rows for f in old_files)
+        delta_rows = con.execute(f"WITH delta AS ({delta}) SELECT count(*) FROM delta").fetchone()[0]
+        return written, old_rows, delta_rows
+
+    def _merge(self, on_file):
+        """Merge every staged partition; returns (live files, total rows)."""
+        import duckdb
+
+        previous_files = list(self.previous.get('files', [])) if self.previous else []
+        if self.layout == 'single':
+            previous_files = [f for f in previous_files if f == SINGLE_FILE_NAME
+                              and os.path.exists(os.path.join(self.base, f))]
+        total_rows = self.previous.get('rows', 0) if self.previous else 0
+        replaced, added = set(), []
+        inserted = updated = 0
+        con = duckdb.connect()
+        try:
+            for values, staged in sorted(self._staged.items(), key=lambda item: item[1]):
+                if self.layout == 'single':
+                    old_files = previous_files
+                else:
+                    prefix = f"{PARTS_DIR_NAME}/{_partition_dir(self.keys, values)}/"
+                    old_files = [f for f in previous_files if f.startswith(prefix)]
+                written, old_rows, delta_rows = self._merge_part(con, values, staged, old_files, on_file)
+                replaced.update(old_files)
+                added.append(SINGLE_FILE_NAME if self.layout == 'single' else self._target(values))
+                total_rows += written - old_rows
+                updated += old_rows + delta_rows - written
+                inserted += written - old_rows
+        finally:
+            con.close()
+        self.stats = {'inserted': inserted, 'updated': updated, 'files_rewritten': len(added),
+                      'files_total': len([f for f in previous_files if f not in replaced]) + len(added)}
+        if self.layout == 'single':
+            return [SINGLE_FILE_NAME], total_rows
+        return [f for f in previous_files if f not in replaced] + added, total_rows
+
+    def commit(self, rows, source_hash=None, on_file=None):
+        """Publish the written files as the kind's current dataset version.
+
+        Args:
+            rows (int): rows written in this version.
+            source_hash (str): content hash of the input (see
+                ingest.content_hash), recorded so the same input can be
+                recognised later (see find_onboarding).
+            on_file (callable): upsert only; called as on_file(rel_path, table)
+                for each Arrow table written to a rewritten file, partition
+                keys included, e.g. to profile it.
+
+        Returns:
+            int: the committed version number.
+        """
+        self._close_writers()
+        previous_rows = self.previous.get('rows', 0) if self.previous else 0
+        if self.mode == 'upsert':
+            files, total_rows = self._merge(on_file)
+        elif self.mode == 'append' and self.previous:
+            files, total_rows = list(self.previous.get('files', [])) + self._files, previous_rows + rows
+        else:
+            files, total_rows = list(self._files), rows
+        if self.layout == 'single':
+            tmp_path = os.path.join(self.base, SINGLE_FILE_NAME + '.tmp')
+            if os.path.exists(tmp_path):
+                os.replace(tmp_path, os.path.join(self.base, SINGLE_FILE_NAME))
+            files = [SINGLE_FILE_NAME]
+
+        history = list(self.previous.get('history', [])) if self.previous else []
+        entry = {
+            'version': self.version,
+            'mode': self.mode,
+            'rows': rows,
+            'files_added': len([f for f in self._files if not f.startswith(STAGING_DIR_NAME + '/')]),
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        }
+        if source_hash:
+            entry['source_hash'] = source_hash
+        entry.update(self.stats)
+        history.append(entry)
+        manifest = {
+            'version': self.version,
+            'layout': self.layout,
+            'partition_keys': self.keys,
+            'hive_types': self.hive_types or (self.previous or {}).get('hive_types', {}),
+            'rows': total_rows,
+            'files': files,
+            'history': history,
+        }
+        _save_manifest(self.kind_name, manifest)
+
+        # Files that are no longer part of the live set can go now, with their
+        # profile states; so can the stale state of a rewritten single file.
+        if self.previous:
+            for rel_path in set(self.previous.get('files', [])) - set(files):
+                path = os.path.join(self.base, rel_path)
+                if os.path.exists(path + PROFILE_STATE_SUFFIX):
+                    os.remove(path + PROFILE_STATE_SUFFIX)
+                if os.path.exists(path):
+                    os.remove(path)
+                    _prune_empty_dirs(os.path.dirname(path), self.base)
+        if self.layout == 'single':
+            state_path = os.path.join(self.base, SINGLE_FILE_NAME + PROFILE_STATE_SUFFIX)
+            if os.path.exists(state_path):
+                os.remove(state_path)
+            shutil.rmtree(os.path.join(self.base, PARTS_DIR_NAME), ignore_errors=True)
+        shutil.rmtree(os.path.join(self.base, STAGING_DIR_NAME), ignore_errors=True)
+        return self.version
+
+    def abort(self):
+        """Discard everything written by this version."""
+        self._close_writers()
+        for rel_path in self._files:
+            path = os.path.join(self.base, rel_path)
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.rmtree(os.path.join(self.base, STAGING_DIR_NAME), ignore_errors=True)
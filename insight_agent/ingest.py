@@ -0,0 +1,201 @@
+import os
+
+
+# Rows per chunk when streaming an instance file. Large enough to amortise
+# per-chunk overhead, small enough to keep memory flat for multi-GB files.
+DEFAULT_CHUNKSIZE = 100_000
+# Bytes read at a time when hashing an input file.
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_name(file_obj):
+    """Return the name of an uploaded file or path."""
+    if isinstance(file_obj, (str, os.PathLike)):
+        return os.fspath(file_obj)
+    name = getattr(file_obj, 'name', '')
+    return name if isinstance(name, str) else ''
+
+
+def is_excel(file_obj):
+    """True when the file name carries an Excel extension."""
+    return file_name(file_obj).lower().endswith(('.xls', '.xlsx'))
+
+
+def rewind(file_obj):
+    """Reset a file-like object to its start; paths are left untouched."""
+    if isinstance(file_obj, (str, os.PathLike)):
+        return
+    try:
+        file_obj.seek(0)
+    except Exception:
+        pass
+
+
+def file_size(file_obj):
+    """Best-effort size in bytes of an uploaded file or path, else None."""
+    if isinstance(file_obj, (str, os.PathLike)):
+        return os.path.getsize(file_obj)
+    size = getattr(file_obj, 'size', None)
+    if isinstance(size, int):
+        return size
+    try:
+        pos = file_obj.tell()
+        file_obj.seek(0, os.SEEK_END)
+        size = file_obj.tell()
+        file_obj.seek(pos)
+        return size
+    except Exception:
+        return None
+
+
+def content_hash(file_obj, salt='', block_size=HASH_BLOCK_SIZE):
+    """SHA-256 of a file's bytes (and `salt`), read in blocks; the file is rewound after.
+
+    Args:
+        file_obj: path or file-like object.
+        salt (str): extra text hashed first, e.g. the mapping the file is
+            onboarded with, so the same file under a changed mapping differs.
+        block_size (int): bytes read at a time.
+
+    Returns:
+        str: hex digest, or None if the file cannot be read.
+    """
+    import hashlib
+
+    digest = hashlib.sha256(salt.encode('utf-8'))
+    try:
+        if isinstance(file_obj, (str, os.PathLike)):
+            with open(file_obj, 'rb') as fh:
+                for block in iter(lambda: fh.read(block_size), b''):
+                    digest.update(block)
+        else:
+            rewind(file_obj)
+            while True:
+                block = file_obj.read(block_size)
+                if not block:
+                    break
+                digest.update(block.encode('utf-8') if isinstance(block, str) else block)
+            rewind(file_obj)
+    except Exception:
+        return None
+    return digest.hexdigest()
+
+
+def file_position(file_obj):
+    """Current read offset of a file-like object, else None."""
+    try:
+        return file_obj.tell()
+    except Exception:
+        return None
+
+
+def read_header(file_obj, sheet=None, header_row=0):
+    """Column names of a CSV or Excel file, reading nothing past its header row.
+
+    Lets a wrong file be rejected in milliseconds, before any data is parsed.
+
+    Args:
+        file_obj: path or file-like object.
+        sheet: Excel sheet name or 0-based index; the first sheet by default.
+        header_row (int): 0-based row holding the column names.
+
+    Returns:
+        list: the column names, deduplicated like pandas does.
+    """
+    rewind(file_obj)
+    try:
+        if is_excel(file_obj):
+            from insight_agent import workbook
+
+            return workbook.read_header(file_obj, sheet, header_row)
+        import pandas as pd
+
+        return list(pd.read_csv(file_obj, nrows=0, header=header_row).columns)
+    finally:
+        rewind(file_obj)
+
+
+def read_sample(file_obj, rows, sheet=None, header_row=0):
+    """The first `rows` data rows of a CSV or Excel file as a DataFrame.
+
+    Only the sample is parsed; workbooks are read with the engine that stops
+    early and are not spilled.
+    """
+    import pandas as pd
+
+    rewind(file_obj)
+    try:
+        if is_excel(file_obj):
+            from insight_agent import workbook
+
+            batches = workbook.iter_batches(file_obj, sheet, header_row, batch_rows=rows, streaming=True)
+            try:
+                return workbook.to_frame(next(batches))
+            finally:
+                batches.close()
+        return pd.read_csv(file_obj, nrows=rows, header=header_row)
+    finally:
+        rewind(file_obj)
+
+
+def read_frame(file_obj, sheet=None, header_row=0):
+    """Read a whole CSV or Excel file (a mapping workbook, a sample) into a DataFrame.
+
+    Workbooks are parsed once through the Parquet spill (see workbook.spill).
+
+    Args:
+        file_obj: path or file-like object.
+        sheet: Excel sheet name or 0-based index; the first sheet by default.
+        header_row (int): 0-based row holding the column names.
+    """
+    import pandas as pd
+
+    rewind(file_obj)
+    if is_excel(file_obj):
+        import pyarrow.parquet as pq
+        from insight_agent import workbook
+
+        return workbook.to_frame(pq.read_table(workbook.spill(file_obj, sheet, header_row)))
+    return pd.read_csv(file_obj, header=header_row)
+
+
+def iter_chunks(file_obj, chunksize=DEFAULT_CHUNKSIZE, sheet=None, header_row=0):
+    """Yield DataFrame chunks of an instance file with a consistent schema.
+
+    CSV files are streamed with pandas' chunked reader, every column as
+    text. Excel workbooks are streamed once into a Parquet
+    spill (see workbook.spill) and read back in chunks.
+
+    Args:
+        file_obj: path or file-like object (e.g. a Streamlit UploadedFile).
+        chunksize (int): rows per chunk.
+        sheet: Excel sheet name or 0-based index; the first sheet by default.
+        header_row (int): 0-based row holding the column names; rows above
+            it are skipped.
+
+    Yields:
+        pandas.DataFrame: consecutive chunks; a header-only file yields one
+        empty frame so callers can still validate its columns.
+    """
+    import pandas as pd
+
+    rewind(file_obj)
+    if is_excel(file_obj):
+        import pyarrow.parquet as pq
+        from insight_agent import workbook
+
+        parquet = pq.ParquetFile(workbook.spill(file_obj, sheet, header_row))
+        if parquet.metadata.num_rows == 0:
+            yield workbook.to_frame(parquet.schema_arrow.empty_table())
+            return
+        for batch in parquet.iter_batches(batch_size=chunksize):
+            yield workbook.to_frame(batch)
+        return
+
+    # Every column is read as text; column_types.TableCaster types it, so a
+    # later chunk that disagrees with the first is coerced and counted
+    # rather than failing the read.
+    reader = pd.read_csv(file_obj, chunksize=chunksize, dtype=str, header=header_row)
+    with reader:
+        for chunk in reader:
+            yield chunk
@@ -1,104 +1,338 @@
-def onboard_instance(kind_name, instance_file):
+from insight_agent.ingest import DEFAULT_CHUNKSIZE
+
+
+def _merge_file_profiles(kind_name, fresh, filterable):
+    """Profile of a kind's live files, merged from per-file sketch states.
+
+    Files rewritten by this onboarding come profiled in `fresh`; the others
+    reuse the state saved next to them (dataset_store.PROFILE_STATE_SUFFIX).
+    A file without one, written by a replace or append, is profiled once from
+    disk and its state saved, so later upserts only profile what they rewrite.
+
+    Args:
+        kind_name (str): kind whose manifest lists the live files.
+        fresh (dict): relative file path -> DatasetProfiler of rewritten files.
+        filterable (dict): see profiler.filterable_columns.
+
+    Returns:
+        DatasetProfiler: the profile of the whole dataset.
+    """
+    import os
+    import json
+    import pyarrow as pa
+    from insight_agent.dataset_store import load_manifest, dataset_dir, file_scan, PROFILE_STATE_SUFFIX
+    from insight_agent.profiler import DatasetProfiler, arrow_frame
+    from insight_agent.query_result import _reader
+
+    manifest = load_manifest(kind_name) or {}
+    merged = DatasetProfiler(filterable)
+    con = None
+    try:
+        for rel_path in manifest.get('files', []):
+            state_path = os.path.join(dataset_dir(kind_name), rel_path) + PROFILE_STATE_SUFFIX
+            file_profiler = fresh.get(rel_path)
+            if file_profiler is None and os.path.exists(state_path):
+                with open(state_path, 'r') as sf:
+                    merged.merge(DatasetProfiler.from_state(json.load(sf)))
+                continue
+            if file_profiler is None:
+                import duckdb
+
+                con = con or duckdb.connect()
+                file_profiler = DatasetProfiler(filterable)
+                for batch in _reader(con, f"SELECT * FROM {file_scan(kind_name, rel_path, manifest)}", None,
+                                     DEFAULT_CHUNKSIZE):
+                    file_profiler.update(arrow_frame(pa.Table.from_batches([batch])))
+            # Saved before merging: merge() adopts the column sketches it is given
+            with open(state_path, 'w') as sf:
+                json.dump(file_profiler.to_state(), sf)
+            merged.merge(file_profiler)
+    finally:
+        if con is not None:
+            con.close()
+    return merged
+
+
+# Rows parsed by preview_instance to check values against the mapping's data_type.
+PREVIEW_ROWS = 10_000
+
+
+def _load_mapping(kind_name):
+    """The kind's effective mapping records, or an error message: (mapping, error)."""
+    import os
+    from insight_agent.catalog import get_catalog
+
+    # The latest version, as build_prompt and validate_filters use
+    entry = get_catalog().get(kind_name)
+    if not os.path.exists(os.path.join(entry.kind_dir, 'mapping_effective.json')):
+        return None, f"Error: Effective mapping not found for kind '{kind_name}'."
+    if not entry.columns:
+        return None, "Error reading effective mapping: no column records found."
+    return entry.mapping, None
+
+
+def _column_mismatch(mapping, actual):
+    """Error message when a file's columns differ from the mapping's, else None."""
+    expected = [rec.get('original_name') for rec in mapping if 'original_name' in rec]
+    if set(expected) == set(actual):
+        return None
+    missing = [c for c in expected if c not in actual]
+    extra = [c for c in actual if c not in expected]
+    return f"Error: Instance columns do not match. Missing: {missing}. Extra: {extra}."
+
+
+def check_header(kind_name, instance_file, sheet=None, header_row=0):
+    """Compare a file's header with the kind's mapping, reading nothing else.
+
+    Takes milliseconds whatever the file's size, so a wrong upload can be
+    rejected before an onboarding job is queued.
+
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    from insight_agent import ingest
+
+    mapping, error = _load_mapping(kind_name)
+    if error:
+        return False, error
+    try:
+        columns = ingest.read_header(instance_file, sheet, header_row)
+    except Exception as exc:
+        return False, f"Error reading instance file: {exc}"
+    error = _column_mismatch(mapping, columns)
+    if error:
+        return False, error
+    return True, f"Columns match the mapping ({len(columns)} columns)."
+
+
+def preview_instance(kind_name, instance_file, sample_rows=PREVIEW_ROWS, sheet=None, header_row=0):
+    """Dry run of onboard_instance: check a file without loading or writing it.
+
+    The header is compared with the mapping first; if it matches, the first
+    `sample_rows` rows are parsed and every mapped column is converted to
+    its data_type the way onboarding would, counting the values that fail.
+    Nothing is written.
+
+    Args:
+        kind_name (str): kind whose mapping the file must match.
+        instance_file: path or file-like object.
+        sample_rows (int): rows parsed for the type check.
+        sheet: Excel sheet name or 0-based index; the first sheet by default.
+        header_row (int): 0-based row holding the column names.
+
+    Returns:
+        tuple: (success: bool, message: str, report: list) where success is
+        False only when the file cannot be onboarded (unreadable, wrong
+        columns), and report holds one dict per mapped column: column,
+        canonical_name, data_type, stored_as, checked, failed, error_rate
+        and examples of failing values.
+    """
+    from insight_agent import ingest
+    from insight_agent.column_types import TableCaster
+
+    ok, message = check_header(kind_name, instance_file, sheet, header_row)
+    if not ok:
+        return False, message, []
+    mapping, _ = _load_mapping(kind_name)
+    try:
+        sample = ingest.read_sample(instance_file, sample_rows, sheet, header_row)
+    except Exception as exc:
+        return False, f"Error reading instance file: {exc}", []
+
+    rename = {rec['original_name']: rec.get('canonical_name') or rec['original_name']
+              for rec in mapping if rec.get('original_name')}
+    checks = TableCaster(mapping).check_frame(sample.rename(columns=rename))
+    report = []
+    for rec in mapping:
+        orig = rec.get('original_name')
+        check = checks.get(rename.get(orig))
+        if not orig or check is None:
+            continue
+        report.append({
+            'column': orig,
+            'canonical_name': rename[orig],
+            'data_type': rec.get('data_type', ''),
+            'stored_as': check['kind'],
+            'checked': check['checked'],
+            'failed': check['failed'],
+            'error_rate': round(check['failed'] / check['checked'], 4) if check['checked'] else 0.0,
+            'examples': check['examples'],
+        })
+    failing = [r['column'] for r in report if r['failed']]
+    message = f"Columns match the mapping. Checked {len(sample):,} sample rows"
+    if failing:
+        message += (f": values in {len(failing)} column(s) do not fit their data_type and would be stored "
+                    f"as empty ({', '.join(failing)}).")
+    else:
+        message += '; every value fits its data_type.'
+    return True, message, report
+
+
+def onboard_instance(kind_name, instance_file, progress_callback=None, chunksize=DEFAULT_CHUNKSIZE,
+                     mode='replace', sheet=None, header_row=0):
     """Validate an instance file against the kind's effective mapping.
 
+    The file's header is checked against the mapping before any data is
+    read (see preview_instance for a dry run that also checks values). The
+    file is then streamed in chunks: each chunk is renamed to canonical names and written
+    as a new dataset version (see dataset_store.DatasetWriter), and column
+    statistics are accumulated in the same pass by a fixed-memory profiler.
+    Memory stays bounded by the chunk size. A file identical to the one that
+    made the current dataset version (same bytes and mapping, see
+    dataset_store.find_onboarding) is not parsed at all.
+
     Args:
         kind_name (str): The name of the kind to validate against.
         instance_file: file-like object for the instance data.
+        progress_callback (callable): optional, called after each chunk as
+            progress_callback(rows_written, fraction) where fraction is the
+            share of the input consumed (0..1) or None when unknown.
+        chunksize (int): rows per streamed chunk.
+        mode (str): 'replace' to overwrite the dataset, 'append' to add the
+            file to a kind partitioned via `partition_order` in its mapping, or
+            'upsert' to merge it into the dataset by the mapping's key columns
+            (`key_order`), replacing rows with the same key. Only partitions
+            the file touches are rewritten and re-profiled.
+        sheet: Excel sheet name or 0-based index; the first sheet by default.
+        header_row (int): 0-based row holding the column names.
 
     Returns:
         tuple: (success: bool, message: str)
     """
     import os
-    import pandas as pd
     import json
+    import itertools
+    from insight_agent import ingest
+    from insight_agent.dataset_store import DatasetWriter, find_onboarding
+    from insight_agent.column_types import TableCaster, sort_keys
+    from insight_agent.rollups import build_rollups
+    from insight_agent.sampling import build_sample
+    from insight_agent.profiler import DatasetProfiler, arrow_frame, filterable_columns
+    from insight_agent.catalog import get_catalog
 
-    base_dir = os.path.join('domain', 'catalog', 'kinds', kind_name, 'v1')
-    effective_path = os.path.join(base_dir, 'mapping_effective.json')
-    if not os.path.exists(effective_path):
-        return False, f"Error: Effective mapping not found for kind '{kind_name}'."
+    catalog = get_catalog()
+    # Check the header before anything else is read, so a wrong file fails fast
+    ok, message = check_header(kind_name, instance_file, sheet, header_row)
+    if not ok:
+        return False, message
+    mapping, _ = _load_mapping(kind_name)
 
-    try:
-        with open(effective_path, 'r') as ef:
-            mapping = json.load(ef)
-    except Exception as exc:
-        return False, f"Error reading effective mapping: {exc}"
+    # Skip re-onboarding an unchanged file before parsing any of it
+    source_hash = ingest.content_hash(instance_file, salt=json.dumps([mapping, sheet, header_row], sort_keys=True))
+    done_version = find_onboarding(kind_name, source_hash, mode)
+    if done_version:
+        if progress_callback is not None:
+            progress_callback(0, 1.0)
+        return True, (f"No changes: this file was already onboarded for '{kind_name}' "
+                      f"(dataset version {done_version}); nothing was rewritten.")
 
     try:
-        name = getattr(instance_file, 'name', '')
-        if isinstance(name, str) and name.lower().endswith(('.xls', '.xlsx')):
-            df = pd.read_excel(instance_file)
-        else:
-            try:
-                instance_file.seek(0)
-            except Exception:
-                pass
-            df = pd.read_csv(instance_file)
+        chunks = ingest.iter_chunks(instance_file, chunksize, sheet=sheet, header_row=header_row)
+        first = next(chunks)
     except Exception as exc:
         return False, f"Error reading instance file: {exc}"
 
-    # Extract expected columns from mapping
-    expected = [rec.get('original_name') for rec in mapping if 'original_name' in rec]
-    actual = list(df.columns)
+    # Rename columns from original_name -> canonical_name using mapping
+    rename = {}
+    for rec in mapping:
+        orig = rec.get('original_name')
+        canon = rec.get('canonical_name', orig)
+        if orig and canon and orig != canon:
+            rename[orig] = canon
 
-    if set(expected) == set(actual):
-        # Persist dataset to domain/catalog/datasets/<kind_name>/latest.parquet
-        datasets_dir = os.path.join('domain', 'catalog', 'datasets', kind_name)
-        os.makedirs(datasets_dir, exist_ok=True)
-        out_path = os.path.join(datasets_dir, 'latest.parquet')
+    datasets_dir = os.path.join('domain', 'catalog', 'datasets', kind_name)
+    state_path = os.path.join(datasets_dir, 'profile_state.json')
+    try:
+        writer = DatasetWriter(kind_name, mapping, mode=mode, sort_by=sort_keys(mapping))
+    except Exception as exc:
+        return False, f"Error: {exc}"
+    # Store columns in the compact types the mapping declares
+    caster = TableCaster(mapping, keep_plain=writer.keys)
+
+    # Profile every column; filterable ones (numeric filter_display_order)
+    # also get the values offered as filters on the Ask page. Appends merge
+    # into the sketches of the existing data instead of re-reading it; upserts
+    # profile the files they rewrite and merge them with the other files' states.
+    # An append without sketches (data profiled before they were saved) profiles
+    # the whole committed dataset like an upsert does.
+    filterable = filterable_columns(mapping)
+    profiler = DatasetProfiler(filterable)
+    per_file = mode == 'upsert'
+    if mode == 'append':
         try:
-            # Rename columns from original_name -> canonical_name using mapping
-            rename = {}
-            for rec in mapping:
-                orig = rec.get('original_name')
-                canon = rec.get('canonical_name', orig)
-                if orig and canon and orig != canon:
-                    rename[orig] = canon
+            with open(state_path, 'r') as sf:
+                profiler = DatasetProfiler.from_state(json.load(sf))
+            profiler.filterable = filterable
+        except Exception:
+            per_file = True
+    file_profilers = {}
+
+    def profile_file(rel_path, table):
+        file_profilers.setdefault(rel_path, DatasetProfiler(filterable)).update(arrow_frame(table))
+
+    total_bytes = ingest.file_size(instance_file)
+    rows_written = 0
+    try:
+        for chunk in itertools.chain([first], chunks):
             if rename:
-                df = df.rename(columns=rename)
+                chunk = chunk.rename(columns=rename)
+            chunk = caster.cast_frame(chunk)
+            writer.write(caster.to_arrow(chunk))
+            rows_written += len(chunk)
+            if not per_file:
+                profiler.update(chunk)
 
-            # Use parquet with zstd compression
-            df.to_parquet(out_path, compression='zstd', index=False)
-        except Exception as exc:
-            return False, f"Error saving instance file: {exc}"
+            if progress_callback is not None:
+                pos = ingest.file_position(instance_file)
+                fraction = min(pos / total_bytes, 1.0) if pos is not None and total_bytes else None
+                progress_callback(rows_written, fraction)
+        writer.commit(rows_written, source_hash=source_hash,
+                      on_file=profile_file if mode == 'upsert' else None)
+    except Exception as exc:
+        writer.abort()
+        return False, f"Error saving instance file: {exc}"
 
-        # Read back the parquet and generate a profile for filterable columns
-        try:
-            df_saved = pd.read_parquet(out_path)
-            # Identify filterable columns from mapping. A column is filterable if
-            # filter_display_order contains a number. Ignore blanks.
-            filterable_recs = []
-            for rec in mapping:
-                order_val = rec.get('filter_display_order')
-                try:
-                    if order_val is not None and str(order_val).strip() != '':
-                        # attempt to parse integer; if it fails, skip
-                        order_int = int(order_val)
-                        filterable_recs.append((rec, order_int))
-                except Exception:
-                    continue
-
-            profile = {}
-            for rec, order_int in filterable_recs:
-                orig = rec.get('original_name')
-                canon = rec.get('canonical_name', orig)
-                # profile should use the canonical column name (since saved parquet uses canonical names)
-                if canon in df_saved.columns:
-                    uniques = df_saved[canon].dropna().unique().tolist()
-                    # cap at 200
-                    values = uniques[:200]
-                    profile[canon] = {
-                        'values': values,
-                        'filter_display_order': order_int
-                    }
-
-            profile_path = os.path.join(datasets_dir, 'profile.json')
-            with open(profile_path, 'w') as pf:
-                json.dump(profile, pf, indent=2)
-        except Exception as exc:
-            return False, f"Error profiling instance data: {exc}"
-
-        return True, f"Success! Instance for '{kind_name}' has been saved and profiled."
-    else:
-        missing = [c for c in expected if c not in actual]
-        extra = [c for c in actual if c not in expected]
-        return False, f"Error: Instance columns do not match. Missing: {missing}. Extra: {extra}."
+    try:
+        if per_file:
+            profiler = _merge_file_profiles(kind_name, file_profilers, filterable)
+        profile = profiler.to_profile()
+        profile_path = os.path.join(datasets_dir, 'profile.json')
+        with open(profile_path, 'w') as pf:
+            json.dump(profile, pf, indent=2)
+        with open(state_path, 'w') as sf:
+            json.dump(profiler.to_state(), sf)
+    except Exception as exc:
+        return False, f"Error profiling instance data: {exc}"
+    finally:
+        catalog.invalidate(kind_name)
+
+    # Aggregate rollups over the mapping's rollup_order dimensions; queries
+    # use the raw data until (and unless) they exist for this version.
+    rollup_note = ''
+    try:
+        built = build_rollups(kind_name, mapping)
+        if built:
+            rollup_note = " Rollups built: " + ', '.join(f"{r['name']} ({r['rows']:,} rows)" for r in built) + "."
+    except Exception as exc:
+        rollup_note = f" Rollups could not be built ({exc}); queries read the full data."
+
+    # Stratified sample behind fast previews, over the filterable columns
+    try:
+        sample = build_sample(kind_name, mapping, profile)
+        if sample:
+            rollup_note += (f" Sample built: {sample['rows']:,} rows ({sample['rate']:.2%}), stratified by "
+                            f"{', '.join(sample['strata_columns']) or 'nothing'}.")
+    except Exception as exc:
+        rollup_note += f" Sample could not be built ({exc}); fast previews run the exact query."
+
+    if progress_callback is not None:
+        progress_callback(rows_written, 1.0)
+    message = f"Success! Instance for '{kind_name}' has been saved and profiled.{rollup_note}"
+    if writer.stats:
+        stats = writer.stats
+        message += (f" Upsert: {stats['inserted']:,} rows inserted, {stats['updated']:,} updated; "
+                    f"{stats['files_rewritten']} of {stats['files_total']} files rewritten.")
+    if caster.coerced:
+        details = ', '.join(f"{col}: {n}" for col, n in caster.coerced.items())
+        message += f" Values that did not match the mapping's data_type were stored as empty ({details})."
+    return True, message
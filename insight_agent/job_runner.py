@@ -0,0 +1,400 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Job table and the uploaded files each job reads, kept until the job succeeds.
+JOBS_DIR = os.path.join('domain', 'cache', 'jobs')
+JOBS_DB = os.path.join(JOBS_DIR, 'jobs.sqlite3')
+# Jobs executing at once, each in its own process; jobs of one kind run one at a time.
+DEFAULT_WORKERS = max(1, min(4, os.cpu_count() or 1))
+# Seconds between progress writes (and cancellation checks) of a running job.
+PROGRESS_INTERVAL = 0.5
+# Seconds the dispatcher sleeps when nothing wakes it.
+POLL_INTERVAL = 1.0
+# Whether each job gets a fresh worker process (max_tasks_per_child, Python 3.11+).
+FRESH_WORKERS = sys.version_info >= (3, 11)
+
+JOB_TYPES = ('create_kind', 'onboard_instance')
+ACTIVE_STATUSES = ('queued', 'running')
+
+_COLUMNS = [
+    ('id', 'TEXT PRIMARY KEY'), ('job_type', 'TEXT'), ('kind_name', 'TEXT'), ('params', 'TEXT'),
+    ('status', 'TEXT'), ('message', 'TEXT'), ('progress', 'REAL'), ('rows', 'INTEGER'),
+    ('created_at', 'REAL'), ('started_at', 'REAL'), ('finished_at', 'REAL'),
+    ('duration_s', 'REAL'), ('rows_per_s', 'REAL'), ('peak_memory_mb', 'REAL'),
+    ('attempts', 'INTEGER'), ('cancel_requested', 'INTEGER'), ('pid', 'INTEGER'),
+]
+
+
+class JobCancelled(RuntimeError):
+    """Raised inside a job's progress callback once a cancel was requested."""
+
+
+class JobStore:
+    """SQLite table of jobs shared by the app and the worker processes.
+
+    Every call opens a short-lived connection, so the store can be used from
+    any thread or process; WAL mode lets the page read while workers write.
+
+    Args:
+        path (str): SQLite database file.
+    """
+
+    def __init__(self, path=JOBS_DB):
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as con:
+            con.execute('PRAGMA journal_mode=WAL')
+            columns = ', '.join(f'{name} {decl}' for name, decl in _COLUMNS)
+            con.execute(f'CREATE TABLE IF NOT EXISTS jobs ({columns})')
+
+    @contextmanager
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=30)
+        con.row_factory = sqlite3.Row
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    @staticmethod
+    def _job(row):
+        job = dict(row)
+        job['params'] = json.loads(job['params'] or '{}')
+        return job
+
+    def create(self, job_type, kind_name, params, job_id=None):
+        """Insert a queued job and return its id."""
+        job_id = job_id or uuid.uuid4().hex
+        with self._connect() as con:
+            con.execute(
+                'INSERT INTO jobs (id, job_type, kind_name, params, status, message, progress, rows, '
+                'created_at, attempts, cancel_requested) VALUES (?, ?, ?, ?, ?, ?, 0, 0, ?, 1, 0)',
+                (job_id, job_type, kind_name, json.dumps(params), 'queued', '', time.time()))
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as con:
+            row = con.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def list(self, limit=100, statuses=None):
+        """Jobs newest first, optionally only those with the given statuses."""
+        sql, args = 'SELECT * FROM jobs', []
+        if statuses:
+            sql += f" WHERE status IN ({', '.join('?' for _ in statuses)})"
+            args.extend(statuses)
+        sql += ' ORDER BY created_at DESC LIMIT ?'
+        args.append(int(limit))
+        with self._connect() as con:
+            return [self._job(row) for row in con.execute(sql, args).fetchall()]
+
+    def update(self, job_id, when_status=None, **fields):
+        """Set fields of a job; with when_status, only if it is in one of those statuses.
+
+        Returns:
+            bool: True if the job was updated.
+        """
+        if 'params' in fields:
+            fields['params'] = json.dumps(fields['params'])
+        sql = f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?"
+        args = list(fields.values()) + [job_id]
+        if when_status:
+            sql += f" AND status IN ({', '.join('?' for _ in when_status)})"
+            args.extend(when_status)
+        with self._connect() as con:
+            return con.execute(sql, args).rowcount > 0
+
+    def cancel_requested(self, job_id):
+        with self._connect() as con:
+            row = con.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row and row[0])
+
+
+def _peak_memory_mb():
+    """Peak resident memory of this process in MB, or None where unavailable."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KiB elsewhere
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+class _Progress:
+    """Progress callback of a running job: throttled writes plus cancel checks."""
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+        self.rows = 0
+        self._last = 0.0
+
+    def __call__(self, rows, fraction=None):
+        self.rows = rows
+        now = time.monotonic()
+        # The final call comes after the data is committed; it is never cancelled
+        if fraction != 1.0 and now - self._last < PROGRESS_INTERVAL:
+            return
+        self._last = now
+        fields = {'rows': rows}
+        if fraction is not None:
+            fields['progress'] = fraction
+        self.store.update(self.job_id, **fields)
+        if fraction != 1.0 and self.store.cancel_requested(self.job_id):
+            raise JobCancelled('Job was cancelled.')
+
+
+def _call(job, progress):
+    """Run the job's function on the files saved for it."""
+    params = job['params']
+    files = params.get('files', {})
+    if job['job_type'] == 'create_kind':
+        from insight_agent.kind_manager import create_kind
+
+        with open(files['mapping_file'], 'rb') as mapping_file:
+            sample_path = files.get('sample_file')
+            sample_file = open(sample_path, 'rb') if sample_path else None
+            try:
+                return create_kind(mapping_file, job['kind_name'], sample_file,
+                                   params.get('kind_description', ''), sample_sheet=params.get('sheet'),
+                                   sample_header_row=params.get('header_row', 0), progress_callback=progress)
+            finally:
+                if sample_file is not None:
+                    sample_file.close()
+    if job['job_type'] == 'onboard_instance':
+        from insight_agent.instance_manager import onboard_instance
+
+        with open(files['instance_file'], 'rb') as instance_file:
+            return onboard_instance(job['kind_name'], instance_file, progress_callback=progress,
+                                    mode=params.get('mode', 'replace'), sheet=params.get('sheet'),
+                                    header_row=params.get('header_row', 0))
+    return False, f"Unknown job type '{job['job_type']}'."
+
+
+def _execute(job_id, db_path):
+    """Worker-process entry point: run one job and record its outcome."""
+    store = JobStore(db_path)
+    job = store.get(job_id)
+    if job is None or not store.update(job_id, when_status=('queued',), status='running',
+                                       started_at=time.time(), pid=os.getpid()):
+        return
+    started = time.monotonic()
+    peak_before = _peak_memory_mb()
+    progress = _Progress(store, job_id)
+    try:
+        success, message = _call(job, progress)
+    except JobCancelled as exc:
+        success, message = False, str(exc)
+    except Exception as exc:
+        success, message = False, f"Error: {exc}"
+    duration = time.monotonic() - started
+    peak = _peak_memory_mb()
+    if not FRESH_WORKERS and peak is not None and peak_before is not None and peak <= peak_before:
+        # A reused worker's high-water mark is this job's peak only if the job raised it
+        peak = None
+    if success:
+        status = 'succeeded'
+    elif store.cancel_requested(job_id):
+        status, message = 'cancelled', 'Job was cancelled.'
+    else:
+        status = 'failed'
+    store.update(job_id, status=status, message=message, finished_at=time.time(),
+                 duration_s=round(duration, 3), rows=progress.rows,
+                 rows_per_s=round(progress.rows / duration, 1) if progress.rows and duration else None,
+                 peak_memory_mb=peak, progress=1.0 if success else None)
+    if success:
+        # Uploads are only kept so failed or cancelled jobs can be retried
+        shutil.rmtree(os.path.join(os.path.dirname(store.path), job_id), ignore_errors=True)
+
+
+def _save_upload(file_obj, dest_dir):
+    """Copy an uploaded file into the job's directory and return its path.
+
+    Paths are used in place; file-like objects keep their name (and so their
+    extension, which decides how the file is read).
+    """
+    from insight_agent import ingest
+
+    if isinstance(file_obj, (str, os.PathLike)):
+        return os.path.abspath(os.fspath(file_obj))
+    os.makedirs(dest_dir, exist_ok=True)
+    path = os.path.join(dest_dir, os.path.basename(ingest.file_name(file_obj)) or 'upload')
+    ingest.rewind(file_obj)
+    with open(path, 'wb') as out:
+        shutil.copyfileobj(file_obj, out, 1024 * 1024)
+    return os.path.abspath(path)
+
+
+class JobRunner:
+    """Runs kind creation and onboarding jobs in worker processes.
+
+    Jobs are rows in a SQLite table (see JobStore), so they survive browser
+    refreshes and are visible from every session. A dispatcher thread starts
+    queued jobs on a process pool, at most `workers` at a time and one per
+    kind, so onboardings of different kinds use separate cores while two
+    writes to the same dataset never overlap. On Python 3.11+ each job runs
+    in a fresh process, which keeps its peak memory figure its own; older
+    interpreters reuse workers and only report a job's peak when it exceeds
+    the worker's earlier jobs. Running jobs are
+    cancelled cooperatively at their next progress report; jobs left running
+    by a previous app process are marked failed and can be retried.
+
+    Args:
+        workers (int): jobs executing at once.
+        db_path (str): job table location; uploads are stored next to it.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, db_path=JOBS_DB):
+        self.workers = workers
+        self.store = JobStore(db_path)
+        self.jobs_dir = os.path.dirname(self.store.path)
+        # One task per child so ru_maxrss (the peak memory figure) covers a single job
+        options = {'max_tasks_per_child': 1} if FRESH_WORKERS else {}
+        # spawn: forking the multi-threaded app server is unsafe
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                             **options)
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._wake = threading.Event()
+        self._stopped = False
+        for job in self.store.list(limit=10_000, statuses=('running',)):
+            self.store.update(job['id'], when_status=('running',), status='failed', finished_at=time.time(),
+                              message='Interrupted: the app stopped while the job was running.')
+        self._thread = threading.Thread(target=self._loop, name='job-dispatcher', daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._stopped:
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+            if not self._stopped:
+                self._dispatch()
+
+    def _dispatch(self):
+        with self._lock:
+            for job_id, (_, future) in list(self._futures.items()):
+                if future.done():
+                    del self._futures[job_id]
+                    exc = future.exception()
+                    if exc is not None:
+                        # The worker process died (e.g. killed for memory) before recording an outcome
+                        self.store.update(job_id, when_status=ACTIVE_STATUSES, status='failed',
+                                          finished_at=time.time(), message=f"Error: worker process failed: {exc}")
+            active_kinds = {kind for kind, _ in self._futures.values()}
+            for job in reversed(self.store.list(limit=10_000, statuses=('queued',))):
+                if len(self._futures) >= self.workers:
+                    break
+                if job['kind_name'] in active_kinds or job['id'] in self._futures:
+                    continue
+                future = self._executor.submit(_execute, job['id'], self.store.path)
+                self._futures[job['id']] = (job['kind_name'], future)
+                active_kinds.add(job['kind_name'])
+
+    def submit(self, job_type, kind_name, files, **options):
+        """Queue a job.
+
+        Args:
+            job_type (str): 'create_kind' or 'onboard_instance'.
+            kind_name (str): kind the job works on.
+            files (dict): input name -> uploaded file or path; for create_kind
+                mapping_file and optionally sample_file, for onboard_instance
+                instance_file. File-like objects are copied to disk first.
+            **options: keyword arguments of the job function (mode,
+                kind_description) and the Excel sheet and header_row of
+                the data file.
+
+        Returns:
+            str: the job id.
+        """
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Unknown job type '{job_type}'.")
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.jobs_dir, job_id)
+        saved = {name: _save_upload(f, job_dir) for name, f in files.items() if f is not None}
+        self.store.create(job_type, kind_name, dict(options, files=saved), job_id=job_id)
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id):
+        """Return a job's row as a dict, or None."""
+        return self.store.get(job_id)
+
+    def jobs(self, limit=100):
+        """Recent jobs, newest first."""
+        return self.store.list(limit=limit)
+
+    def cancel(self, job_id):
+        """Cancel a queued job, or ask a running one to stop.
+
+        Returns:
+            bool: True if the job was still queued or running.
+        """
+        if self.store.update(job_id, when_status=('queued',), status='cancelled',
+                             finished_at=time.time(), message='Job was cancelled.'):
+            return True
+        return self.store.update(job_id, when_status=('running',), cancel_requested=1)
+
+    def retry(self, job_id):
+        """Queue a failed or cancelled job again with the same inputs.
+
+        Returns:
+            bool: False if the job cannot be retried (still active, succeeded,
+            or its input files are gone).
+        """
+        job = self.store.get(job_id)
+        if job is None or job['status'] not in ('failed', 'cancelled'):
+            return False
+        if not all(os.path.exists(path) for path in job['params'].get('files', {}).values()):
+            return False
+        retried = self.store.update(job_id, when_status=('failed', 'cancelled'), status='queued', message='',
+                                    progress=0, rows=0, started_at=None, finished_at=None, duration_s=None,
+                                    rows_per_s=None, peak_memory_mb=None, pid=None, cancel_requested=0,
+                                    attempts=(job['attempts'] or 1) + 1)
+        self._wake.set()
+        return retried
+
+    def wait(self, job_id, timeout=None):
+        """Block until a job finishes; returns its row (or None on timeout)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while deadline is None or time.monotonic() < deadline:
+            job = self.store.get(job_id)
+            if job is None or job['status'] not in ACTIVE_STATUSES:
+                return job
+            time.sleep(0.1)
+        return None
+
+    def shutdown(self):
+        """Stop dispatching and the worker processes; queued jobs stay queued."""
+        self._stopped = True
+        self._wake.set()
+        self._thread.join()
+        # Jobs not started yet stay queued in the table for the next runner
+        with self._lock:
+            for _, future in self._futures.values():
+                future.cancel()
+        self._executor.shutdown(wait=True)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    """Return the process-wide JobRunner; JOB_WORKERS overrides the worker count."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner(workers=int(os.environ.get('JOB_WORKERS', DEFAULT_WORKERS)))
+        return _runner
@@ -1,10 +1,18 @@
-def create_kind(uploaded_file, kind_name, sample_file=None, kind_description=''):
+def create_kind(uploaded_file, kind_name, sample_file=None, kind_description='', sample_sheet=None,
+                sample_header_row=0, progress_callback=None):
     """Validate a mapping workbook uploaded via Streamlit and persist it.
 
     Args:
         uploaded_file: A file-like object as provided by st.file_uploader.
         kind_name (str): The name of the Kind to persist.
         sample_file: Optional file-like object for sample data.
+        kind_description (str): Optional description saved as description.md.
+        sample_sheet: Excel sheet (name or 0-based index) of the sample data.
+        sample_header_row (int): 0-based row of the sample's column names.
+        progress_callback (callable): optional, called between steps as
+            progress_callback(sample_rows, fraction); it may raise to cancel
+            the creation (see job_runner), which stops before the effective
+            mapping that makes the kind usable is written.
 
     Returns:
         tuple: (success: bool, message: str)
@@ -12,22 +20,17 @@ def create_kind(uploaded_file, kind_name, sample_file=None, kind_description='')
     import pandas as pd
     import os
 
+    from insight_agent.ingest import read_frame
+
     try:
-        # Let pandas infer file type (Excel or CSV) based on the uploaded file
-        # Streamlit's uploaded_file exposes a file-like object
-        name = getattr(uploaded_file, 'name', '')
-        if isinstance(name, str) and name.lower().endswith(('.xls', '.xlsx')):
-            df = pd.read_excel(uploaded_file)
-        else:
-            # Reset stream pointer in case stream has been read
-            try:
-                uploaded_file.seek(0)
-            except Exception:
-                pass
-            df = pd.read_csv(uploaded_file)
+        # Excel or CSV by file name; workbooks are streamed, not loaded whole
+        df = read_frame(uploaded_file)
     except Exception as exc:
         return False, f"Error reading uploaded file: {exc}"
 
+    if progress_callback is not None:
+        progress_callback(0, 0.1)
+
     required_cols = ["original_name", "canonical_name", "type", "description", "data_type"]
     if not all(col in df.columns for col in required_cols):
         missing = [c for c in required_cols if c not in df.columns]
@@ -50,44 +53,24 @@ def create_kind(uploaded_file, kind_name, sample_file=None, kind_description='')
     # Handle sample data and generate a simple autofill report
     if sample_file is not None:
         try:
-            sname = getattr(sample_file, 'name', '')
-            if isinstance(sname, str) and sname.lower().endswith(('.xls', '.xlsx')):
-                sample_df = pd.read_excel(sample_file)
-            else:
-                try:
-                    sample_file.seek(0)
-                except Exception:
-                    pass
-                sample_df = pd.read_csv(sample_file)
+            sample_df = read_frame(sample_file, sheet=sample_sheet, header_row=sample_header_row)
         except Exception:
             # If sample file can't be read, continue but warn in message
             return False, "Error reading sample data file."
 
-        # Infer format hints for each column in sample_df
-        hints = []
-        for col in sample_df.columns:
-            series = sample_df[col]
-            fmt = 'string'
-            # try numeric
-            try:
-                _ = pd.to_numeric(series.dropna())
-                fmt = 'numeric'
-            except Exception:
-                # try datetime
-                try:
-                    _ = pd.to_datetime(series.dropna())
-                    fmt = 'datetime'
-                except Exception:
-                    fmt = 'string'
-            hints.append((col, fmt))
+        # Infer types on a bounded sample spread across the file (vectorized per column)
+        from insight_agent.type_inference import infer_types
+        inferred = infer_types(sample_df)
+        hints = [(col, info['format_hint']) for col, info in inferred.items()]
+        if progress_callback is not None:
+            progress_callback(len(sample_df), 0.6)
 
-        # Save nice_mapping.csv with original_name and format_hint
+        # Save nice_mapping.csv with original_name, format_hint and the detailed inference
         try:
             nice_path = os.path.join(base_dir, 'nice_mapping.csv')
-            with open(nice_path, 'w') as nf:
-                nf.write('original_name,format_hint\n')
-                for col, fmt in hints:
-                    nf.write(f"{col},{fmt}\n")
+            nice = pd.DataFrame([{'original_name': col, **info} for col, info in inferred.items()],
+                                columns=['original_name', 'format_hint', 'inferred_type', 'date_format', 'confidence'])
+            nice.to_csv(nice_path, index=False)
         except Exception as exc:
             return False, f"Error saving nice mapping: {exc}"
 
@@ -99,6 +82,10 @@ def create_kind(uploaded_file, kind_name, sample_file=None, kind_description='')
             merged = pd.merge(req_df, nice_df, on='original_name', how='outer')
             # Fill NA with empty strings for JSON-friendly output
             merged = merged.fillna('')
+            # Columns without a declared data_type take the inferred one
+            if 'data_type' in merged.columns and 'inferred_type' in merged.columns:
+                blank = merged['data_type'].astype(str).str.strip() == ''
+                merged.loc[blank, 'data_type'] = merged.loc[blank, 'inferred_type']
             # Convert to list of records
             records = merged.to_dict(orient='records')
             import json
@@ -108,11 +95,27 @@ def create_kind(uploaded_file, kind_name, sample_file=None, kind_description='')
         except Exception as exc:
             return False, f"Error generating effective mapping: {exc}"
 
+        # Profile the sample with the same streaming profiler used at onboarding
+        try:
+            import json
+            from insight_agent.profiler import DatasetProfiler
+            profiler = DatasetProfiler()
+            profiler.update(sample_df)
+            profile_path = os.path.join(base_dir, 'profile.json')
+            with open(profile_path, 'w') as pf:
+                json.dump(profiler.to_profile(), pf, indent=2)
+        except Exception as exc:
+            return False, f"Error profiling sample data: {exc}"
+
         # Generate a markdown table for autofill_report.md summarizing the inferences
         try:
-            report_lines = ['# Autofill Report', '', '| column | format_hint |', '|---|---|']
+            report_lines = ['# Autofill Report', '',
+                            '| column | format_hint | inferred_type | date_format | confidence |',
+                            '|---|---|---|---|---|']
             for col, fmt in hints:
-                report_lines.append(f'| {col} | {fmt} |')
+                info = inferred[col]
+                report_lines.append(f"| {col} | {fmt} | {info['inferred_type']} | {info['date_format']} "
+                                    f"| {info['confidence']:.0%} |")
             report = '\n'.join(report_lines)
             report_path = os.path.join(base_dir, 'autofill_report.md')
             with open(report_path, 'w') as fh:
@@ -120,6 +123,10 @@ def create_kind(uploaded_file, kind_name, sample_file=None, kind_description='')
         except Exception as exc:
             return False, f"Error saving autofill report: {exc}"
 
+        if progress_callback is not None:
+            progress_callback(len(sample_df), 1.0)
         return True, f"Success! Kind '{kind_name}' created and autofill report generated."
 
+    if progress_callback is not None:
+        progress_callback(0, 1.0)
     return True, f"Success! Kind '{kind_name}' created and mapping file saved."
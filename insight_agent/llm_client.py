@@ -1,10 +1,27 @@
 import os
-from dotenv import load_dotenv
 import json
-import litellm
+import time
+import random
+import asyncio
+import threading
 
-# load .env into environment
-load_dotenv()
+
+def _litellm():
+    """Import litellm on first use; it takes seconds to import and most pages never call an LLM."""
+    from insight_agent.config import load_env
+
+    load_env()
+    import litellm
+
+    return litellm
+
+
+def prewarm():
+    """Import litellm on a background thread so the first Ask does not wait for it."""
+    import sys
+
+    if 'litellm' not in sys.modules:
+        threading.Thread(target=_litellm, name='litellm-import', daemon=True).start()
 
 
 def get_sql_from_prompt(prompt: str) -> str:
@@ -12,6 +29,7 @@ def get_sql_from_prompt(prompt: str) -> str:
 
     The model is instructed to reply with strict JSON: {"sql": "..."}
     """
+    litellm = _litellm()
     # Read API config from environment
     api_key = os.environ.get('LITELLM_API_KEY')
     api_base = os.environ.get('LITELLM_API_BASE')
@@ -29,6 +47,7 @@ def get_sql_from_prompt(prompt: str) -> str:
             max_tokens=1024,
             api_key=api_key,
             api_base=api_base,
+            timeout=float(os.environ.get('LLM_TIMEOUT', 60)),
         )
     except TypeError:
         # Fallback for older or mocked litellm implementations that accept (prompt, max_tokens)
@@ -45,6 +64,11 @@ def get_sql_from_prompt(prompt: str) -> str:
     except Exception:
         content = resp
 
+    return extract_sql(content)
+
+
+def extract_sql(content):
+    """Parse the {"sql": ...} object out of a model reply; '' if there is none."""
     try:
         parsed = json.loads(content)
         return parsed.get('sql', '')
@@ -57,3 +81,233 @@ def get_sql_from_prompt(prompt: str) -> str:
             return parsed.get('sql', '')
         except Exception:
             return ''
+
+
+class StreamingSQLParser:
+    """Incrementally scan streamed tokens for the first complete JSON object.
+
+    feed() returns the SQL as soon as the object's closing brace arrives, so
+    the caller can stop reading the stream without waiting for the model to
+    finish.
+    """
+
+    def __init__(self):
+        self.buffer = []
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text):
+        """Consume a chunk of text; returns the SQL once the object is complete, else None."""
+        for ch in text or '':
+            if not self._started:
+                if ch != '{':
+                    continue
+                self._started = True
+            self.buffer.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == '{':
+                self._depth += 1
+            elif ch == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    return extract_sql(''.join(self.buffer))
+        return None
+
+
+def _is_retryable(exc):
+    """Rate limits, timeouts and server errors are worth another attempt."""
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    status = getattr(exc, 'status_code', None)
+    if status == 429 or (isinstance(status, int) and status >= 500):
+        return True
+    name = type(exc).__name__
+    return 'RateLimit' in name or 'Timeout' in name or 'ServiceUnavailable' in name
+
+
+class AsyncLLMClient:
+    """Async SQL generation with timeouts, jittered retries and a concurrency cap.
+
+    Args:
+        max_concurrency (int): completions in flight at once across all callers.
+        timeout (float): seconds allowed per attempt.
+        max_retries (int): extra attempts after a rate limit, timeout or 5xx.
+        backoff (float): base delay in seconds, doubled per attempt with full jitter.
+        stream (bool): stream tokens and return as soon as the JSON object closes.
+        acompletion (callable): completion coroutine function; defaults to
+            litellm.acompletion. Tests and benchmarks pass a fake here.
+        model (str): model name passed to the completion call.
+    """
+
+    def __init__(self, max_concurrency=4, timeout=60.0, max_retries=3, backoff=0.5, stream=True,
+                 acompletion=None, model='gpt-5-mini'):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.stream = stream
+        self.model = model
+        self._acompletion = acompletion
+        self._semaphore = None
+
+    def _completion_fn(self):
+        return self._acompletion or _litellm().acompletion
+
+    async def _once(self, prompt):
+        from insight_agent import tracing
+
+        # Resolved first: importing litellm also loads .env with the API settings
+        complete = self._completion_fn()
+        kwargs = {
+            'messages': [{"role": "user", "content": prompt}],
+            'model': self.model,
+            'max_tokens': 1024,
+        }
+        api_key = os.environ.get('LITELLM_API_KEY')
+        if api_key:
+            kwargs['api_key'] = api_key
+            kwargs['api_base'] = os.environ.get('LITELLM_API_BASE')
+        if not self.stream:
+            resp = await complete(**kwargs)
+            try:
+                content = resp.choices[0].message.content
+            except Exception:
+                content = resp
+            usage = getattr(resp, 'usage', None)
+            if usage is not None:
+                tracing.set_attributes(usage_prompt_tokens=getattr(usage, 'prompt_tokens', None),
+                                       usage_completion_tokens=getattr(usage, 'completion_tokens', None))
+            return extract_sql(content)
+
+        resp = await complete(stream=True, **kwargs)
+        parser = StreamingSQLParser()
+        started = time.perf_counter()
+        first_token = True
+        try:
+            async for chunk in resp:
+                try:
+                    text = chunk.choices[0].delta.content
+                except Exception:
+                    text = chunk if isinstance(chunk, str) else None
+                if first_token and text:
+                    first_token = False
+                    tracing.set_attributes(first_token_ms=round((time.perf_counter() - started) * 1000, 1))
+                sql = parser.feed(text)
+                if sql is not None:
+                    return sql
+        finally:
+            close = getattr(resp, 'aclose', None)
+            if close is not None:
+                await close()
+        return extract_sql(''.join(parser.buffer))
+
+    async def aget_sql(self, prompt):
+        """Generate SQL for one prompt.
+
+        Raises:
+            asyncio.TimeoutError or the completion's exception once retries are exhausted.
+        """
+        from insight_agent import tracing
+        from insight_agent.prompt_builder import estimate_tokens
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        attempt = 0
+        with tracing.span('llm.generate_sql', model=self.model, stream=self.stream) as sp:
+            if sp.recording:
+                sp.set_attribute('prompt_tokens', estimate_tokens(prompt))
+            while True:
+                try:
+                    async with self._semaphore:
+                        sql = await asyncio.wait_for(self._once(prompt), timeout=self.timeout)
+                    sp.set_attributes(attempts=attempt + 1, sql_tokens=estimate_tokens(sql))
+                    return sql
+                except Exception as exc:
+                    if attempt >= self.max_retries or not _is_retryable(exc):
+                        sp.set_attribute('attempts', attempt + 1)
+                        raise
+                    # Full jitter keeps many throttled callers from retrying in lockstep
+                    await asyncio.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+                    attempt += 1
+
+    async def abatch(self, prompts):
+        """Generate SQL for several prompts concurrently.
+
+        Returns:
+            list: SQL per prompt, or an "Error: ..." string for prompts that failed.
+        """
+        results = await asyncio.gather(*(self.aget_sql(p) for p in prompts), return_exceptions=True)
+        return [f"Error: {r!r}" if isinstance(r, BaseException) else r for r in results]
+
+
+def default_client():
+    """Build an AsyncLLMClient configured from LLM_* environment variables."""
+    from insight_agent.config import load_env
+
+    load_env()
+    return AsyncLLMClient(
+        max_concurrency=int(os.environ.get('LLM_MAX_CONCURRENCY', 4)),
+        timeout=float(os.environ.get('LLM_TIMEOUT', 60)),
+        max_retries=int(os.environ.get('LLM_MAX_RETRIES', 3)),
+    )
+
+
+_loop = None
+_client = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop():
+    """Event loop on a daemon thread shared by all Streamlit script threads.
+
+    One loop means one semaphore, so the concurrency cap holds across sessions.
+    """
+    global _loop, _client
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='llm-client', daemon=True).start()
+            _client = default_client()
+        return _loop, _client
+
+
+def generate_sql(prompt):
+    """Blocking helper for Streamlit pages: generate SQL on the shared async client.
+
+    Returns:
+        str: the SQL, or an "Error: ..." message.
+    """
+    from insight_agent import tracing
+    from insight_agent.config import load_env
+
+    load_env()
+    if not os.environ.get('LITELLM_API_KEY'):
+        return "Error: LITELLM_API_KEY is not set. Please create a .env file with your API key."
+    loop, client = _background_loop()
+    try:
+        # The loop thread does not see this thread's context; carry the current span over
+        coro = tracing.run_in_span(tracing.current_span(), client.aget_sql(prompt))
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+    except Exception as exc:
+        return f"Error: LLM request failed: {exc!r}"
+
+
+def generate_sql_batch(prompts):
+    """Blocking helper: generate SQL for several prompts concurrently."""
+    from insight_agent.config import load_env
+
+    load_env()
+    if not os.environ.get('LITELLM_API_KEY'):
+        return ["Error: LITELLM_API_KEY is not set. Please create a .env file with your API key."] * len(prompts)
+    loop, client = _background_loop()
+    return asyncio.run_coroutine_threadsafe(client.abatch(prompts), loop).result()
@@ -0,0 +1,393 @@
+import base64
+import math
+
+import numpy as np
+import pandas as pd
+
+
+# Number of most frequent values kept per column. Columns with at most this
+# many distinct values are profiled exactly.
+DEFAULT_TOP_K = 200
+# HyperLogLog precision: 2**12 registers, ~1.6% standard error, 4 KB per column.
+DEFAULT_HLL_PRECISION = 12
+# Bins in each numeric histogram.
+DEFAULT_HISTOGRAM_BINS = 32
+# Number of (value, count) pairs written to profile.json per column.
+TOP_VALUES_REPORTED = 20
+
+
+def _to_python(value):
+    """Convert numpy/pandas scalars into JSON-serialisable Python values."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return value
+
+
+class HyperLogLog:
+    """Distinct-count estimator with fixed memory (2**precision registers)."""
+
+    def __init__(self, precision=DEFAULT_HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, series):
+        """Add the non-null values of a pandas Series."""
+        if series.empty:
+            return
+        hashes = pd.util.hash_pandas_object(series, index=False).to_numpy(dtype=np.uint64)
+        p = self.precision
+        idx = (hashes >> np.uint64(64 - p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - p)) - 1)
+        # Bit length of the remaining bits, computed exactly from two 32-bit halves
+        hi = (rest >> np.uint64(32)).astype(np.float64)
+        lo = (rest & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        bit_length = np.where(hi > 0, np.frexp(hi)[1] + 32, np.frexp(lo)[1])
+        rho = ((64 - p) - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, idx, rho)
+
+    def merge(self, other):
+        self.registers = np.maximum(self.registers, other.registers)
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Small-range correction (linear counting)
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    def to_state(self):
+        return {'precision': self.precision,
+                'registers': base64.b64encode(self.registers.tobytes()).decode('ascii')}
+
+    @classmethod
+    def from_state(cls, state):
+        hll = cls(state['precision'])
+        hll.registers = np.frombuffer(base64.b64decode(state['registers']), dtype=np.uint8).copy()
+        return hll
+
+
+class TopK:
+    """Mergeable frequent-items summary (Misra-Gries) holding at most k values.
+
+    Counts are exact while a column has no more than k distinct values;
+    beyond that each count is underestimated by at most rows / (k + 1).
+    """
+
+    def __init__(self, k=DEFAULT_TOP_K):
+        self.k = k
+        self.counts = pd.Series(dtype='int64')
+
+    def _add_counts(self, counts):
+        combined = counts if self.counts.empty else self.counts.add(counts, fill_value=0)
+        if len(combined) > self.k:
+            floor = combined.nlargest(self.k + 1).iloc[-1]
+            combined = combined[combined > floor] - floor
+        self.counts = combined.astype('int64')
+
+    def update(self, series):
+        """Add the non-null values of a pandas Series."""
+        if series.empty:
+            return
+        self._add_counts(series.value_counts(sort=False))
+
+    def merge(self, other):
+        if not other.counts.empty:
+            self._add_counts(other.counts)
+
+    def most_common(self, n=None):
+        ordered = self.counts.sort_values(ascending=False, kind='stable')
+        if n is not None:
+            ordered = ordered.head(n)
+        return [(_to_python(v), int(c)) for v, c in ordered.items()]
+
+    def to_state(self):
+        return {'k': self.k, 'counts': self.most_common()}
+
+    @classmethod
+    def from_state(cls, state):
+        topk = cls(state['k'])
+        if state['counts']:
+            values, counts = zip(*state['counts'])
+            topk.counts = pd.Series(list(counts), index=pd.Index(list(values), dtype=object), dtype='int64')
+        return topk
+
+
+class Histogram:
+    """Fixed-size numeric histogram whose range widens as values arrive.
+
+    When a value falls outside the current range, adjacent bins are merged
+    pairwise and the range doubles towards the new value, so memory stays at
+    `bins` counters regardless of the data.
+    """
+
+    def __init__(self, bins=DEFAULT_HISTOGRAM_BINS):
+        self.bins = bins
+        self.low = None
+        self.width = None
+        self.counts = np.zeros(bins, dtype=np.int64)
+
+    def _expand(self, vmin, vmax):
+        while vmin < self.low or vmax > self.low + self.width * self.bins:
+            merged = self.counts.reshape(-1, 2).sum(axis=1)
+            pad = np.zeros(self.bins // 2, dtype=np.int64)
+            if vmin < self.low:
+                self.counts = np.concatenate([pad, merged])
+                self.low -= self.width * self.bins
+            else:
+                self.counts = np.concatenate([merged, pad])
+            self.width *= 2
+
+    def _add(self, values, weights=None):
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return
+        vmin, vmax = float(values.min()), float(values.max())
+        if self.low is None:
+            self.low = vmin
+            self.width = (vmax - vmin) / self.bins or 1.0
+        self._expand(vmin, vmax)
+        idx = np.floor((values - self.low) / self.width).astype(np.int64)
+        idx = np.clip(idx, 0, self.bins - 1)
+        self.counts += np.bincount(idx, weights=weights, minlength=self.bins).astype(np.int64)
+
+    def update(self, series):
+        """Add the non-null values of a numeric pandas Series."""
+        self._add(series.to_numpy(dtype=np.float64, na_value=np.nan))
+
+    def merge(self, other):
+        if other.low is None:
+            return
+        # Re-bin the other histogram's bin centres, weighted by their counts
+        nonzero = other.counts > 0
+        centres = other.low + other.width * (np.arange(other.bins) + 0.5)
+        self._add(centres[nonzero], weights=other.counts[nonzero])
+
+    def to_dict(self):
+        if self.low is None:
+            return None
+        # Drop empty bins left at either end by range doubling
+        nonzero = np.flatnonzero(self.counts)
+        first, last = (nonzero[0], nonzero[-1] + 1) if nonzero.size else (0, self.bins)
+        edges = self.low + self.width * np.arange(first, last + 1)
+        return {'edges': edges.tolist(), 'counts': self.counts[first:last].tolist()}
+
+    def to_state(self):
+        return {'bins': self.bins, 'low': self.low, 'width': self.width, 'counts': self.counts.tolist()}
+
+    @classmethod
+    def from_state(cls, state):
+        hist = cls(state['bins'])
+        hist.low = state['low']
+        hist.width = state['width']
+        hist.counts = np.asarray(state['counts'], dtype=np.int64)
+        return hist
+
+
+class ColumnProfiler:
+    """Streaming statistics for one column with fixed memory."""
+
+    def __init__(self, name, top_k=DEFAULT_TOP_K, hll_precision=DEFAULT_HLL_PRECISION,
+                 histogram_bins=DEFAULT_HISTOGRAM_BINS):
+        self.name = name
+        self.kind = None
+        self.count = 0
+        self.null_count = 0
+        self.min = None
+        self.max = None
+        self.hll = HyperLogLog(hll_precision)
+        self.top = TopK(top_k)
+        self.histogram = Histogram(histogram_bins)
+
+    @staticmethod
+    def _column_kind(series):
+        if pd.api.types.is_bool_dtype(series):
+            return 'boolean'
+        if pd.api.types.is_numeric_dtype(series):
+            return 'numeric'
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return 'datetime'
+        return 'string'
+
+    def _update_bounds(self, lo, hi):
+        try:
+            self.min = lo if self.min is None or lo < self.min else self.min
+            self.max = hi if self.max is None or hi > self.max else self.max
+        except TypeError:
+            # Mixed, non-comparable values: keep the bounds already recorded
+            pass
+
+    def update(self, series):
+        """Add one chunk of the column."""
+        if self.kind is None:
+            self.kind = self._column_kind(series)
+        self.count += len(series)
+        values = series.dropna()
+        self.null_count += len(series) - len(values)
+        if values.empty:
+            return
+        self.hll.update(values)
+        self.top.update(values)
+        try:
+            self._update_bounds(values.min(), values.max())
+        except TypeError:
+            pass
+        if self.kind == 'numeric':
+            self.histogram.update(values)
+
+    def merge(self, other):
+        self.kind = self.kind or other.kind
+        self.count += other.count
+        self.null_count += other.null_count
+        self.hll.merge(other.hll)
+        self.top.merge(other.top)
+        self.histogram.merge(other.histogram)
+        if other.min is not None:
+            self._update_bounds(other.min, other.max)
+
+    def to_dict(self):
+        stats = {
+            'dtype': self.kind or 'string',
+            'count': self.count,
+            'null_count': self.null_count,
+            'distinct_estimate': self.hll.estimate(),
+            'min': _to_python(self.min),
+            'max': _to_python(self.max),
+            'top_values': self.top.most_common(TOP_VALUES_REPORTED),
+        }
+        # Keep the estimate within what the column can actually hold
+        non_null = self.count - self.null_count
+        stats['distinct_estimate'] = min(max(stats['distinct_estimate'], len(self.top.counts)), non_null)
+        if self.kind == 'numeric':
+            stats['histogram'] = self.histogram.to_dict()
+        return stats
+
+    def to_state(self):
+        return {
+            'kind': self.kind, 'count': self.count, 'null_count': self.null_count,
+            'min': _to_python(self.min), 'max': _to_python(self.max), 'hll': self.hll.to_state(),
+            'top': self.top.to_state(), 'histogram': self.histogram.to_state(),
+        }
+
+    @classmethod
+    def from_state(cls, name, state):
+        col = cls(name)
+        col.kind = state['kind']
+        col.count = state['count']
+        col.null_count = state['null_count']
+        col.min = state['min']
+        col.max = state['max']
+        if col.kind == 'datetime' and col.min is not None:
+            col.min, col.max = pd.Timestamp(col.min), pd.Timestamp(col.max)
+        col.hll = HyperLogLog.from_state(state['hll'])
+        col.top = TopK.from_state(state['top'])
+        if col.kind == 'datetime' and not col.top.counts.empty:
+            # Saved as ISO strings; fresh chunks count Timestamps
+            col.top.counts.index = pd.to_datetime(col.top.counts.index)
+        col.histogram = Histogram.from_state(state['histogram'])
+        return col
+
+
+class DatasetProfiler:
+    """Single-pass profiler over DataFrame chunks.
+
+    Args:
+        filterable (dict): canonical column -> filter_display_order. These
+            columns also get the `values` list the Ask page offers as filters.
+        top_k (int): frequent values tracked per column (and the cap on `values`).
+    """
+
+    def __init__(self, filterable=None, top_k=DEFAULT_TOP_K):
+        self.filterable = dict(filterable or {})
+        self.top_k = top_k
+        self.columns = {}
+
+    def update(self, df):
+        """Profile one chunk; columns are registered on first sight."""
+        for col in df.columns:
+            profiler = self.columns.get(col)
+            if profiler is None:
+                profiler = self.columns[col] = ColumnProfiler(col, top_k=self.top_k)
+            profiler.update(df[col])
+
+    def merge(self, other):
+        """Fold another profiler's sketches into this one."""
+        for col, profiler in other.columns.items():
+            if col in self.columns:
+                self.columns[col].merge(profiler)
+            else:
+                self.columns[col] = profiler
+
+    def to_profile(self):
+        """Render the profile.json structure keyed by column name."""
+        profile = {}
+        for col, profiler in self.columns.items():
+            entry = {}
+            if col in self.filterable:
+                entry['values'] = [v for v, _ in profiler.top.most_common(self.top_k)]
+                entry['filter_display_order'] = self.filterable[col]
+            entry.update(profiler.to_dict())
+            profile[col] = entry
+        return profile
+
+    def to_state(self):
+        return {'top_k': self.top_k, 'filterable': self.filterable,
+                'columns': {col: p.to_state() for col, p in self.columns.items()}}
+
+    @classmethod
+    def from_state(cls, state):
+        profiler = cls(state.get('filterable'), top_k=state.get('top_k', DEFAULT_TOP_K))
+        for col, col_state in state.get('columns', {}).items():
+            profiler.columns[col] = ColumnProfiler.from_state(col, col_state)
+        return profiler
+
+
+def arrow_frame(table):
+    """Convert an Arrow table read back from parquet to the dtypes onboarding profiles.
+
+    Streamed chunks are profiled as TableCaster.cast_frame leaves them (float
+    numbers, datetime64 dates, string and boolean extension types), so stored
+    files are converted the same way before their sketches are merged with
+    those of streamed chunks.
+    """
+    import pyarrow as pa
+
+    arrays = []
+    for field, column in zip(table.schema, table.columns):
+        arrow_type = field.type
+        if pa.types.is_dictionary(arrow_type):
+            arrow_type = arrow_type.value_type
+            column = column.cast(arrow_type)
+        if pa.types.is_integer(arrow_type) or pa.types.is_decimal(arrow_type):
+            column = column.cast(pa.float64())
+        elif pa.types.is_date(arrow_type):
+            column = column.cast(pa.timestamp('ns'))
+        elif pa.types.is_large_string(arrow_type):
+            column = column.cast(pa.string())
+        arrays.append(column)
+    table = pa.Table.from_arrays(arrays, names=table.column_names)
+    mapper = {pa.string(): pd.StringDtype(), pa.bool_(): pd.BooleanDtype()}.get
+    return table.to_pandas(types_mapper=mapper)
+
+
+def filterable_columns(mapping):
+    """Map canonical column -> filter_display_order for filterable mapping rows.
+
+    A column is filterable if filter_display_order contains a number. Blanks
+    and non-numeric values are ignored.
+    """
+    filterable = {}
+    for rec in mapping:
+        order_val = rec.get('filter_display_order')
+        try:
+            if order_val is not None and str(order_val).strip() != '':
+                order_int = int(order_val)
+                orig = rec.get('original_name')
+                filterable[rec.get('canonical_name', orig)] = order_int
+        except Exception:
+            continue
+    return filterable
@@ -1,45 +1,61 @@
 import os
 import json
+import functools
 
 
-def build_prompt(kind_name, user_question, selected_filters=None):
-    """Build a human-readable prompt describing the dataset and the user's intent.
+# Approximate token budget for the schema section of a prompt. Wide kinds
+# are pruned to the most relevant columns that fit.
+DEFAULT_SCHEMA_TOKEN_BUDGET = 1200
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English/SQL)."""
+    return (len(text or '') + 3) // 4
+
+
+def _tokens(text):
+    """Normalised tokens of a text plus joined bigrams ('year ago' -> 'year_ago')."""
+    import re
+    from insight_agent.semantic_cache import normalize_question
+
+    tokens = normalize_question(text)
+    words = re.findall(r'[a-z0-9%]+', (text or '').lower())
+    tokens.update(f"{a}_{b}" for a, b in zip(words, words[1:]))
+    return tokens
+
+
+@functools.lru_cache(maxsize=64)
+def _static_context(entry):
+    """Pre-render the request-independent parts of a kind's prompt.
+
+    Cached per catalog entry; the catalog replaces the entry whenever the
+    mapping, description or profile changes, so edits produce a fresh one.
 
     Args:
-        kind_name (str): name of the kind (directory under domain/catalog/kinds)
-        user_question (str): the user's natural language question
-        selected_filters (dict): mapping of column->value selections
+        entry (catalog.KindVersion): the kind's catalog metadata.
 
     Returns:
-        str: the constructed prompt
+        tuple: (header_parts, columns) where columns is a tuple of dicts with
+        the rendered schema line, its token cost and its match tokens.
     """
-    base = os.path.join('domain', 'catalog', 'kinds', kind_name, 'v1')
-    mapping_path = os.path.join(base, 'mapping_effective.json')
-    desc_path = os.path.join(base, 'description.md')
-
-    mapping = []
-    if os.path.exists(mapping_path):
-        try:
-            with open(mapping_path, 'r') as mf:
-                mapping = json.load(mf)
-        except Exception:
-            mapping = []
-
-    description = ''
-    if os.path.exists(desc_path):
-        try:
-            with open(desc_path, 'r') as df:
-                description = df.read()
-        except Exception:
-            description = ''
+    kind_name = entry.kind
+    description = entry.description
 
     # Build schema description from mapping using canonical_name and description
-    schema_lines = []
-    for rec in mapping:
-        orig = rec.get('original_name', '')
-        canon = rec.get('canonical_name', orig)
-        desc = rec.get('description', '')
-        schema_lines.append(f"- {canon} (source column: {orig}): {desc}")
+    columns = []
+    for col in entry.columns:
+        orig = col.original_name
+        canon = col.canonical_name
+        desc = col.description
+        line = f"- {canon} (source column: {orig}): {desc}"
+        columns.append({
+            'canonical_name': canon,
+            'line': line,
+            'cost': estimate_tokens(line) + 1,
+            'name_tokens': frozenset(_tokens(canon.replace('_', ' ')) | _tokens(orig)),
+            'desc_tokens': frozenset(_tokens(desc) | _tokens(col.data_type)),
+            'is_measure': col.is_measure,
+        })
 
     parts = []
     # Strict instruction to enforce JSON-only output
@@ -54,11 +70,208 @@ def build_prompt(kind_name, user_question, selected_filters=None):
     parts.append(f"Dataset: {kind_name}")
     if description:
         parts.append("\nDescription:\n" + description)
-    if schema_lines:
-        parts.append("\nSchema:\n" + "\n".join(schema_lines))
-    if selected_filters:
-        filt_lines = [f"- {k}: {v}" for k, v in (selected_filters.items() if isinstance(selected_filters, dict) else [])]
-        parts.append("\nSelected Filters:\n" + "\n".join(filt_lines))
-    parts.append("\nQuestion:\n" + (user_question or ''))
-
-    return "\n\n".join(parts)
+    return tuple(parts), tuple(columns)
+
+
+def rank_columns(columns, user_question, selected_filters=None):
+    """Order schema columns by relevance to the question and selected filters.
+
+    Matches on column names weigh more than matches on descriptions; filtered
+    columns always rank first. Without any match, dimensions rank ahead of
+    measures since they are what questions group and filter by.
+
+    Returns:
+        list: indexes into columns, most relevant first (mapping order on ties).
+    """
+    question = _tokens(user_question)
+    filtered = set(selected_filters or {})
+    scored = []
+    for i, col in enumerate(columns):
+        score = 3 * len(question & col['name_tokens']) + len(question & col['desc_tokens'])
+        if col['canonical_name'] in filtered:
+            score += 100
+        if not col['is_measure']:
+            score += 0.5
+        scored.append((-score, i))
+    return [i for _, i in sorted(scored)]
+
+
+def select_columns(columns, user_question, selected_filters=None, token_budget=DEFAULT_SCHEMA_TOKEN_BUDGET):
+    """Pick the most relevant columns whose schema lines fit the token budget.
+
+    Columns named in selected_filters (filters, join keys) are always kept,
+    even past the budget; the rest of the budget goes to the best ranked
+    other columns.
+
+    Returns:
+        list: selected column indexes in mapping order.
+    """
+    pinned = set(selected_filters or {})
+    chosen = [i for i, col in enumerate(columns) if col['canonical_name'] in pinned]
+    used = sum(columns[i]['cost'] for i in chosen)
+    for i in rank_columns(columns, user_question, selected_filters):
+        cost = columns[i]['cost']
+        if columns[i]['canonical_name'] in pinned or used + cost > token_budget:
+            continue
+        chosen.append(i)
+        used += cost
+    return sorted(chosen)
+
+
+def join_keys(entries):
+    """Dimension columns (canonical names) shared by pairs of kinds.
+
+    Canonical names are the harmonized vocabulary across kinds, so a
+    dimension present in two kinds (store_id, upc, week) is how their rows
+    line up.
+
+    Args:
+        entries (list): catalog.KindVersion of each kind.
+
+    Returns:
+        list: (left_kind, right_kind, [columns]) for each pair with shared keys.
+    """
+    dims = [(e.kind, [c.canonical_name for c in e.columns if not c.is_measure]) for e in entries]
+    keys = []
+    for i, (left, left_cols) in enumerate(dims):
+        for right, right_cols in dims[i + 1:]:
+            shared = [c for c in left_cols if c in set(right_cols)]
+            if shared:
+                keys.append((left, right, shared))
+    return keys
+
+
+def _examples_part(examples):
+    example_lines = []
+    for ex_question, ex_sql in examples:
+        example_lines.append(f"Question: {ex_question}\n{json.dumps({'sql': ex_sql})}")
+    return "\nExamples of previously answered questions:\n" + "\n\n".join(example_lines)
+
+
+def build_join_prompt(kind_names, user_question, selected_filters=None, examples=None, schema_token_budget=None,
+                      prune_schema=True):
+    """Build a prompt for a question spanning several kinds.
+
+    Each kind is described as its own table (named by
+    sql_analyzer.table_names) with its pruned schema; the schema budget is
+    shared between the kinds and their join keys (see join_keys) are always
+    kept and spelled out as join conditions. Selected filters apply to the
+    first kind. Arguments are as for build_prompt.
+
+    Returns:
+        str: the constructed prompt
+    """
+    from insight_agent import tracing
+    from insight_agent.catalog import get_catalog
+    from insight_agent.sql_analyzer import table_names
+
+    with tracing.span('build_prompt', kind=', '.join(kind_names)) as sp:
+        catalog = get_catalog()
+        entries = [catalog.get(kind) for kind in kind_names]
+        tables = table_names(kind_names)
+        keys = join_keys(entries)
+        if schema_token_budget is None:
+            schema_token_budget = int(os.environ.get('PROMPT_SCHEMA_TOKEN_BUDGET', DEFAULT_SCHEMA_TOKEN_BUDGET))
+
+        parts = [_static_context(entries[0])[0][0]]
+        parts.append("Your query will be executed against the tables below, one per dataset. Reference them by "
+                     "these table names and join them on their key columns.")
+        selected_count = omitted_count = 0
+        for position, entry in enumerate(entries):
+            columns = _static_context(entry)[1]
+            # Join keys are always kept, like filtered columns
+            pinned = {c: True for left, right, shared in keys if entry.kind in (left, right) for c in shared}
+            if position == 0:
+                pinned.update(selected_filters or {})
+            if prune_schema:
+                selected = select_columns(columns, user_question, pinned, schema_token_budget // len(entries))
+            else:
+                selected = list(range(len(columns)))
+            lines = [columns[i]['line'] for i in selected]
+            omitted = len(columns) - len(selected)
+            if omitted:
+                lines.append(f"- ({omitted} less relevant columns omitted)")
+            selected_count += len(selected)
+            omitted_count += omitted
+            section = f"\nTable {tables[entry.kind]} (dataset: {entry.kind})"
+            if entry.description:
+                section += "\n" + entry.description.strip()
+            parts.append(section + "\nSchema:\n" + "\n".join(lines))
+        if keys:
+            conditions = [f"- {tables[left]}.{c} = {tables[right]}.{c}" for left, right, shared in keys for c in shared]
+            parts.append("\nJoin keys:\n" + "\n".join(conditions))
+        if selected_filters:
+            filt_lines = [f"- {tables[entries[0].kind]}.{k}: {v}" for k, v in selected_filters.items()]
+            parts.append("\nSelected Filters:\n" + "\n".join(filt_lines))
+        if examples:
+            parts.append(_examples_part(examples))
+        parts.append("\nQuestion:\n" + (user_question or ''))
+
+        prompt = "\n\n".join(parts)
+        if sp.recording:
+            sp.set_attributes(prompt_tokens=estimate_tokens(prompt), schema_columns=selected_count,
+                              omitted_columns=omitted_count, examples=len(examples or []), kinds=len(entries))
+    return prompt
+
+
+def build_prompt(kind_name, user_question, selected_filters=None, examples=None, schema_token_budget=None,
+                 prune_schema=True):
+    """Build a human-readable prompt describing the dataset and the user's intent.
+
+    The static parts (instructions, description, rendered schema lines) are
+    cached per catalog entry; per request only the column selection and the
+    question-dependent tail are built.
+
+    Args:
+        kind_name (str): name of the kind (directory under domain/catalog/kinds),
+            or a list of kinds for a question joining them (see build_join_prompt)
+        user_question (str): the user's natural language question
+        selected_filters (dict): mapping of column->value selections
+        examples (list): optional (question, sql) pairs of previously validated
+            queries, included as few-shot examples
+        schema_token_budget (int): approximate tokens allowed for the schema
+            section; defaults to PROMPT_SCHEMA_TOKEN_BUDGET or 1200.
+        prune_schema (bool): False includes every column regardless of budget.
+
+    Returns:
+        str: the constructed prompt
+    """
+    from insight_agent import tracing
+    from insight_agent.catalog import get_catalog
+
+    if not isinstance(kind_name, str):
+        kinds = list(dict.fromkeys(kind_name))
+        if len(kinds) > 1:
+            return build_join_prompt(kinds, user_question, selected_filters, examples, schema_token_budget,
+                                     prune_schema)
+        kind_name = kinds[0]
+
+    with tracing.span('build_prompt', kind=kind_name) as sp:
+        header, columns = _static_context(get_catalog().get(kind_name))
+
+        if schema_token_budget is None:
+            schema_token_budget = int(os.environ.get('PROMPT_SCHEMA_TOKEN_BUDGET', DEFAULT_SCHEMA_TOKEN_BUDGET))
+        if prune_schema:
+            selected = select_columns(columns, user_question, selected_filters, schema_token_budget)
+        else:
+            selected = list(range(len(columns)))
+        schema_lines = [columns[i]['line'] for i in selected]
+        omitted = len(columns) - len(selected)
+        if omitted:
+            schema_lines.append(f"- ({omitted} less relevant columns omitted)")
+
+        parts = list(header)
+        if schema_lines:
+            parts.append("\nSchema:\n" + "\n".join(schema_lines))
+        if selected_filters:
+            filt_lines = [f"- {k}: {v}" for k, v in (selected_filters.items() if isinstance(selected_filters, dict) else [])]
+            parts.append("\nSelected Filters:\n" + "\n".join(filt_lines))
+        if examples:
+            parts.append(_examples_part(examples))
+        parts.append("\nQuestion:\n" + (user_question or ''))
+
+        prompt = "\n\n".join(parts)
+        if sp.recording:
+            sp.set_attributes(prompt_tokens=estimate_tokens(prompt), schema_columns=len(selected),
+                              omitted_columns=omitted, examples=len(examples or []))
+    return prompt
@@ -1,46 +1,291 @@
-import os
-import duckdb
-import pandas as pd
+import re
 
+from insight_agent.connection_manager import get_manager
 
-def execute_query(kind_name: str, sql_query: str) -> pd.DataFrame:
+
+def validate_filters(kind_name, filters):
+    """Check structured filters against the kind's dataset profile.
+
+    Only columns the profile marks as filterable (those with a `values` list)
+    can be filtered. When the profile lists every distinct value of a column,
+    values outside that list are rejected as well.
+
+    Args:
+        kind_name (str): name of the kind.
+        filters (dict): column -> value, or column -> list of values.
+
+    Returns:
+        list: (column, [values]) pairs in a stable order; empty selections dropped.
+
+    Raises:
+        ValueError: for unknown columns or values.
+    """
+    from insight_agent.catalog import get_catalog
+
+    if not filters:
+        return []
+    profile = get_catalog().get(kind_name).profile
+    validated = []
+    for col in sorted(filters, key=str):
+        value = filters[col]
+        values = list(value) if isinstance(value, (list, tuple, set, frozenset)) else [value]
+        values = [v for v in values if v is not None and v != '']
+        if not values:
+            continue
+        info = profile.get(col)
+        if not isinstance(info, dict) or 'values' not in info:
+            raise ValueError(f"Column '{col}' is not filterable for kind '{kind_name}'.")
+        known = info['values']
+        # A capped values list only names the most frequent values
+        complete = len(known) >= int(info.get('distinct_estimate') or 0)
+        if complete:
+            lookup = {str(v) for v in known}
+            unknown = [v for v in values if str(v) not in lookup]
+            if unknown:
+                raise ValueError(f"Unknown value(s) {unknown} for filter column '{col}'.")
+        validated.append((col, values))
+    return validated
+
+
+def filter_clause(validated):
+    """Render validated filters as a WHERE condition with positional parameters.
+
+    Returns:
+        tuple: (condition_sql, params); condition_sql is '' without filters.
+    """
+    conditions = []
+    params = []
+    for col, values in validated:
+        ident = '"' + str(col).replace('"', '""') + '"'
+        start = len(params) + 1
+        params.extend(values)
+        if len(values) == 1:
+            conditions.append(f"{ident} = ${start}")
+        else:
+            placeholders = ', '.join(f"${i}" for i in range(start, start + len(values)))
+            conditions.append(f"{ident} IN ({placeholders})")
+    return ' AND '.join(conditions), params
+
+
+def apply_filters(sql_query, condition, table='data'):
+    """Scope the table a query reads to the rows matching a condition.
+
+    A leading CTE named after the table (the kind's `data` view, or the
+    rollup the query was routed to) shadows it with its filtered rows, so the
+    predicates reach the Parquet scan (row-group min/max pruning) whatever
+    shape the query has.
+    """
+    if not condition:
+        return sql_query
+    cte = f"{table} AS (SELECT * FROM main.{table} WHERE {condition})"
+    match = re.match(r"\s*WITH\s+(RECURSIVE\s+)?", sql_query, flags=re.IGNORECASE)
+    if match:
+        return sql_query[:match.end()] + cte + ", " + sql_query[match.end():]
+    return f"WITH {cte} {sql_query}"
+
+
+def prepare_query(kind_name, sql_query, filters=None, max_rows=None):
+    """Turn generated SQL plus structured filters into a statement for a kind.
+
+    The SQL is parsed with DuckDB's parser (see sql_analyzer): every table it
+    reads resolves to the kind's 'data' view and anything but a single SELECT
+    is refused. Aggregate queries a materialized rollup can answer exactly
+    are routed to the smallest such rollup (see rollups.route). Filters are
+    validated and bound as parameters.
+
+    For a list of kinds, each table the SQL reads must name one of them (by
+    view name, see sql_analyzer.table_names, or kind name) and the views are
+    joined directly; filters then apply to the first kind.
+
+    Returns:
+        tuple: (sql, params) ready for cursor.execute().
+    """
+    sql_fixed, params, _, _ = _prepare(kind_name, sql_query, filters, max_rows)
+    return sql_fixed, params
+
+
+def prepare_approximate(kind_name, sql_query, filters=None, max_rows=None):
+    """Like prepare_query, but answer from the kind's sample when no rollup can.
+
+    Queries a rollup answers stay exact. Otherwise a single-kind query reads
+    the kind's stratified sample with its aggregates scaled (see
+    sampling.route); multi-kind queries and kinds without a current sample
+    run exactly.
+
+    Returns:
+        tuple: (sql, params, sample) where sample describes the sampling
+        (see sampling.route), or is None for an exact query.
+    """
+    sql_fixed, params, sample, _ = _prepare(kind_name, sql_query, filters, max_rows, approximate=True)
+    return sql_fixed, params, sample
+
+
+def _prepare(kind_name, sql_query, filters, max_rows, approximate=False):
+    """Shared by the prepare functions; returns (sql, params, sample, rollup table or None)."""
+    from insight_agent import sql_analyzer, rollups, sampling
+    from insight_agent.connection_manager import as_kinds
+
+    kinds = as_kinds(kind_name)
+    validated = validate_filters(kinds[0], filters)
+    condition, params = filter_clause(validated)
+    if len(kinds) > 1:
+        sql_fixed = sql_analyzer.prepare(sql_query, max_rows=max_rows, tables=sql_analyzer.table_lookup(kinds))
+        return apply_filters(sql_fixed, condition, sql_analyzer.table_names(kinds)[kinds[0]]), params, None, None
+    sql_fixed, table = rollups.route(kind_name, sql_analyzer.prepare(sql_query, max_rows=max_rows),
+                                     [col for col, _ in validated])
+    rollup = table if table != sql_analyzer.DATA_TABLE else None
+    sample = None
+    if approximate and table == sql_analyzer.DATA_TABLE:
+        sql_fixed, sample = sampling.route(kind_name, sql_fixed)
+        if sample is not None:
+            table = sampling.SAMPLE_TABLE
+    return apply_filters(sql_fixed, condition, table), params, sample, rollup
+
+
+def check_cost(con, sql, params):
+    """Refuse a plan whose estimated cardinality exceeds QUERY_MAX_ESTIMATED_ROWS (runaway cross joins)."""
+    from insight_agent import sql_analyzer
+
+    estimate = sql_analyzer.estimated_rows(con, sql, params)
+    limit = sql_analyzer.max_estimated_rows()
+    if estimate > limit:
+        raise sql_analyzer.QueryRejected(
+            f"Query refused: the plan estimates {estimate:,} rows (limit {limit:,}). "
+            "Check for missing join conditions.")
+
+
+def _enable_profiling(con):
+    """Have DuckDB profile the next statements on this cursor (for tracing)."""
+    try:
+        con.execute("PRAGMA enable_profiling='no_output'")
+    except Exception:
+        return False
+    return True
+
+
+def profile_metrics(con):
+    """Rows scanned, bytes read and DuckDB's own latency for the cursor's last query.
+
+    Returns:
+        dict: empty when profiling was off or the DuckDB release reports no JSON.
+    """
+    import json
+
+    try:
+        info = json.loads(con.get_profiling_information())
+    except Exception:
+        return {}
+    metrics = {
+        'rows_scanned': info.get('cumulative_rows_scanned'),
+        'bytes_read': info.get('total_bytes_read'),
+        'rows_returned': info.get('rows_returned'),
+        'duckdb_latency_ms': round(info['latency'] * 1000, 3) if 'latency' in info else None,
+        'duckdb_cpu_ms': round(info['cpu_time'] * 1000, 3) if 'cpu_time' in info else None,
+        'peak_buffer_bytes': info.get('system_peak_buffer_memory'),
+    }
+    return {k: v for k, v in metrics.items() if v is not None}
+
+
+def execute_query(kind_name: str, sql_query: str, filters=None, max_rows=None, on_cursor=None,
+                  approximate=False) -> 'pandas.DataFrame':
     """Execute a SQL query against the latest Parquet file for a kind using duckdb.
 
+    See prepare_query for how the SQL is analysed and check_cost for the
+    cost ceiling applied before it runs.
+
     Args:
-        kind_name: Name of the kind (dataset directory under domain/catalog/datasets).
+        kind_name: Name of the kind (dataset directory under domain/catalog/datasets),
+            or a list of kind names whose views the SQL joins (see prepare_query).
         sql_query: SQL string that can reference the parquet file as a table using its path.
+        filters: optional dict of column -> value (or list of values) applied
+            server-side, whether or not the SQL itself filters. Validated
+            against the kind's profile; values are bound as parameters.
+        max_rows: optional cap on returned rows for display. When the query
+            had more, the result is cut and df.attrs['truncated'] is True.
+        on_cursor: optional callable receiving the DuckDB cursor before the
+            query runs, so another thread can interrupt() it (see query_pool).
+        approximate: answer from the kind's sample when possible (see
+            prepare_approximate); df.attrs['sample'] then describes it, and
+            is None for an exact answer.
 
     Returns:
         pandas.DataFrame with query results.
+
+    Raises:
+        ValueError: if a filter column or value is not in the kind's profile,
+            or sql_analyzer.QueryRejected (a ValueError) for refused SQL.
+    """
+    from insight_agent import tracing
+
+    with tracing.span('query.prepare', kind=kind_name) as sp:
+        sql_fixed, params, sample, rollup = _prepare(kind_name, sql_query, filters, max_rows, approximate)
+        sp.set_attributes(rollup=rollup is not None, sampled=sample is not None, filters=len(params))
+    # Borrow a cursor from the process-wide pool; the kind's database and its
+    # 'data' view over the parquet file are created once and reused.
+    with get_manager().cursor(kind_name) as con:
+        if on_cursor is not None:
+            on_cursor(con)
+        with tracing.span('query.cost_check'):
+            check_cost(con, sql_fixed, params)
+        with tracing.span('query.execute') as sp:
+            profiled = sp.recording and _enable_profiling(con)
+            result = con.execute(sql_fixed, params) if params else con.execute(sql_fixed)
+            with tracing.span('query.to_pandas') as conversion:
+                df = result.df()
+                conversion.set_attributes(rows=len(df), columns=len(df.columns))
+            if profiled:
+                sp.set_attributes(**profile_metrics(con))
+    truncated = max_rows is not None and len(df) > max_rows
+    if truncated:
+        df = df.iloc[:max_rows]
+    df.attrs['truncated'] = truncated
+    if approximate:
+        df.attrs['sample'] = sample
+    return df
+
+
+def open_result(kind_name, sql_query, filters=None, page_size=None, on_cursor=None, approximate=False):
+    """Start a query and return its result as a pageable Arrow stream.
+
+    Only the first page is fetched here; later pages are read from DuckDB
+    when requested, so time to first row and memory do not grow with the
+    result size.
+
+    Args:
+        kind_name (str): name of the kind, or a list of kinds as for execute_query.
+        sql_query (str): SQL as for execute_query.
+        filters (dict): structured filters as for execute_query.
+        page_size (int): rows per page; defaults to query_result.DEFAULT_PAGE_SIZE.
+        on_cursor (callable): as for execute_query.
+        approximate (bool): as for execute_query; the result's `sample`
+            then describes the sampling.
+
+    Returns:
+        query_result.QueryResult: owns its cursor until closed or exhausted.
     """
-    datasets_dir = os.path.join('domain', 'catalog', 'datasets')
-    parquet_path = os.path.join(datasets_dir, kind_name, 'latest.parquet')
-    if not os.path.exists(parquet_path):
-        raise FileNotFoundError(f"Parquet file not found for kind '{kind_name}': {parquet_path}")
+    from insight_agent import tracing
+    from insight_agent.query_result import QueryResult, DEFAULT_PAGE_SIZE
 
-    # Use duckdb to run SQL directly on the parquet file
-    con = duckdb.connect(database=':memory:')
+    with tracing.span('query.prepare', kind=kind_name) as sp:
+        sql_fixed, params, sample, rollup = _prepare(kind_name, sql_query, filters, None, approximate)
+        sp.set_attributes(rollup=rollup is not None, sampled=sample is not None, filters=len(params))
+    con = get_manager().open_cursor(kind_name)
     try:
-        # Normalize path for SQL
-        parquet_sql_path = parquet_path.replace('\\','/')
-        # Create a view named 'data' that reads from the parquet file
-        con.execute(f"CREATE VIEW data AS SELECT * FROM read_parquet('{parquet_sql_path}')")
-
-        # Replace table references in the incoming SQL to point to 'data'
-        import re
-        def replace_from(match):
-            # match.group(1) is the FROM keyword + whitespace
-            # match.group(2) is the table identifier (may be quoted/backticked)
-            from_kw = match.group(1)
-            # replace with FROM data
-            return f"{from_kw}data"
-
-        # Use a regex to find FROM <identifier> (handles backticks, quotes, brackets, schema.table).
-        # Match patterns like: FROM `my table`, FROM "my table", FROM 'my table', FROM [my table], FROM schema.table, FROM table
-        pattern = r"(FROM\s+)(`[^`]+`|\"[^\"]+\"|'[^']+'|\[[^\]]+\]|[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?)"
-        sql_fixed = re.sub(pattern, replace_from, sql_query, flags=re.IGNORECASE)
-
-        df = con.execute(sql_fixed).df()
-        return df
-    finally:
+        if on_cursor is not None:
+            on_cursor(con)
+        with tracing.span('query.cost_check'):
+            check_cost(con, sql_fixed, params)
+        with tracing.span('query.first_page') as sp:
+            profiled = sp.recording and _enable_profiling(con)
+            result = QueryResult(kind_name, sql_fixed, params, page_size or DEFAULT_PAGE_SIZE, con)
+            result.profiled = profiled
+            result.sample = sample
+            # Read here, on the caller's thread (a pool worker when run through submit)
+            result._fill(result.page_size + 1)
+            page = result.page(0)
+            # DuckDB reports a query's profile once it has run to the end
+            sp.set_attributes(rows=page.num_rows, complete=result.complete, **result.profile)
+    except BaseException:
         con.close()
+        raise
+    return result
@@ -0,0 +1,306 @@
+import os
+import time
+import uuid
+import functools
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+
+# Queries executing at once; DuckDB already parallelises each query.
+DEFAULT_WORKERS = 2
+# Queries allowed to wait for a worker before new ones are turned away.
+DEFAULT_QUEUE_SIZE = 8
+# Wall-clock seconds a query may run before it is interrupted.
+DEFAULT_TIMEOUT = 60.0
+# Recent run times kept for the metrics.
+RUN_TIME_WINDOW = 200
+
+
+class QueryQueueFull(RuntimeError):
+    """Raised when the pool has no worker or queue slot for another query."""
+
+
+class QueryCancelled(RuntimeError):
+    """Raised by QueryHandle.result() for a query cancelled by the user."""
+
+
+class QueryTimeout(TimeoutError):
+    """Raised by QueryHandle.result() for a query interrupted at its timeout."""
+
+
+class QueryHandle:
+    """A submitted query: its state, timings and the cursor running it."""
+
+    def __init__(self, kind_name, sql, timeout, approximate=False):
+        self.id = uuid.uuid4().hex
+        self.kind_name = kind_name
+        self.sql = sql
+        self.timeout = timeout
+        self.approximate = approximate
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.status = 'queued'
+        self.future = None
+        self._lock = threading.Lock()
+        self._cursor = None
+        self._stop_reason = None
+
+    @property
+    def queued_s(self):
+        end = self.started_at or self.finished_at or time.monotonic()
+        return end - self.submitted_at
+
+    @property
+    def run_s(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    def _attach(self, cursor):
+        with self._lock:
+            stop = self._stop_reason
+            if not stop:
+                self._cursor = cursor
+        # Stopped before the query started: don't run it at all, since an
+        # interrupt() on an idle cursor is lost and the query would run on
+        if stop == 'timeout':
+            raise QueryTimeout(f"Query exceeded the {self.timeout:g}s time limit and was stopped.")
+        if stop == 'cancel':
+            raise QueryCancelled('Query was cancelled.')
+
+    def _stop(self, reason):
+        with self._lock:
+            if self._stop_reason or self.finished_at is not None:
+                return False
+            self._stop_reason = reason
+            cursor = self._cursor
+        if cursor is not None:
+            try:
+                cursor.interrupt()
+            except Exception:
+                # The query finished and its cursor closed meanwhile
+                pass
+        return True
+
+    def result(self, timeout=None):
+        """Wait for the query and return its DataFrame (or QueryResult).
+
+        Raises:
+            QueryCancelled, QueryTimeout, or the query's own error.
+        """
+        try:
+            return self.future.result(timeout)
+        except CancelledError:
+            raise QueryCancelled('Query was cancelled before it started.')
+
+
+class QueryPool:
+    """Runs queries on a fixed set of worker threads with admission control.
+
+    At most `workers` queries execute at once and `queue_size` more may wait;
+    beyond that submit() raises QueryQueueFull instead of oversubscribing
+    the machine. Each query gets a wall-clock timeout enforced with DuckDB's
+    interrupt(), and can be cancelled by id. Memory and thread limits stay
+    per kind database (ConnectionManager.configure), since DuckDB scopes them
+    to a database rather than a query.
+
+    Args:
+        workers (int): concurrent queries.
+        queue_size (int): queries waiting for a worker.
+        timeout (float): default seconds before a running query is interrupted.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE, timeout=DEFAULT_TIMEOUT):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='query')
+        self._lock = threading.Lock()
+        self._handles = {}
+        self._run_times = deque(maxlen=RUN_TIME_WINDOW)
+        self._counts = {'completed': 0, 'failed': 0, 'cancelled': 0, 'timed_out': 0, 'rejected': 0}
+
+    def submit(self, kind_name, sql, filters=None, max_rows=None, timeout=None, page_size=None, approximate=False):
+        """Queue a query for execution.
+
+        Args:
+            kind_name (str): name of the kind, or a list of kinds to join.
+            sql (str): SQL to run (see query_executor.execute_query).
+            filters (dict): structured filters applied server-side.
+            max_rows (int): display row cap.
+            timeout (float): seconds before the query is interrupted; defaults
+                to the pool's timeout, 0 or None disables it.
+            page_size (int): if set, the handle's result is a pageable
+                query_result.QueryResult with its first page fetched, instead
+                of a DataFrame.
+            approximate (bool): answer from the kind's sample when possible
+                (see query_executor.prepare_approximate).
+
+        Returns:
+            QueryHandle: poll done() or block on result().
+
+        Raises:
+            QueryQueueFull: if every worker and queue slot is taken.
+        """
+        handle = QueryHandle(kind_name, sql, self.timeout if timeout is None else timeout, approximate)
+        return self._admit(handle, functools.partial(_query, handle, filters, max_rows, page_size))
+
+    def submit_call(self, kind_name, sql, work, timeout=None):
+        """Queue other work on a kind's data under the same admission control.
+
+        Used for the follow-up passes over a query (see query_result.QueryResult),
+        so they share the workers, the timeout and cancellation with queries.
+
+        Args:
+            kind_name (str): kind the work runs against.
+            sql (str): the SQL it runs, for display and tracing.
+            work (callable): called as work(on_cursor) on a worker; it must pass
+                each DuckDB cursor it opens to on_cursor before using it.
+            timeout (float): as for submit().
+
+        Returns:
+            QueryHandle: result() returns what work returned.
+
+        Raises:
+            QueryQueueFull: if every worker and queue slot is taken.
+        """
+        handle = QueryHandle(kind_name, sql, self.timeout if timeout is None else timeout)
+        return self._admit(handle, work)
+
+    def _admit(self, handle, work):
+        with self._lock:
+            pending = sum(1 for h in self._handles.values() if h.finished_at is None)
+            if pending >= self.workers + self.queue_size:
+                self._counts['rejected'] += 1
+                raise QueryQueueFull(f"{pending} queries are already queued or running; try again shortly.")
+            self._handles[handle.id] = handle
+            # Run in a copy of the caller's context so its trace span is the query's parent
+            handle.future = self._executor.submit(contextvars.copy_context().run, self._run, handle, work)
+        return handle
+
+    def _run(self, handle, work):
+        from insight_agent import tracing
+
+        with tracing.span('query', kind=handle.kind_name) as sp:
+            sp.set_attribute('queued_ms', round(handle.queued_s * 1000, 3))
+            return self._execute(handle, work)
+
+    def _execute(self, handle, work):
+        handle.started_at = time.monotonic()
+        handle.status = 'running'
+        timer = None
+        status = 'failed'
+        if handle.timeout:
+            timer = threading.Timer(handle.timeout, handle._stop, args=('timeout',))
+            timer.daemon = True
+            timer.start()
+        try:
+            result = work(handle._attach)
+            status = 'completed'
+            return result
+        except Exception as exc:
+            if handle._stop_reason == 'timeout':
+                status = 'timed_out'
+                raise QueryTimeout(f"Query exceeded the {handle.timeout:g}s time limit and was stopped.") from exc
+            if handle._stop_reason == 'cancel':
+                status = 'cancelled'
+                raise QueryCancelled('Query was cancelled.') from exc
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+            with handle._lock:
+                handle.finished_at = time.monotonic()
+                handle._cursor = None
+            handle.status = status
+            self._finish(handle, status)
+
+    def _finish(self, handle, status):
+        with self._lock:
+            self._counts[status] += 1
+            if handle.started_at is not None:
+                self._run_times.append(handle.run_s)
+            self._handles.pop(handle.id, None)
+
+    def get(self, query_id):
+        """Return the handle of a queued or running query, or None."""
+        with self._lock:
+            return self._handles.get(query_id)
+
+    def cancel(self, query_id):
+        """Cancel a queued query or interrupt a running one.
+
+        Returns:
+            bool: True if the query was still pending.
+        """
+        handle = self.get(query_id)
+        if handle is None:
+            return False
+        if handle.future.cancel():
+            with handle._lock:
+                handle.finished_at = time.monotonic()
+            handle.status = 'cancelled'
+            self._finish(handle, 'cancelled')
+            return True
+        return handle._stop('cancel')
+
+    def stats(self):
+        """Queue depth, running queries, outcome counters and run-time figures."""
+        with self._lock:
+            handles = list(self._handles.values())
+            run_times = sorted(self._run_times)
+            counts = dict(self._counts)
+        running = [h for h in handles if h.started_at is not None]
+        stats = {
+            'workers': self.workers,
+            'queue_depth': len(handles) - len(running),
+            'running': len(running),
+            'longest_running_s': round(max((h.run_s for h in running), default=0.0), 3),
+        }
+        stats.update(counts)
+        if run_times:
+            stats['avg_run_s'] = round(sum(run_times) / len(run_times), 3)
+            stats['p95_run_s'] = round(run_times[min(len(run_times) - 1, int(0.95 * len(run_times)))], 3)
+        return stats
+
+    def shutdown(self):
+        """Interrupt running queries and stop the workers."""
+        with self._lock:
+            handles = list(self._handles.values())
+        for handle in handles:
+            self.cancel(handle.id)
+        self._executor.shutdown(wait=True)
+
+
+def _query(handle, filters, max_rows, page_size, on_cursor):
+    from insight_agent.query_executor import execute_query, open_result
+
+    if page_size:
+        return open_result(handle.kind_name, handle.sql, filters=filters, page_size=page_size,
+                           on_cursor=on_cursor, approximate=handle.approximate)
+    return execute_query(handle.kind_name, handle.sql, filters=filters, max_rows=max_rows,
+                         on_cursor=on_cursor, approximate=handle.approximate)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide QueryPool.
+
+    QUERY_WORKERS, QUERY_QUEUE_SIZE and QUERY_TIMEOUT override the defaults.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = QueryPool(workers=int(os.environ.get('QUERY_WORKERS', DEFAULT_WORKERS)),
+                              queue_size=int(os.environ.get('QUERY_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)),
+                              timeout=float(os.environ.get('QUERY_TIMEOUT', DEFAULT_TIMEOUT)))
+        return _pool
@@ -0,0 +1,226 @@
+import os
+import functools
+import threading
+
+import pyarrow as pa
+
+
+# Rows per page shown on the Ask page (and per Arrow batch fetched).
+DEFAULT_PAGE_SIZE = 1000
+
+
+def _reader(con, sql, params, batch_size):
+    """Stream a query's result as an Arrow RecordBatchReader."""
+    result = con.execute(sql, params) if params else con.execute(sql)
+    # to_arrow_reader replaced fetch_record_batch in newer DuckDB releases
+    to_reader = getattr(result, 'to_arrow_reader', None) or result.fetch_record_batch
+    return to_reader(batch_size)
+
+
+class QueryResult:
+    """A query result held as Arrow record batches and read page by page.
+
+    Batches are fetched from the DuckDB cursor only when a page needs them
+    and kept as-is; pages are zero-copy slices of them. The cursor is closed
+    as soon as the stream is exhausted, or by close() when the result is
+    dropped. Counting all rows and exporting the full result re-run the
+    query on separate cursors, streaming batches, so neither needs the whole
+    result in memory. Fetches, counts and exports all run on the query pool,
+    sharing its workers, timeout and cancellation with other queries.
+
+    Args:
+        kind_name (str): kind (or list of kinds) the query runs against.
+        sql (str): prepared SQL (see query_executor.prepare_query).
+        params (list): bound parameters of the SQL.
+        page_size (int): rows per page.
+        con: open cursor to stream from; owned by the result from now on.
+    """
+
+    def __init__(self, kind_name, sql, params, page_size=DEFAULT_PAGE_SIZE, con=None):
+        self.kind_name = kind_name
+        self.sql = sql
+        self.params = list(params or [])
+        self.page_size = page_size
+        self._lock = threading.Lock()
+        self._con = con
+        self._reader = _reader(con, sql, self.params, page_size) if con is not None else None
+        self._batches = []
+        self._rows = 0
+        self._total = None
+        self.schema = self._reader.schema if self._reader is not None else None
+        self.complete = self._reader is None
+        # Set when DuckDB profiling is on for the cursor; profile then holds
+        # query_executor.profile_metrics once the stream is exhausted.
+        self.profiled = False
+        self.profile = {}
+        # Set by query_executor.open_result for an answer from the kind's
+        # sample (see sampling.route); None for exact results.
+        self.sample = None
+
+    @classmethod
+    def from_table(cls, table, page_size=DEFAULT_PAGE_SIZE):
+        """Wrap an already materialised Arrow table (e.g. a cached result)."""
+        result = cls(None, None, None, page_size)
+        result.schema = table.schema
+        result._batches = table.to_batches()
+        result._rows = table.num_rows
+        result._total = table.num_rows
+        return result
+
+    def _fill(self, rows):
+        while self._reader is not None and self._rows < rows:
+            try:
+                batch = self._reader.read_next_batch()
+            except StopIteration:
+                self._finish()
+                break
+            self._batches.append(batch)
+            self._rows += batch.num_rows
+
+    def _fetch(self, rows):
+        """Read batches until `rows` are held, on a query pool worker.
+
+        The reads go through the pool like the query itself, so they share
+        its workers, timeout and cancellation; a read that is stopped
+        releases the cursor and the result keeps the rows it already has.
+        """
+        if self._reader is None or self._rows >= rows:
+            return
+        from insight_agent.query_pool import get_pool
+
+        get_pool().submit_call(self.kind_name, self.sql, functools.partial(self._fill_on, rows)).result()
+
+    def _fill_on(self, rows, on_cursor):
+        try:
+            on_cursor(self._con)
+            self._fill(rows)
+        except BaseException:
+            self._release()
+            raise
+
+    def _finish(self):
+        self.complete = True
+        self._total = self._rows
+        if self.profiled and self._con is not None:
+            from insight_agent.query_executor import profile_metrics
+
+            self.profile = profile_metrics(self._con)
+        self._release()
+
+    def _release(self):
+        self._reader = None
+        if self._con is not None:
+            self._con.close()
+            self._con = None
+
+    @property
+    def fetched_rows(self):
+        return self._rows
+
+    def page(self, number):
+        """Rows of page `number` (0-based) as an Arrow table; empty past the end."""
+        with self._lock:
+            self._fetch((number + 1) * self.page_size + 1)
+            table = pa.Table.from_batches(self._batches, schema=self.schema)
+        return table.slice(number * self.page_size, self.page_size)
+
+    def has_page(self, number):
+        with self._lock:
+            self._fetch(number * self.page_size + 1)
+            return self._rows > number * self.page_size
+
+    def total_rows(self):
+        """Number of rows in the full result, counted without fetching it.
+
+        Raises:
+            query_pool.QueryQueueFull, QueryTimeout or QueryCancelled.
+        """
+        if self._total is None:
+            from insight_agent.query_pool import get_pool
+
+            count_sql = f"SELECT COUNT(*) FROM ({self.sql}) AS result"
+            self._total = get_pool().submit_call(self.kind_name, count_sql,
+                                                 functools.partial(self._count, count_sql)).result()
+        return self._total
+
+    def _count(self, count_sql, on_cursor):
+        from insight_agent.connection_manager import get_manager
+
+        with get_manager().cursor(self.kind_name) as con:
+            on_cursor(con)
+            return (con.execute(count_sql, self.params) if self.params else con.execute(count_sql)).fetchone()[0]
+
+    def to_table(self):
+        """The full result as one Arrow table (only for complete results)."""
+        if not self.complete:
+            raise ValueError('Result has not been fetched completely.')
+        return pa.Table.from_batches(self._batches, schema=self.schema)
+
+    def iter_batches(self, on_cursor=None):
+        """Stream the full result as record batches from a fresh cursor.
+
+        Args:
+            on_cursor (callable): receives the cursor before the query runs,
+                as for query_executor.execute_query. Without it the query
+                pool's timeout interrupts the query instead.
+        """
+        if self.sql is None:
+            yield from self._batches
+            return
+        from insight_agent.connection_manager import get_manager
+        from insight_agent.query_pool import get_pool
+
+        with get_manager().cursor(self.kind_name) as con:
+            timer = None
+            if on_cursor is not None:
+                on_cursor(con)
+            elif get_pool().timeout:
+                timer = threading.Timer(get_pool().timeout, con.interrupt)
+                timer.daemon = True
+                timer.start()
+            try:
+                yield from _reader(con, self.sql, self.params, max(self.page_size, 64 * 1024))
+            finally:
+                if timer is not None:
+                    timer.cancel()
+
+    def export(self, path, fmt='parquet'):
+        """Write the full result to a Parquet or CSV file, batch by batch.
+
+        The query re-runs on a query pool worker.
+
+        Returns:
+            str: the path written.
+
+        Raises:
+            ValueError: for an unsupported format.
+            query_pool.QueryQueueFull, QueryTimeout or QueryCancelled.
+        """
+        from insight_agent.query_pool import get_pool
+
+        if fmt not in ('parquet', 'csv'):
+            raise ValueError(f"Unsupported export format '{fmt}'.")
+        if self.sql is None:
+            return self._write(path, fmt, None)
+        return get_pool().submit_call(self.kind_name, self.sql, functools.partial(self._write, path, fmt)).result()
+
+    def _write(self, path, fmt, on_cursor):
+        import pyarrow.csv as pacsv
+        import pyarrow.parquet as pq
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if fmt == 'parquet':
+            writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+        else:
+            writer = pacsv.CSVWriter(path, self.schema)
+        try:
+            for batch in self.iter_batches(on_cursor):
+                writer.write_batch(batch)
+        finally:
+            writer.close()
+        return path
+
+    def close(self):
+        """Release the cursor of a partially read result."""
+        with self._lock:
+            self._release()
@@ -0,0 +1,250 @@
+import os
+import re
+import json
+import time
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+CACHE_DIR = os.path.join('domain', 'cache')
+# Total bytes of cached result files kept on disk before LRU eviction.
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Number of prompt -> SQL entries kept before LRU eviction.
+DEFAULT_MAX_SQL_ENTRIES = 2000
+# Seconds between writes of an index whose only change is the recency of hits;
+# puts write it straight away.
+RECENCY_FLUSH_SECONDS = 60.0
+
+
+def _file_token(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def mapping_token(kind_name):
+    """Token that changes whenever the kind's mapping or description changes (latest version)."""
+    from insight_agent.catalog import get_catalog
+
+    base = os.path.join('domain', 'catalog', 'kinds', kind_name, get_catalog().latest_version(kind_name))
+    return [_file_token(os.path.join(base, 'mapping_effective.json')),
+            _file_token(os.path.join(base, 'description.md'))]
+
+
+def dataset_token(kind_name):
+    """Token that changes whenever the kind's dataset changes.
+
+    Raises:
+        FileNotFoundError: if the kind has no dataset.
+    """
+    from insight_agent.dataset_store import scan_source
+    from insight_agent.connection_manager import dataset_fingerprint
+
+    from_sql, fingerprint_path = scan_source(kind_name)
+    return [from_sql, list(dataset_fingerprint(fingerprint_path))]
+
+
+def normalize_sql(sql):
+    """Normalise SQL text for use in a cache key.
+
+    Whitespace outside string literals is collapsed and trailing semicolons
+    are dropped, so formatting differences in LLM output share one entry.
+    """
+    parts = re.split(r"('(?:[^']|'')*')", sql or '')
+    out = []
+    for i, part in enumerate(parts):
+        out.append(part if i % 2 else re.sub(r'\s+', ' ', part))
+    return ''.join(out).strip().rstrip(';').strip()
+
+
+def _key(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Two-level cache for the ask pipeline, persisted under domain/cache.
+
+    Level one maps a prompt to the SQL the LLM generated for it; level two maps
+    canonical (parsed) SQL to its result, stored as a parquet file. Keys include the
+    kind's mapping token, and result keys the dataset token, so entries are
+    never served after the mapping or the data changes. Both levels evict the
+    least recently used entries, results when their total size exceeds
+    max_bytes. Hits only update recency in memory; it reaches disk with the
+    next put, or at most every RECENCY_FLUSH_SECONDS (see flush).
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, max_sql_entries=DEFAULT_MAX_SQL_ENTRIES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_sql_entries = max_sql_entries
+        self._lock = threading.Lock()
+        self._results_dir = os.path.join(root, 'results')
+        self._sql_index_path = os.path.join(root, 'sql_index.json')
+        self._result_index_path = os.path.join(root, 'result_index.json')
+        self._sql = self._load_index(self._sql_index_path)
+        self._results = self._load_index(self._result_index_path)
+        self.hits = {'sql': 0, 'result': 0}
+        self.misses = {'sql': 0, 'result': 0}
+        # Index path -> monotonic time of its last write, for indexes with unsaved recency
+        self._dirty = {}
+
+    @staticmethod
+    def _load_index(path):
+        try:
+            with open(path, 'r') as fh:
+                entries = json.load(fh)
+        except Exception:
+            entries = {}
+        return OrderedDict(sorted(entries.items(), key=lambda kv: kv[1].get('last_access', 0)))
+
+    def _save_index(self, path, index):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as fh:
+            json.dump(index, fh)
+        os.replace(tmp_path, path)
+        self._dirty.pop(path, None)
+
+    def _touch(self, path, index, key):
+        """Mark a hit; the index is written only if its recency has waited long enough."""
+        index.move_to_end(key)
+        index[key]['last_access'] = time.time()
+        now = time.monotonic()
+        since = self._dirty.setdefault(path, now)
+        if now - since >= RECENCY_FLUSH_SECONDS:
+            self._save_index(path, index)
+
+    def flush(self):
+        """Write indexes whose hit recency has not been saved yet."""
+        with self._lock:
+            for path, index in ((self._sql_index_path, self._sql), (self._result_index_path, self._results)):
+                if path in self._dirty:
+                    self._save_index(path, index)
+
+    def get_sql(self, kind_name, prompt):
+        """Return cached SQL for a prompt, or None."""
+        key = _key('sql', kind_name, mapping_token(kind_name), prompt)
+        with self._lock:
+            entry = self._sql.get(key)
+            if entry is None:
+                self.misses['sql'] += 1
+                return None
+            self.hits['sql'] += 1
+            self._touch(self._sql_index_path, self._sql, key)
+            return entry['sql']
+
+    def put_sql(self, kind_name, prompt, sql):
+        """Remember the SQL generated for a prompt."""
+        if not sql:
+            return
+        key = _key('sql', kind_name, mapping_token(kind_name), prompt)
+        with self._lock:
+            self._sql[key] = {'kind': kind_name, 'sql': sql, 'last_access': time.time()}
+            self._sql.move_to_end(key)
+            while len(self._sql) > self.max_sql_entries:
+                self._sql.popitem(last=False)
+            self._save_index(self._sql_index_path, self._sql)
+
+    def _result_key(self, kind_name, sql, filters=None):
+        from insight_agent.sql_analyzer import canonical_sql
+
+        scope = sorted((str(k), str(v)) for k, v in (filters or {}).items())
+        # Parsed SQL ignores formatting and the table name the LLM picked
+        text = canonical_sql(sql) or normalize_sql(sql)
+        return _key('result', kind_name, mapping_token(kind_name), dataset_token(kind_name), text, scope)
+
+    def get_result(self, kind_name, sql, filters=None):
+        """Return a cached result DataFrame for SQL (and filters) on the kind's current data, or None."""
+        import pyarrow.parquet as pq
+
+        try:
+            key = self._result_key(kind_name, sql, filters)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            entry = self._results.get(key)
+            path = os.path.join(self._results_dir, entry['file']) if entry else None
+            if entry is None or not os.path.exists(path):
+                self._results.pop(key, None)
+                self.misses['result'] += 1
+                return None
+            self.hits['result'] += 1
+            self._touch(self._result_index_path, self._results, key)
+        return pq.read_table(path).to_pandas()
+
+    def put_result(self, kind_name, sql, df, filters=None):
+        """Store a query result; evicts least recently used results over max_bytes."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        try:
+            key = self._result_key(kind_name, sql, filters)
+        except FileNotFoundError:
+            return
+        os.makedirs(self._results_dir, exist_ok=True)
+        file_name = key + '.parquet'
+        path = os.path.join(self._results_dir, file_name)
+        tmp_path = path + '.tmp'
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path, compression='zstd')
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        if size > self.max_bytes:
+            os.remove(path)
+            return
+        with self._lock:
+            self._results[key] = {'kind': kind_name, 'file': file_name, 'bytes': size, 'last_access': time.time()}
+            self._results.move_to_end(key)
+            total = sum(e['bytes'] for e in self._results.values())
+            while total > self.max_bytes and len(self._results) > 1:
+                _, old = self._results.popitem(last=False)
+                total -= old['bytes']
+                old_path = os.path.join(self._results_dir, old['file'])
+                if os.path.exists(old_path):
+                    os.remove(old_path)
+            self._save_index(self._result_index_path, self._results)
+
+    def stats(self):
+        """Hit/miss counters and current sizes of both levels."""
+        with self._lock:
+            return {
+                'hits': dict(self.hits),
+                'misses': dict(self.misses),
+                'sql_entries': len(self._sql),
+                'result_entries': len(self._results),
+                'result_bytes': sum(e['bytes'] for e in self._results.values()),
+            }
+
+    def clear(self):
+        """Drop every cached entry."""
+        with self._lock:
+            for entry in self._results.values():
+                path = os.path.join(self._results_dir, entry['file'])
+                if os.path.exists(path):
+                    os.remove(path)
+            self._sql.clear()
+            self._results.clear()
+            self._save_index(self._sql_index_path, self._sql)
+            self._save_index(self._result_index_path, self._results)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide ResultCache.
+
+    RESULT_CACHE_MAX_BYTES overrides the on-disk size bound.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            max_bytes = int(os.environ.get('RESULT_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+            _cache = ResultCache(max_bytes=max_bytes)
+            # Keep the recency of hits since the last write
+            atexit.register(_cache.flush)
+        return _cache
@@ -0,0 +1,426 @@
+import os
+import copy
+import json
+import threading
+
+
+ROLLUPS_DIR_NAME = 'rollups'
+ROLLUPS_FILE_NAME = 'rollups.json'
+# A rollup level is only kept if it has at most this share of the dataset's rows.
+ROLLUP_MAX_RATIO = 0.5
+# Row-count column of every rollup.
+ROWS_COLUMN = '__rows'
+# Measure aggregates a rollup answers, and the one stored per measure for each.
+_MEASURE_AGGREGATES = {'sum': 'sum', 'min': 'min', 'max': 'max', 'count': 'count', 'avg': None, 'mean': None}
+_INTEGER_TYPES = ('TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'UTINYINT', 'USMALLINT', 'UINTEGER', 'UBIGINT', 'HUGEINT')
+_NUMERIC_TYPES = _INTEGER_TYPES + ('FLOAT', 'DOUBLE', 'DECIMAL')
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class _NotRoutable(Exception):
+    """The query needs rows a rollup does not keep."""
+
+
+def _ident(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _canonical(rec):
+    orig = rec.get('original_name')
+    return rec.get('canonical_name', orig) or orig
+
+
+def rollup_dimensions(mapping):
+    """Dimension columns rolled up, in `rollup_order`.
+
+    A non-measure mapping record with a numeric `rollup_order` is a rollup
+    dimension; blanks are ignored, like filter_display_order. Rollups are
+    built for each prefix of this list, so put the coarsest (most often
+    grouped by) dimensions first.
+    """
+    dims = []
+    for rec in mapping:
+        if 'measure' in str(rec.get('type', '') or '').lower():
+            continue
+        order_val = rec.get('rollup_order')
+        try:
+            if order_val is not None and str(order_val).strip() != '':
+                dims.append((int(order_val), _canonical(rec)))
+        except Exception:
+            continue
+    return [name for _, name in sorted(dims)]
+
+
+def rollup_measures(mapping):
+    """Canonical names of the mapping's measure columns."""
+    return [_canonical(rec) for rec in mapping if 'measure' in str(rec.get('type', '') or '').lower()]
+
+
+def _rollups_path(kind_name):
+    from insight_agent.dataset_store import dataset_dir
+
+    return os.path.join(dataset_dir(kind_name), ROLLUPS_DIR_NAME, ROLLUPS_FILE_NAME)
+
+
+def _measure_select(measures, types, source_is_rollup):
+    """Aggregate expressions of a rollup level over the data or a finer rollup."""
+    parts = []
+    rows = f"SUM({ROWS_COLUMN})" if source_is_rollup else "COUNT(*)"
+    parts.append(f"CAST({rows} AS BIGINT) AS {ROWS_COLUMN}")
+    for m in measures:
+        source = {agg: _ident(f"{m}__{agg}") if source_is_rollup else _ident(m) for agg in ('sum', 'count', 'min', 'max')}
+        total = f"SUM({source['sum']})"
+        # Integer sums stay BIGINT so summing the rollup gives the type summing the data does
+        if types[m] in _INTEGER_TYPES:
+            total = f"CAST({total} AS BIGINT)"
+        count = f"CAST(SUM({source['count']}) AS BIGINT)" if source_is_rollup else f"COUNT({source['count']})"
+        parts.extend([
+            f"{total} AS {_ident(m + '__sum')}",
+            f"{count} AS {_ident(m + '__count')}",
+            f"MIN({source['min']}) AS {_ident(m + '__min')}",
+            f"MAX({source['max']}) AS {_ident(m + '__max')}",
+        ])
+    return ', '.join(parts)
+
+
+def build_rollups(kind_name, mapping):
+    """Materialize the kind's rollups from its committed dataset.
+
+    One rollup is written per prefix of rollup_dimensions(), each holding the
+    row count and the sum, count, min and max of every numeric measure per
+    group. The finest level is aggregated from the dataset in one scan and
+    each coarser level from the level above it. Levels that would not be
+    much smaller than the dataset are skipped.
+
+    Returns:
+        list: metadata of the rollups written (empty when the mapping has
+        no rollup dimensions or measures).
+    """
+    import duckdb
+    from insight_agent.dataset_store import scan_source, load_manifest, dataset_dir, _sql_str
+
+    dims = rollup_dimensions(mapping)
+    path = _rollups_path(kind_name)
+    manifest = load_manifest(kind_name) or {}
+    previous = _read(path)
+    if not dims:
+        _remove(kind_name, previous, keep=())
+        return []
+
+    from_sql, _ = scan_source(kind_name)
+    con = duckdb.connect(database=':memory:')
+    try:
+        con.execute(f"CREATE VIEW data AS SELECT * FROM {from_sql}")
+        types = {name: dtype for name, dtype, *_ in con.execute("DESCRIBE data").fetchall()}
+        measures = [m for m in rollup_measures(mapping) if str(types.get(m, '')).split('(')[0] in _NUMERIC_TYPES]
+        dims = [d for d in dims if d in types]
+        if not dims or not measures:
+            _remove(kind_name, previous, keep=())
+            return []
+
+        source_rows = manifest.get('rows') or con.execute("SELECT COUNT(*) FROM data").fetchone()[0]
+        version = manifest.get('version', 0)
+        rollups_dir = os.path.dirname(path)
+        os.makedirs(rollups_dir, exist_ok=True)
+        written = []
+        source, source_is_rollup = 'data', False
+        for level in range(len(dims), 0, -1):
+            level_dims = dims[:level]
+            name = f"rollup_{level}"
+            rel_path = f"{ROLLUPS_DIR_NAME}/v{version:06d}-{level}.parquet"
+            out_path = os.path.join(dataset_dir(kind_name), rel_path)
+            keys = ', '.join(_ident(d) for d in level_dims)
+            con.execute(
+                f"COPY (SELECT {keys}, {_measure_select(measures, types, source_is_rollup)} FROM {source} "
+                f"GROUP BY {keys} ORDER BY {keys}) TO {_sql_str(out_path)} (FORMAT parquet, COMPRESSION zstd)")
+            rows = con.execute(f"SELECT COUNT(*) FROM read_parquet({_sql_str(out_path)})").fetchone()[0]
+            source, source_is_rollup = f"read_parquet({_sql_str(out_path)})", True
+            if rows > ROLLUP_MAX_RATIO * source_rows:
+                os.remove(out_path)
+                source, source_is_rollup = 'data', False
+                continue
+            written.append({'name': name, 'file': rel_path, 'dimensions': level_dims, 'rows': rows})
+    finally:
+        con.close()
+
+    meta = {'dataset_version': version, 'source_rows': source_rows, 'measures': measures,
+            'rollups': list(reversed(written))}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fh:
+        json.dump(meta, fh, indent=2)
+    os.replace(tmp_path, path)
+    _remove(kind_name, previous, keep={r['file'] for r in written})
+    return meta['rollups']
+
+
+def _read(path):
+    try:
+        with open(path, 'r') as fh:
+            return json.load(fh)
+    except Exception:
+        return None
+
+
+def _remove(kind_name, previous, keep):
+    """Delete rollup files of an earlier build that are no longer listed."""
+    from insight_agent.dataset_store import dataset_dir
+
+    if not previous:
+        return
+    if not keep:
+        try:
+            os.remove(_rollups_path(kind_name))
+        except OSError:
+            pass
+    for rollup in previous.get('rollups', []):
+        if rollup['file'] not in keep:
+            try:
+                os.remove(os.path.join(dataset_dir(kind_name), rollup['file']))
+            except OSError:
+                pass
+
+
+def rollups_token(kind_name):
+    """(mtime_ns, size) of the kind's rollup metadata, or None without rollups."""
+    try:
+        st = os.stat(_rollups_path(kind_name))
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def load_rollups(kind_name):
+    """Metadata of the kind's rollups, or None if they do not match the live dataset.
+
+    Rollups of an older dataset version (an onboarding committed after they
+    were built) are ignored, so stale aggregates are never served.
+
+    Returns:
+        dict: dataset_version, source_rows, measures and rollups (each with
+        name, file, dimensions, rows), or None.
+    """
+    from insight_agent.dataset_store import dataset_version
+
+    token = rollups_token(kind_name)
+    if token is None:
+        return None
+    version = dataset_version(kind_name)
+    with _cache_lock:
+        cached = _cache.get(kind_name)
+        if cached is None or cached[0] != (token, version):
+            meta = _read(_rollups_path(kind_name))
+            if not meta or meta.get('dataset_version') != version or not meta.get('rollups'):
+                meta = None
+            _cache[kind_name] = cached = ((token, version), meta)
+    return cached[1]
+
+
+def _column(node):
+    names = node.get('column_names') or []
+    if not names or len(names) > 2:
+        raise _NotRoutable()
+    return names[-1]
+
+
+def _function(name, children, alias=''):
+    return {'class': 'FUNCTION', 'type': 'FUNCTION', 'alias': alias, 'query_location': 0, 'function_name': name,
+            'schema': '', 'children': children, 'filter': None,
+            'order_bys': {'type': 'ORDER_MODIFIER', 'orders': []}, 'distinct': False,
+            'is_operator': name in ('/',), 'export_state': False, 'catalog': ''}
+
+
+def _cast(child, type_id, alias=''):
+    return {'class': 'CAST', 'type': 'OPERATOR_CAST', 'alias': alias, 'query_location': 0, 'child': child,
+            'cast_type': {'id': type_id, 'type_info': None}, 'try_cast': False}
+
+
+def _ref(template, column):
+    ref = copy.deepcopy(template) if template else {'class': 'COLUMN_REF', 'type': 'COLUMN_REF', 'alias': '',
+                                                    'query_location': 0, 'column_names': []}
+    ref['column_names'] = (ref['column_names'][:-1] if template else []) + [column]
+    return ref
+
+
+def _rewrite(node, function, measure):
+    """Replace an aggregate over the data by the same aggregate over a rollup, in place."""
+    alias = node.get('alias', '')
+    ref = node['children'][0] if node.get('children') else None
+    if function == 'count_star':
+        new = _cast(_function('sum', [_ref(None, ROWS_COLUMN)]), 'BIGINT', alias)
+    elif function == 'count':
+        new = _cast(_function('sum', [_ref(ref, f"{measure}__count")]), 'BIGINT', alias)
+    elif function in ('avg', 'mean'):
+        total = _cast(_function('sum', [_ref(ref, f"{measure}__sum")]), 'DOUBLE')
+        new = _function('/', [total, _function('sum', [_ref(ref, f"{measure}__count")])], alias)
+    else:
+        new = _function(function, [_ref(ref, f"{measure}__{_MEASURE_AGGREGATES[function]}")], alias)
+    node.clear()
+    node.update(new)
+
+
+class _NodeAnalysis:
+    """Columns and aggregates of one SELECT reading the data directly."""
+
+    def __init__(self, dims, measures, aggregates):
+        self.dims = dims
+        self.measures = measures
+        self.aggregates = aggregates
+        self.used = set()
+        self.rewrites = []
+        self.has_aggregate = False
+
+    def aggregate(self, node):
+        self.has_aggregate = True
+        function = node['function_name'].lower()
+        if node.get('filter') is not None or (node.get('order_bys') or {}).get('orders'):
+            raise _NotRoutable()
+        children = node.get('children') or []
+        if function == 'count_star' and not children:
+            self.rewrites.append((node, function, None))
+            return
+        if len(children) != 1 or children[0].get('class') != 'COLUMN_REF':
+            raise _NotRoutable()
+        column = _column(children[0])
+        if column in self.measures and function in _MEASURE_AGGREGATES and not node.get('distinct'):
+            self.rewrites.append((node, function, column))
+        elif column in self.dims and (function in ('min', 'max') or (function == 'count' and node.get('distinct'))):
+            # Every group of the rollup stands for at least one row
+            self.used.add(column)
+        else:
+            raise _NotRoutable()
+
+    def expression(self, node, aliases=()):
+        if isinstance(node, list):
+            for item in node:
+                self.expression(item, aliases)
+            return
+        if not isinstance(node, dict):
+            return
+        cls = node.get('class')
+        if cls in ('SUBQUERY', 'STAR', 'LAMBDA'):
+            raise _NotRoutable()
+        if cls == 'COLUMN_REF':
+            column = _column(node)
+            if column in self.dims:
+                self.used.add(column)
+            elif len(node['column_names']) != 1 or column not in aliases:
+                raise _NotRoutable()
+            return
+        if cls == 'FUNCTION' and str(node.get('function_name', '')).lower() in self.aggregates:
+            self.aggregate(node)
+            return
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                self.expression(value, aliases)
+
+
+def _analyse(tree, dims, measures):
+    """Find the SELECTs that read the data and check a rollup can answer them.
+
+    Returns:
+        tuple: (select nodes reading the data, their analyses).
+
+    Raises:
+        _NotRoutable: if any read of the data needs its individual rows.
+    """
+    from insight_agent import sql_analyzer
+
+    aggregates = sql_analyzer.aggregate_functions()
+    selects, tables = [], []
+
+    def visit(node):
+        if node.get('type') == 'SELECT_NODE':
+            selects.append(node)
+        elif node.get('type') == 'BASE_TABLE' and node.get('table_name') == sql_analyzer.DATA_TABLE:
+            tables.append(node)
+
+    sql_analyzer._walk(tree, visit)
+    nodes, analyses = [], []
+    for node in selects:
+        table = node.get('from_table') or {}
+        if table.get('type') != 'BASE_TABLE' or table.get('table_name') != sql_analyzer.DATA_TABLE:
+            continue
+        if table.get('sample') is not None or node.get('sample') is not None:
+            raise _NotRoutable()
+        analysis = _NodeAnalysis(dims, measures, aggregates)
+        aliases = {item.get('alias') for item in node.get('select_list', []) if item.get('alias')}
+        pending = []
+        for item in node.get('select_list', []):
+            before = len(analysis.rewrites)
+            analysis.expression(item)
+            if len(analysis.rewrites) > before and not item.get('alias'):
+                # Keep the output name the query would have had on the data
+                pending.append((item, sql_analyzer.expression_name(item)))
+        for key in ('where_clause', 'having', 'qualify'):
+            analysis.expression(node.get(key))
+        analysis.expression(node.get('group_expressions'), aliases)
+        analysis.expression(node.get('modifiers'), aliases)
+        distinct = any(m.get('type') == 'DISTINCT_MODIFIER' for m in node.get('modifiers', []))
+        if not (analysis.has_aggregate or node.get('group_expressions') or distinct):
+            # Plain row reads see one row per group instead of every row
+            raise _NotRoutable()
+        analysis.pending_aliases = pending
+        nodes.append(node)
+        analyses.append(analysis)
+    if not nodes or len(nodes) != len(tables):
+        # The data is also read elsewhere, e.g. inside a join
+        raise _NotRoutable()
+    return nodes, analyses
+
+
+def enabled():
+    """Rollup routing is on unless QUERY_USE_ROLLUPS is '0' or 'false'."""
+    return os.environ.get('QUERY_USE_ROLLUPS', '1').strip().lower() not in ('0', 'false', 'no')
+
+
+def route(kind_name, sql, filter_columns=()):
+    """Point a prepared query at the smallest rollup that answers it exactly.
+
+    A query is routed when every SELECT reading the data groups or
+    aggregates, only references rollup dimensions outside aggregates, and
+    only aggregates measures with SUM, COUNT, MIN, MAX or AVG (plus
+    COUNT(*), and MIN, MAX or COUNT(DISTINCT) of dimensions). Aggregates are
+    rewritten over the rollup's stored sums and counts, keeping the output
+    column names. Anything else runs on the data unchanged.
+
+    Args:
+        kind_name (str): name of the kind.
+        sql (str): SQL from sql_analyzer.prepare (tables resolved to 'data').
+        filter_columns (list): columns of the structured filters, which the
+            rollup must also contain.
+
+    Returns:
+        tuple: (sql, table) where table is the view the query now reads
+        ('data' when it was not routed).
+    """
+    from insight_agent import sql_analyzer
+
+    meta = load_rollups(kind_name) if enabled() else None
+    if not meta:
+        return sql, sql_analyzer.DATA_TABLE
+    all_dims = set().union(*(r['dimensions'] for r in meta['rollups']))
+    try:
+        tree = sql_analyzer.parse(sql)
+        nodes, analyses = _analyse(tree, all_dims, set(meta['measures']))
+        used = set(filter_columns)
+        for analysis in analyses:
+            used |= analysis.used
+        candidates = [r for r in meta['rollups'] if used <= set(r['dimensions'])]
+        if not candidates:
+            return sql, sql_analyzer.DATA_TABLE
+        rollup = min(candidates, key=lambda r: r['rows'])
+        for node, analysis in zip(nodes, analyses):
+            table = node['from_table']
+            if not table.get('alias'):
+                table['alias'] = sql_analyzer.DATA_TABLE
+            table['table_name'] = rollup['name']
+            for item, name in analysis.pending_aliases:
+                item['alias'] = name
+            for agg_node, function, measure in analysis.rewrites:
+                _rewrite(agg_node, function, measure)
+        return sql_analyzer.render(tree), rollup['name']
+    except Exception:
+        # Unroutable or unfamiliar query shape: the data answers it
+        return sql, sql_analyzer.DATA_TABLE
@@ -0,0 +1,353 @@
+import os
+import copy
+import json
+import threading
+
+
+SAMPLE_DIR_NAME = 'sample'
+SAMPLE_FILE_NAME = 'sample.json'
+# View the sample is registered as next to `data` (see connection_manager).
+SAMPLE_TABLE = 'data_sample'
+# Rows the sample aims for; kinds this small relative to it get no sample.
+SAMPLE_ROWS = 100_000
+# A sample is only kept if it holds at most this share of the dataset's rows.
+SAMPLE_MAX_RATE = 0.25
+# Rows drawn (in expectation) from every stratum, so rare filter values still
+# get an estimate. Strata this small are kept whole.
+STRATUM_MIN_ROWS = 30
+# Strata allowed; filterable columns are added while their value combinations stay below it.
+SAMPLE_MAX_STRATA = 1000
+SAMPLE_SEED = 0.42
+# Per-row weight stored with the sample: the stratum's rows over its sampled rows.
+WEIGHT_COLUMN = '__sample_weight'
+# Column added to sampled aggregate results: a rough 95% relative margin from
+# the number of sampled rows behind each result row (see _ERROR_SQL).
+ERROR_COLUMN = 'approx_rel_error'
+CONFIDENCE_Z = 1.96
+
+# Aggregates estimated from the weighted sample, as SQL over the weight and
+# the aggregate's argument (__value).
+_SCALED = {
+    'count_star': f"CAST(ROUND(SUM({WEIGHT_COLUMN})) AS BIGINT)",
+    'count': f"CAST(ROUND(SUM(CASE WHEN __value IS NULL THEN 0 ELSE {WEIGHT_COLUMN} END)) AS BIGINT)",
+    'sum': f"SUM(__value * {WEIGHT_COLUMN})",
+    'avg': f"SUM(__value * {WEIGHT_COLUMN}) / SUM(CASE WHEN __value IS NULL THEN NULL ELSE {WEIGHT_COLUMN} END)",
+}
+_SCALED['mean'] = _SCALED['avg']
+# The relative margin of a count estimated from COUNT(*) sampled rows at the
+# group's overall rate. It ignores the spread of the values summed or averaged
+# and the per-stratum rates, so it only indicates how thin the sample behind a
+# row is: wider for SUM/AVG over skewed values, narrower where strata help.
+_ERROR_SQL = f"{CONFIDENCE_Z} * SQRT(GREATEST(0, 1 - COUNT(*) / SUM({WEIGHT_COLUMN})) / COUNT(*))"
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class _NotSampled(Exception):
+    """The query cannot be answered from the sample."""
+
+
+def _sample_path(kind_name):
+    from insight_agent.dataset_store import dataset_dir
+
+    return os.path.join(dataset_dir(kind_name), SAMPLE_DIR_NAME, SAMPLE_FILE_NAME)
+
+
+def strata_columns(mapping, profile):
+    """Filterable columns the sample is stratified on, in filter_display_order.
+
+    Columns are taken while the product of their distinct counts (from the
+    profile) stays within SAMPLE_MAX_STRATA; a column with more values than
+    that on its own is skipped.
+    """
+    from insight_agent.profiler import filterable_columns
+
+    columns = []
+    strata = 1
+    filterable = filterable_columns(mapping)
+    for name in sorted(filterable, key=filterable.get):
+        info = (profile or {}).get(name)
+        if not isinstance(info, dict):
+            continue
+        # NULL is a stratum of its own
+        distinct = int(info.get('distinct_estimate') or 0) + (1 if info.get('null_count') else 0)
+        if distinct < 2 or strata * distinct > SAMPLE_MAX_STRATA:
+            continue
+        columns.append(name)
+        strata *= distinct
+    return columns
+
+
+def build_sample(kind_name, mapping, profile=None):
+    """Draw the kind's stratified sample from its committed dataset.
+
+    Rows are drawn independently per stratum (the combinations of
+    strata_columns) at the overall rate SAMPLE_ROWS / rows, raised so every
+    stratum expects at least STRATUM_MIN_ROWS rows. Each sampled row stores
+    its stratum's rows over its sampled rows as WEIGHT_COLUMN, so weighted
+    counts per stratum equal the dataset's exactly. Kinds too small to
+    benefit get no sample.
+
+    Returns:
+        dict: metadata of the sample written, or None.
+    """
+    import duckdb
+    from insight_agent.dataset_store import scan_source, load_manifest, dataset_dir, _sql_str, _ident
+
+    path = _sample_path(kind_name)
+    manifest = load_manifest(kind_name) or {}
+    previous = _read(path)
+    from_sql, _ = scan_source(kind_name)
+    con = duckdb.connect(database=':memory:')
+    try:
+        con.execute(f"CREATE VIEW data AS SELECT * FROM {from_sql}")
+        columns = [name for name, *_ in con.execute("DESCRIBE data").fetchall()]
+        source_rows = manifest.get('rows') or con.execute("SELECT COUNT(*) FROM data").fetchone()[0]
+        rate = SAMPLE_ROWS / source_rows if source_rows else 1.0
+        if rate > SAMPLE_MAX_RATE or WEIGHT_COLUMN in columns:
+            _remove(kind_name, previous, keep=None)
+            return None
+
+        strata = [c for c in strata_columns(mapping, profile) if c in columns]
+        keys = ', '.join(_ident(c) for c in strata)
+        on = ' AND '.join(f"d.{_ident(c)} IS NOT DISTINCT FROM s.{_ident(c)}" for c in strata) or 'TRUE'
+        version = manifest.get('version', 0)
+        rel_path = f"{SAMPLE_DIR_NAME}/v{version:06d}.parquet"
+        out_path = os.path.join(dataset_dir(kind_name), rel_path)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        con.execute("SELECT setseed(?)", [SAMPLE_SEED])
+        con.execute(
+            f"CREATE TABLE strata AS SELECT {keys + ', ' if keys else ''}COUNT(*) AS __stratum_rows "
+            f"FROM data{' GROUP BY ALL' if keys else ''}")
+        # The draw is made per data row below the filter; a bare random() in
+        # the WHERE clause is pushed down to the strata side of the join.
+        con.execute(
+            f"CREATE TABLE picked AS SELECT * EXCLUDE (__draw) FROM ("
+            f"SELECT d.*, s.__stratum_rows, random() AS __draw FROM data d JOIN strata s ON {on}) "
+            f"WHERE __draw < GREATEST({rate!r}, {STRATUM_MIN_ROWS} / __stratum_rows)")
+        con.execute(
+            f"COPY (SELECT * EXCLUDE (__stratum_rows), "
+            f"__stratum_rows / COUNT(*) OVER ({'PARTITION BY ' + keys if keys else ''}) AS {WEIGHT_COLUMN} "
+            f"FROM picked) TO {_sql_str(out_path)} (FORMAT parquet, COMPRESSION zstd)")
+        rows = con.execute("SELECT COUNT(*) FROM picked").fetchone()[0]
+        n_strata = con.execute("SELECT COUNT(*) FROM strata").fetchone()[0]
+    finally:
+        con.close()
+
+    meta = {'dataset_version': version, 'source_rows': source_rows, 'rows': rows,
+            'rate': rows / source_rows, 'strata_columns': strata, 'strata': n_strata, 'file': rel_path}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fh:
+        json.dump(meta, fh, indent=2)
+    os.replace(tmp_path, path)
+    _remove(kind_name, previous, keep=rel_path)
+    return meta
+
+
+def _read(path):
+    try:
+        with open(path, 'r') as fh:
+            return json.load(fh)
+    except Exception:
+        return None
+
+
+def _remove(kind_name, previous, keep):
+    """Delete the sample of an earlier build (and its metadata when nothing replaces it)."""
+    from insight_agent.dataset_store import dataset_dir
+
+    if not previous:
+        return
+    if keep is None:
+        try:
+            os.remove(_sample_path(kind_name))
+        except OSError:
+            pass
+    if previous.get('file') and previous['file'] != keep:
+        try:
+            os.remove(os.path.join(dataset_dir(kind_name), previous['file']))
+        except OSError:
+            pass
+
+
+def sample_token(kind_name):
+    """(mtime_ns, size) of the kind's sample metadata, or None without a sample."""
+    try:
+        st = os.stat(_sample_path(kind_name))
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def load_sample(kind_name):
+    """Metadata of the kind's sample, or None if it does not match the live dataset.
+
+    Returns:
+        dict: dataset_version, source_rows, rows, rate, strata_columns,
+        strata and file, or None.
+    """
+    from insight_agent.dataset_store import dataset_version
+
+    token = sample_token(kind_name)
+    if token is None:
+        return None
+    version = dataset_version(kind_name)
+    with _cache_lock:
+        cached = _cache.get(kind_name)
+        if cached is None or cached[0] != (token, version):
+            meta = _read(_sample_path(kind_name))
+            if not meta or meta.get('dataset_version') != version:
+                meta = None
+            _cache[kind_name] = cached = ((token, version), meta)
+    return cached[1]
+
+
+def _expression(sql):
+    """AST of a single select-list expression."""
+    from insight_agent import sql_analyzer
+
+    return sql_analyzer.parse(f"SELECT {sql}")['statements'][0]['node']['select_list'][0]
+
+
+def _substitute(node, value, aggregate_filter):
+    """Copy of a _SCALED template with the aggregate's argument and FILTER put in."""
+    if isinstance(node, list):
+        return [_substitute(item, value, aggregate_filter) for item in node]
+    if not isinstance(node, dict):
+        return node
+    if node.get('class') == 'COLUMN_REF' and node.get('column_names') == ['__value']:
+        return copy.deepcopy(value)
+    new = {key: _substitute(child, value, aggregate_filter) for key, child in node.items()}
+    if new.get('class') == 'FUNCTION' and new.get('function_name') == 'sum':
+        new['filter'] = copy.deepcopy(aggregate_filter)
+    return new
+
+
+class _NodeRewrite:
+    """Scales the aggregates of one SELECT reading the data."""
+
+    def __init__(self, aggregates):
+        self.aggregates = aggregates
+        self.scaled = 0
+        self.unscaled = 0
+
+    def expression(self, node):
+        if isinstance(node, list):
+            for item in node:
+                self.expression(item)
+            return
+        if not isinstance(node, dict):
+            return
+        if node.get('class') == 'SUBQUERY':
+            # Its own SELECT is rewritten when it reads the data
+            return
+        if node.get('class') == 'FUNCTION' and str(node.get('function_name', '')).lower() in self.aggregates:
+            self.aggregate(node)
+            return
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                self.expression(value)
+
+    def aggregate(self, node):
+        function = node['function_name'].lower()
+        children = node.get('children') or []
+        if node.get('order_bys', {}).get('orders') or node.get('distinct') or function not in _SCALED:
+            # MIN, MAX, DISTINCT counts, quantiles... describe the sampled rows
+            self.unscaled += 1
+            return
+        if function != 'count_star' and len(children) != 1:
+            self.unscaled += 1
+            return
+        new = _substitute(_expression(_SCALED[function]), children[0] if children else None, node.get('filter'))
+        new['alias'] = node.get('alias', '')
+        node.clear()
+        node.update(new)
+        self.scaled += 1
+
+
+def enabled():
+    """Sampled previews are on unless QUERY_USE_SAMPLE is '0' or 'false'."""
+    return os.environ.get('QUERY_USE_SAMPLE', '1').strip().lower() not in ('0', 'false', 'no')
+
+
+def route(kind_name, sql):
+    """Point a prepared query at the kind's sample and scale its aggregates.
+
+    Every SELECT reading the data reads SAMPLE_TABLE instead: COUNT, SUM and
+    AVG become their weighted estimators (keeping the output column names),
+    `*` leaves out the weight, and other aggregates (MIN, MAX, DISTINCT
+    counts, quantiles) describe the sampled rows as they are. When the
+    outermost SELECT aggregates, ERROR_COLUMN is appended with a rough,
+    count-based 95% relative margin for each row, from the number of sampled
+    rows behind it (see _ERROR_SQL). Queries that read the data inside a
+    join, or sample it themselves, are left alone.
+
+    Args:
+        kind_name (str): name of the kind.
+        sql (str): SQL from sql_analyzer.prepare (tables resolved to 'data').
+
+    Returns:
+        tuple: (sql, info) where info is None when the query was not
+        sampled, else a dict with rate, sample_rows, source_rows,
+        strata_columns, scaled and unscaled (aggregate counts) and
+        error_column (None when no margin was added).
+    """
+    from insight_agent import sql_analyzer
+
+    meta = load_sample(kind_name) if enabled() else None
+    if not meta:
+        return sql, None
+    try:
+        tree = sql_analyzer.parse(sql)
+        aggregates = sql_analyzer.aggregate_functions()
+        selects, tables = [], []
+
+        def visit(node):
+            if node.get('type') == 'SELECT_NODE':
+                selects.append(node)
+            elif node.get('type') == 'BASE_TABLE' and node.get('table_name') == sql_analyzer.DATA_TABLE:
+                tables.append(node)
+
+        sql_analyzer._walk(tree, visit)
+        nodes = [node for node in selects
+                 if (node.get('from_table') or {}).get('type') == 'BASE_TABLE'
+                 and node['from_table'].get('table_name') == sql_analyzer.DATA_TABLE]
+        if not nodes or len(nodes) != len(tables):
+            raise _NotSampled()
+        info = {'rate': meta['rate'], 'sample_rows': meta['rows'], 'source_rows': meta['source_rows'],
+                'strata_columns': meta['strata_columns'], 'scaled': 0, 'unscaled': 0, 'error_column': None}
+        root = tree['statements'][0]['node']
+        for node in nodes:
+            table = node['from_table']
+            if table.get('sample') is not None or node.get('sample') is not None:
+                raise _NotSampled()
+            if not table.get('alias'):
+                table['alias'] = sql_analyzer.DATA_TABLE
+            table['table_name'] = SAMPLE_TABLE
+            rewrite = _NodeRewrite(aggregates)
+            for item in node.get('select_list', []):
+                if item.get('class') == 'STAR':
+                    item['exclude_list'] = list(item.get('exclude_list') or []) + [WEIGHT_COLUMN]
+                    continue
+                before = rewrite.scaled
+                if not item.get('alias'):
+                    name = sql_analyzer.expression_name(item)
+                    rewrite.expression(item)
+                    if rewrite.scaled > before:
+                        # Keep the output name the query would have had on the data
+                        item['alias'] = name
+                else:
+                    rewrite.expression(item)
+            for key in ('having', 'qualify', 'modifiers'):
+                rewrite.expression(node.get(key))
+            info['scaled'] += rewrite.scaled
+            info['unscaled'] += rewrite.unscaled
+            distinct = any(m.get('type') == 'DISTINCT_MODIFIER' for m in node.get('modifiers', []))
+            if node is root and rewrite.scaled and not distinct:
+                node['select_list'].append(dict(_expression(_ERROR_SQL), alias=ERROR_COLUMN))
+                info['error_column'] = ERROR_COLUMN
+        return sql_analyzer.render(tree), info
+    except Exception:
+        # Unfamiliar query shape: the data answers it exactly
+        return sql, None
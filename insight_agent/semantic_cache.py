@@ -0,0 +1,270 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+
+import numpy as np
+
+
+SEMANTIC_CACHE_PATH = os.path.join('domain', 'cache', 'semantic_cache.jsonl')
+# Minimum token similarity for serving cached SQL directly.
+DEFAULT_THRESHOLD = 0.8
+# Number of MinHash permutations per question signature.
+NUM_PERM = 128
+# Entries kept per cache; the oldest are dropped first.
+DEFAULT_MAX_ENTRIES = 5000
+
+_NUMBER_WORDS = {
+    'one': '1', 'two': '2', 'three': '3', 'four': '4', 'five': '5', 'six': '6', 'seven': '7',
+    'eight': '8', 'nine': '9', 'ten': '10', 'eleven': '11', 'twelve': '12', 'thirteen': '13',
+    'fifty': '50', 'fiftytwo': '52', 'hundred': '100',
+}
+_SYNONYMS = {
+    'wk': 'week', 'wks': 'week', 'weekly': 'week', 'yr': 'year', 'yrs': 'year', 'yearly': 'year',
+    'mo': 'month', 'mos': 'month', 'monthly': 'month', 'rev': 'sales', 'revenue': 'sales',
+    'dollars': 'sales', 'retailers': 'retailer', 'banner': 'retailer', 'banners': 'retailer',
+    'ya': 'year_ago', 'ly': 'year_ago', 'avg': 'average', 'mean': 'average',
+}
+# Words that flip or bound a question's meaning, by the sense they carry; a
+# direct hit requires both questions to carry the same senses.
+_SENSES = {
+    'no': 'not', 'not': 'not', 'without': 'not', 'none': 'not', 'never': 'not', 'excluding': 'not',
+    'except': 'not', 'nor': 'not', 'zero': 'not',
+    'over': '>', 'above': '>', 'more': '>', 'greater': '>', 'higher': '>', 'exceed': '>', 'atleast': '>=',
+    'under': '<', 'below': '<', 'less': '<', 'fewer': '<', 'lower': '<', 'atmost': '<=',
+    'top': 'top', 'highest': 'top', 'best': 'top', 'largest': 'top', 'biggest': 'top', 'most': 'top',
+    'bottom': 'bottom', 'lowest': 'bottom', 'worst': 'bottom', 'smallest': 'bottom', 'least': 'bottom',
+}
+# Common measures; with the tokens of the kind's column names, a direct hit
+# requires both questions to name the same ones.
+_MEASURES = 'sales units volume price cost margin profit share acv distribution velocity quantity spend'
+# Comparison operators, spelled as words so they survive tokenising.
+_OPERATORS = [('>=', ' atleast '), ('<=', ' atmost '), ('>', ' over '), ('<', ' under ')]
+_STOPWORDS = {
+    'a', 'an', 'the', 'of', 'for', 'in', 'on', 'at', 'me', 'show', 'give', 'what', 'whats', 'is',
+    'are', 'was', 'were', 'please', 'list', 'total', 'get', 'and', 'to', 'can', 'you', 'i', 'we',
+    'our', 'tell', 'find', 'how', 'much', 'many', 'do', 'does', 'did', 'with',
+}
+
+_rng = np.random.default_rng(20240101)
+# Multiply-shift hash family: odd multipliers, random offsets
+_PERM_A = _rng.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_PERM_B = _rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+
+
+def normalize_question(question):
+    """Reduce a question to a set of normalised tokens.
+
+    Lowercases, spells comparison operators as words, strips punctuation,
+    maps number words and common synonyms to one spelling, drops filler
+    words and trailing plural 's'.
+    """
+    text = (question or '').lower().replace('-', '')
+    for operator, word in _OPERATORS:
+        text = text.replace(operator, word)
+    words = re.findall(r'[a-z0-9_%]+', text)
+    tokens = set()
+    for word in words:
+        word = _NUMBER_WORDS.get(word, word)
+        word = _SYNONYMS.get(word, word)
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith('ies'):
+            word = word[:-3] + 'y'
+        elif len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = _SYNONYMS.get(word[:-1], word[:-1])
+        tokens.add(word)
+    return tokens
+
+
+def minhash(tokens):
+    """MinHash signature (NUM_PERM uint64 values) of a token set."""
+    if not tokens:
+        return np.full(NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+    hashes = np.array([int.from_bytes(hashlib.blake2b(t.encode('utf-8'), digest_size=8).digest(), 'little')
+                       for t in sorted(tokens)], dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        permuted = hashes[:, None] * _PERM_A[None, :] + _PERM_B[None, :]
+    return permuted.min(axis=0)
+
+
+def _scope(kind_name, filters):
+    from insight_agent.result_cache import mapping_token
+
+    # SQL written against an older mapping may reference renamed columns
+    return json.dumps([kind_name, mapping_token(kind_name),
+                       sorted((str(k), str(v)) for k, v in (filters or {}).items())])
+
+
+def _numbers(tokens):
+    return {t for t in tokens if any(ch.isdigit() for ch in t)}
+
+
+def _senses(tokens):
+    return {_SENSES[t] for t in tokens if t in _SENSES}
+
+
+def _column_tokens(kind_name):
+    """Normalised tokens of the kind's column names plus the common measures."""
+    from insight_agent.catalog import get_catalog
+
+    names = [str(rec.get(field) or '') for rec in get_catalog().get(kind_name).mapping
+             for field in ('original_name', 'canonical_name')]
+    return normalize_question(' '.join(names + [_MEASURES]).replace('_', ' '))
+
+
+class SemanticCache:
+    """Similarity cache of validated (kind, filters, question) -> SQL.
+
+    Questions are compared by MinHash signatures of their normalised tokens,
+    verified with exact Jaccard similarity; no embedding service is needed.
+    Only entries with the same kind and filters are considered, and a direct
+    hit also requires the questions to mention the same numbers, so "last 4
+    weeks" never serves the SQL written for "last 5 weeks", the same
+    negations and comparisons, so "stores with no sales" never serves "stores
+    with sales" nor "top 10" serve "bottom 10", and the same measures and
+    columns (from the kind's mapping), so "dollars by brand" never serves
+    "units by brand". Lower-scoring neighbours are still useful as few-shot
+    examples for the LLM.
+    """
+
+    def __init__(self, path=SEMANTIC_CACHE_PATH, threshold=DEFAULT_THRESHOLD, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = []
+        self._signatures = np.zeros((0, NUM_PERM), dtype=np.uint64)
+        self.lookups = 0
+        self.hits = 0
+        self.latency_saved = 0.0
+        self.lookup_time = 0.0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        entries = []
+        with open(self.path, 'r') as fh:
+            for line in fh:
+                try:
+                    entries.append(json.loads(line))
+                except Exception:
+                    continue
+        if len(entries) > self.max_entries:
+            # Compact the append-only log down to the entries still kept
+            entries = entries[-self.max_entries:]
+            with open(self.path, 'w') as fh:
+                for entry in entries:
+                    fh.write(json.dumps(entry) + '\n')
+        for entry in entries:
+            entry['tokens'] = sorted(normalize_question(entry['question']))
+        self._entries = entries
+        if entries:
+            self._signatures = np.vstack([minhash(set(e['tokens'])) for e in entries])
+
+    def _append(self, entry):
+        entry['tokens'] = sorted(normalize_question(entry['question']))
+        self._entries.append(entry)
+        self._signatures = np.vstack([self._signatures, minhash(set(entry['tokens']))[None, :]])
+
+    def _ranked(self, kind_name, question, filters):
+        tokens = normalize_question(question)
+        scope = _scope(kind_name, filters)
+        idx = [i for i, e in enumerate(self._entries) if e['scope'] == scope]
+        if not idx or not tokens:
+            return tokens, []
+        estimates = np.mean(self._signatures[idx] == minhash(tokens)[None, :], axis=1)
+        ranked = []
+        # Verify the best estimates with exact Jaccard similarity
+        for pos in np.argsort(-estimates, kind='stable')[:20]:
+            entry = self._entries[idx[pos]]
+            other = set(entry['tokens'])
+            ranked.append((len(tokens & other) / len(tokens | other), entry))
+        ranked.sort(key=lambda item: -item[0])
+        return tokens, ranked
+
+    def lookup(self, kind_name, question, filters=None):
+        """Find cached SQL for a similar question.
+
+        Returns:
+            dict or None: {'sql', 'question', 'similarity'} for a hit.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            self.lookups += 1
+            tokens, ranked = self._ranked(kind_name, question, filters)
+            columns = _column_tokens(kind_name) if ranked else set()
+            hit = None
+            for similarity, entry in ranked:
+                if similarity < self.threshold:
+                    break
+                other = set(entry['tokens'])
+                if (_numbers(tokens) == _numbers(other) and _senses(tokens) == _senses(other)
+                        and tokens & columns == other & columns):
+                    hit = {'sql': entry['sql'], 'question': entry['question'], 'similarity': similarity}
+                    self.hits += 1
+                    self.latency_saved += entry.get('latency', 0.0)
+                    break
+            self.lookup_time += time.perf_counter() - start
+            return hit
+
+    def examples(self, kind_name, question, filters=None, k=3, min_similarity=0.2):
+        """Closest cached (question, sql) pairs to use as few-shot examples."""
+        with self._lock:
+            _, ranked = self._ranked(kind_name, question, filters)
+        return [(e['question'], e['sql']) for sim, e in ranked[:k] if sim >= min_similarity]
+
+    def add(self, kind_name, question, sql, filters=None, latency=0.0):
+        """Record SQL that executed successfully for a question.
+
+        Args:
+            latency (float): seconds the LLM took to produce the SQL; reported
+                as latency saved whenever the entry serves a hit.
+        """
+        if not sql or not question:
+            return
+        entry = {'scope': _scope(kind_name, filters), 'kind': kind_name, 'question': question,
+                 'sql': sql, 'latency': latency, 'created_at': time.time()}
+        with self._lock:
+            self._append(entry)
+            if len(self._entries) > self.max_entries:
+                drop = len(self._entries) - self.max_entries
+                self._entries = self._entries[drop:]
+                self._signatures = self._signatures[drop:]
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            record = {k: v for k, v in entry.items() if k != 'tokens'}
+            with open(self.path, 'a') as fh:
+                fh.write(json.dumps(record) + '\n')
+
+    def stats(self):
+        """Hit rate and latency figures for tuning the threshold."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+                'latency_saved_s': round(self.latency_saved, 3),
+                'avg_lookup_ms': round(1000 * self.lookup_time / self.lookups, 3) if self.lookups else 0.0,
+                'threshold': self.threshold,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache():
+    """Return the process-wide SemanticCache.
+
+    SEMANTIC_CACHE_THRESHOLD overrides the similarity threshold.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            threshold = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', DEFAULT_THRESHOLD))
+            _cache = SemanticCache(threshold=threshold)
+        return _cache
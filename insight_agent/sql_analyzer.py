@@ -0,0 +1,338 @@
+import os
+import re
+import json
+import threading
+
+import duckdb
+
+
+# Rows returned to the UI per query; one extra row is fetched to detect truncation.
+DEFAULT_MAX_ROWS = 10_000
+# Queries whose plan estimates more rows than this at any operator are refused.
+DEFAULT_MAX_ESTIMATED_ROWS = 1_000_000_000
+# Every table a generated query reads resolves to the kind's view.
+DATA_TABLE = 'data'
+
+_parser = None
+_parser_lock = threading.Lock()
+
+
+class QueryRejected(ValueError):
+    """Raised when generated SQL is not a single, affordable SELECT."""
+
+
+def _parser_connection():
+    global _parser
+    if _parser is None:
+        _parser = duckdb.connect(database=':memory:')
+    return _parser
+
+
+def _quote_identifiers(sql):
+    """Turn MySQL/SQL Server identifier quoting into DuckDB double quotes.
+
+    LLM output often uses `name` or FROM [name]; both are rewritten outside
+    string literals only. Brackets elsewhere are list literals in DuckDB.
+    """
+    parts = re.split(r"('(?:[^']|'')*')", sql or '')
+    for i in range(0, len(parts), 2):
+        part = re.sub(r"`([^`]*)`", lambda m: '"' + m.group(1).replace('"', '""') + '"', parts[i])
+        part = re.sub(r"(\b(?:FROM|JOIN)\s+)\[([^\]]+)\]", r'\1"\2"', part, flags=re.IGNORECASE)
+        parts[i] = part
+    return ''.join(parts)
+
+
+def parse(sql):
+    """Parse SQL with DuckDB's own parser.
+
+    Returns:
+        dict: the serialized AST of the single SELECT statement.
+
+    Raises:
+        QueryRejected: for syntax errors, non-SELECT statements or multiple statements.
+    """
+    with _parser_lock:
+        try:
+            raw = _parser_connection().execute("SELECT json_serialize_sql($1)", [_quote_identifiers(sql)]).fetchone()[0]
+        except duckdb.Error as exc:
+            raise QueryRejected(f"Could not parse SQL: {exc}")
+    tree = json.loads(raw)
+    if tree.get('error'):
+        message = tree.get('error_message', 'invalid SQL')
+        if tree.get('error_type') == 'not implemented':
+            message = 'Only SELECT queries are allowed.'
+        raise QueryRejected(message)
+    statements = tree.get('statements') or []
+    if len(statements) != 1:
+        raise QueryRejected('Exactly one SELECT statement is allowed.')
+    return tree
+
+
+def render(tree):
+    """Serialize an AST back to SQL text."""
+    with _parser_lock:
+        return _parser_connection().execute("SELECT json_deserialize_sql($1)", [json.dumps(tree)]).fetchone()[0]
+
+
+_aggregates = None
+
+
+def aggregate_functions():
+    """Names of DuckDB's aggregate functions (lower case)."""
+    global _aggregates
+    with _parser_lock:
+        if _aggregates is None:
+            rows = _parser_connection().execute(
+                "SELECT DISTINCT lower(function_name) FROM duckdb_functions() WHERE function_type = 'aggregate'"
+            ).fetchall()
+            _aggregates = frozenset(name for (name,) in rows)
+    return _aggregates
+
+
+def expression_name(expr):
+    """Column name DuckDB gives an unaliased select-list expression."""
+    tree = parse('SELECT 1')
+    tree['statements'][0]['node']['select_list'] = [dict(expr, alias='')]
+    return render(tree)[len('SELECT '):]
+
+
+def _walk(node, visit):
+    if isinstance(node, dict):
+        visit(node)
+        for value in node.values():
+            _walk(value, visit)
+    elif isinstance(node, list):
+        for value in node:
+            _walk(value, visit)
+
+
+def _cte_names(tree):
+    names = set()
+
+    def visit(node):
+        cte_map = node.get('cte_map')
+        if isinstance(cte_map, dict):
+            names.update(entry.get('key') for entry in cte_map.get('map', []))
+
+    _walk(tree, visit)
+    return names
+
+
+def table_names(kinds):
+    """View name of each kind in a multi-kind query ('Walmart POS' -> walmart_pos).
+
+    Returns:
+        dict: kind name -> view name, in the order given; unique even when
+        two kind names reduce to the same identifier.
+    """
+    names = {}
+    for kind in kinds:
+        base = re.sub(r'[^0-9a-z]+', '_', str(kind).lower()).strip('_') or 'kind'
+        if base[0].isdigit():
+            base = 'kind_' + base
+        name, n = base, 2
+        while name in names.values() or name == DATA_TABLE:
+            name, n = f"{base}_{n}", n + 1
+        names[kind] = name
+    return names
+
+
+def table_lookup(kinds):
+    """Names a query may use for each kind's view (view name or kind name, any case) -> view."""
+    lookup = {}
+    for kind, name in table_names(kinds).items():
+        lookup[name] = name
+        lookup[str(kind).lower()] = name
+    return lookup
+
+
+def resolve_tables(tree, tables=None):
+    """Point every table reference that is not a CTE at the kind's view.
+
+    A table keeps its original name as alias, so qualified column references
+    (sales.brand) still bind. Table functions such as read_parquet() are
+    refused; queries only ever read the kind's data. A CTE named like a view
+    ('data') is renamed along with its references, so the view can later be
+    shadowed by a filtering CTE of that name (see query_executor.apply_filters).
+
+    Args:
+        tree (dict): AST from parse(), modified in place.
+        tables (dict): for multi-kind queries, the names allowed (lower case)
+            -> view they read (see table_lookup); other tables are refused.
+            By default every table resolves to 'data'.
+
+    Returns:
+        list: the original table names that were resolved.
+    """
+    reserved = {DATA_TABLE} | set((tables or {}).values())
+    taken = {name.lower() for name in _cte_names(tree)} | reserved
+    resolved = []
+
+    def rename(name):
+        new, n = f"{name}_cte", 2
+        while new.lower() in taken:
+            new, n = f"{name}_cte{n}", n + 1
+        taken.add(new.lower())
+        return new
+
+    def table(node, scope):
+        if node.get('type') == 'TABLE_FUNCTION':
+            name = (node.get('function') or {}).get('function_name', '')
+            raise QueryRejected(f"Table function '{name}' is not allowed.")
+        name = node.get('table_name', '')
+        if not node.get('schema_name') and name.lower() in scope:
+            cte = scope[name.lower()]
+            if cte != name:
+                node['alias'] = node.get('alias') or name
+                node['table_name'] = cte
+            return
+        target = DATA_TABLE
+        if tables is not None:
+            target = tables.get(name.lower())
+            if target is None:
+                available = ', '.join(sorted(set(tables.values())))
+                raise QueryRejected(f"Unknown table '{name}'. Available tables: {available}.")
+        resolved.append(name)
+        if not node.get('alias') and name != target:
+            node['alias'] = name
+        node['table_name'] = target
+        node['schema_name'] = ''
+        node['catalog_name'] = ''
+
+    def visit(node, scope):
+        if isinstance(node, list):
+            for item in node:
+                visit(item, scope)
+            return
+        if not isinstance(node, dict):
+            return
+        if node.get('type') in ('BASE_TABLE', 'TABLE_FUNCTION'):
+            table(node, scope)
+        cte_map = node.get('cte_map')
+        if isinstance(cte_map, dict) and cte_map.get('map'):
+            # A CTE sees the ones defined before it (and itself when recursive);
+            # the rest of the query sees all of them
+            scope = dict(scope)
+            for entry in cte_map['map']:
+                name = entry.get('key', '')
+                cte = rename(name) if name.lower() in reserved else name
+                body = (entry.get('value') or {}).get('query')
+                if ((body or {}).get('node') or {}).get('type') == 'RECURSIVE_CTE_NODE':
+                    scope[name.lower()] = cte
+                    visit(body, scope)
+                else:
+                    visit(body, scope)
+                    scope[name.lower()] = cte
+                entry['key'] = cte
+        for key, value in node.items():
+            if key != 'cte_map':
+                visit(value, scope)
+
+    visit(tree, {})
+    return resolved
+
+
+def _constant(value):
+    return {'class': 'CONSTANT', 'type': 'VALUE_CONSTANT', 'alias': '', 'query_location': 0,
+            'value': {'type': {'id': 'BIGINT', 'type_info': None}, 'is_null': False, 'value': int(value)}}
+
+
+def cap_rows(tree, max_rows):
+    """Limit the outermost query to at most max_rows rows.
+
+    An existing constant LIMIT is lowered if needed; otherwise a LIMIT is
+    added. Returns False if the query has a non-constant LIMIT it could not
+    cap in place.
+    """
+    node = tree['statements'][0]['node']
+    modifiers = node.setdefault('modifiers', [])
+    for modifier in modifiers:
+        if modifier.get('type') != 'LIMIT_MODIFIER':
+            continue
+        limit = modifier.get('limit')
+        if limit is None:
+            modifier['limit'] = _constant(max_rows)
+            return True
+        if limit.get('class') != 'CONSTANT' or limit['value'].get('is_null'):
+            return False
+        if int(limit['value']['value']) > max_rows:
+            modifier['limit'] = _constant(max_rows)
+        return True
+    if any(m.get('type') == 'LIMIT_PERCENT_MODIFIER' for m in modifiers):
+        return False
+    modifiers.append({'type': 'LIMIT_MODIFIER', 'limit': _constant(max_rows), 'offset': None})
+    return True
+
+
+def canonical_sql(sql):
+    """Canonical text of a query for cache keys, or None if it does not parse.
+
+    Formatting, keyword case, identifier quoting and the table name the LLM
+    chose all disappear, so equivalent generated queries share one entry.
+    """
+    try:
+        tree = parse(sql)
+        resolve_tables(tree)
+        return render(tree)
+    except (QueryRejected, duckdb.Error):
+        return None
+
+
+def estimated_rows(con, sql, params=None):
+    """Largest cardinality DuckDB's optimizer estimates for any operator of a query.
+
+    Operators without an estimate (cross products) are taken as the product
+    of their inputs for joins, or the largest input otherwise.
+    """
+    explained = con.execute(f"EXPLAIN (FORMAT json) {sql}", params or []).fetchall()
+    plan = json.loads(explained[0][1])
+    largest = 0
+
+    def visit(node):
+        nonlocal largest
+        inputs = [visit(child) for child in node.get('children', [])]
+        try:
+            rows = int((node.get('extra_info') or {}).get('Estimated Cardinality'))
+        except (TypeError, ValueError):
+            rows = None
+        if rows is None:
+            if 'CROSS_PRODUCT' in node.get('name', '') or 'NL_JOIN' in node.get('name', ''):
+                rows = 1
+                for count in inputs:
+                    rows *= count
+            else:
+                rows = max(inputs, default=0)
+        largest = max(largest, rows)
+        return rows
+
+    for root in plan:
+        visit(root)
+    return largest
+
+
+def max_estimated_rows():
+    """Cost ceiling for a query; QUERY_MAX_ESTIMATED_ROWS overrides the default."""
+    return int(os.environ.get('QUERY_MAX_ESTIMATED_ROWS', DEFAULT_MAX_ESTIMATED_ROWS))
+
+
+def prepare(sql, max_rows=None, tables=None):
+    """Analyse generated SQL and return the text to run against a kind.
+
+    Args:
+        sql (str): SQL from the LLM.
+        max_rows (int): optional row cap; the outermost query is limited to
+            max_rows + 1 rows so callers can tell when results were truncated.
+        tables (dict): allowed table names of a multi-kind query (see resolve_tables).
+
+    Returns:
+        str: a single SELECT whose tables all resolve to 'data' (or to the
+        kinds' views).
+
+    Raises:
+        QueryRejected: if the SQL is not a single SELECT over the kind's data.
+    """
+    tree = parse(sql)
+    resolve_tables(tree, tables)
+    if max_rows is not None and not cap_rows(tree, max_rows + 1):
+        return f"SELECT * FROM ({render(tree)}) AS capped LIMIT {int(max_rows) + 1}"
+    return render(tree)
@@ -0,0 +1,327 @@
+"""Lightweight spans for timing the ask pipeline.
+
+    with tracing.span('build_prompt', kind=kind_name) as sp:
+        ...
+        sp.set_attributes(prompt_tokens=n)
+
+Spans nest through a context variable; a span opened with no current span
+starts a new trace. When the root span ends, the whole trace is appended to
+TRACES_FILE as one line of OpenTelemetry (OTLP/JSON) `resourceSpans`, so it
+can be replayed into any OTLP collector, and kept in memory for the Runs page.
+
+Tracing is off unless INSIGHT_TRACING=1 or set_enabled(True); then span()
+returns a shared no-op span and costs one flag check.
+"""
+import os
+import json
+import time
+import secrets
+import threading
+import contextlib
+import contextvars
+from collections import deque
+
+
+TRACES_DIR = os.path.join('domain', 'cache', 'traces')
+TRACES_FILE = os.path.join(TRACES_DIR, 'traces.jsonl')
+# The file is rotated to traces.jsonl.1 once it grows past this size.
+TRACES_FILE_MAX_BYTES = 20 * 1024 * 1024
+# Finished traces kept in memory for the UI.
+RECENT_TRACES = 100
+SERVICE_NAME = 'insight-agent'
+# OTLP status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_enabled = os.environ.get('INSIGHT_TRACING', '').lower() in ('1', 'true', 'yes', 'on')
+_current = contextvars.ContextVar('insight_agent_span', default=None)
+_recent = deque(maxlen=RECENT_TRACES)
+_write_lock = threading.Lock()
+
+
+def enabled():
+    """True while spans are being recorded."""
+    return _enabled
+
+
+def set_enabled(flag):
+    """Turn tracing on or off for this process (the Settings page toggle)."""
+    global _enabled
+    _enabled = bool(flag)
+
+
+class Span:
+    """A timed operation with attributes; use as a context manager.
+
+    Args:
+        name (str): operation name, e.g. 'query.execute'.
+        parent (Span): enclosing span, or None to start a new trace.
+        attributes (dict): initial attributes.
+    """
+
+    recording = True
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.root = parent.root if parent is not None else self
+        self.trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.attributes = dict(attributes or {})
+        self.start_ns = None
+        self.end_ns = None
+        self.status = STATUS_OK
+        self.message = ''
+        # Finished spans of the trace, collected on the root
+        self._finished = [] if parent is None else None
+        self._token = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_error(self, exc):
+        self.status = STATUS_ERROR
+        self.message = f"{type(exc).__name__}: {exc}"
+
+    @property
+    def duration_ms(self):
+        if self.start_ns is None:
+            return 0.0
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def start(self):
+        self.start_ns = time.time_ns()
+        return self
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        self.root._finished.append(self)
+        if self.root is self:
+            _export(self)
+
+    def __enter__(self):
+        self.start()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_error(exc)
+        _current.reset(self._token)
+        self.end()
+        return False
+
+
+class _NoopSpan:
+    """Stands in for a Span while tracing is off."""
+
+    recording = False
+    name = ''
+    attributes = {}
+    duration_ms = 0.0
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def record_error(self, exc):
+        pass
+
+    def start(self):
+        return self
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def span(name, **attributes):
+    """Open a span under the current one (or a new trace); a no-op when tracing is off."""
+    if not _enabled:
+        return NOOP_SPAN
+    return Span(name, _current.get(), attributes)
+
+
+def current_span():
+    """The innermost open span, or the no-op span."""
+    return _current.get() or NOOP_SPAN
+
+
+def set_attributes(**attributes):
+    """Add attributes to the innermost open span."""
+    current = _current.get()
+    if current is not None:
+        current.set_attributes(**attributes)
+
+
+@contextlib.contextmanager
+def use_span(parent):
+    """Make `parent` the current span, e.g. in a thread or task started on its behalf."""
+    if parent is None or not parent.recording:
+        yield parent
+        return
+    token = _current.set(parent)
+    try:
+        yield parent
+    finally:
+        _current.reset(token)
+
+
+async def run_in_span(parent, awaitable):
+    """Await `awaitable` with `parent` current; for coroutines handed to another event loop."""
+    with use_span(parent):
+        return await awaitable
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_span(sp):
+    return {
+        'traceId': sp.trace_id,
+        'spanId': sp.span_id,
+        'parentSpanId': sp.parent.span_id if sp.parent is not None else '',
+        'name': sp.name,
+        'kind': 1,
+        'startTimeUnixNano': str(sp.start_ns),
+        'endTimeUnixNano': str(sp.end_ns),
+        'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in sp.attributes.items() if v is not None],
+        'status': {'code': sp.status, 'message': sp.message} if sp.message else {'code': sp.status},
+    }
+
+
+def to_otlp(root):
+    """A finished trace as an OTLP/JSON ExportTraceServiceRequest."""
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+        'scopeSpans': [{
+            'scope': {'name': __name__},
+            'spans': [_otlp_span(sp) for sp in sorted(root._finished, key=lambda s: s.start_ns)],
+        }],
+    }]}
+
+
+def _export(root):
+    record = to_otlp(root)
+    _recent.append(record)
+    line = json.dumps(record, separators=(',', ':'))
+    try:
+        with _write_lock:
+            os.makedirs(TRACES_DIR, exist_ok=True)
+            if os.path.exists(TRACES_FILE) and os.path.getsize(TRACES_FILE) > TRACES_FILE_MAX_BYTES:
+                os.replace(TRACES_FILE, TRACES_FILE + '.1')
+            with open(TRACES_FILE, 'a') as fh:
+                fh.write(line + '\n')
+    except OSError:
+        # Losing a trace must never fail the request it describes
+        pass
+
+
+def _attribute_value(value):
+    for key in ('stringValue', 'doubleValue', 'boolValue'):
+        if key in value:
+            return value[key]
+    if 'intValue' in value:
+        return int(value['intValue'])
+    return None
+
+
+def summarize(record):
+    """Flatten an OTLP/JSON trace into a dict for display.
+
+    Returns:
+        dict: trace_id, name, started (unix seconds), duration_ms, status and
+            spans, a list of {name, span_id, parent_id, depth, start_ms,
+            duration_ms, status, attributes} in start order.
+    """
+    spans = [sp for rs in record.get('resourceSpans', []) for ss in rs.get('scopeSpans', [])
+             for sp in ss.get('spans', [])]
+    if not spans:
+        return None
+    by_id = {sp['spanId']: sp for sp in spans}
+    roots = [sp for sp in spans if not sp.get('parentSpanId') or sp['parentSpanId'] not in by_id]
+    root = min(roots or spans, key=lambda sp: int(sp['startTimeUnixNano']))
+    start = int(root['startTimeUnixNano'])
+
+    def depth(sp):
+        level = 0
+        while sp.get('parentSpanId') in by_id:
+            sp = by_id[sp['parentSpanId']]
+            level += 1
+        return level
+
+    rows = []
+    for sp in sorted(spans, key=lambda s: int(s['startTimeUnixNano'])):
+        rows.append({
+            'name': sp['name'],
+            'span_id': sp['spanId'],
+            'parent_id': sp.get('parentSpanId') or None,
+            'depth': depth(sp),
+            'start_ms': (int(sp['startTimeUnixNano']) - start) / 1e6,
+            'duration_ms': (int(sp['endTimeUnixNano']) - int(sp['startTimeUnixNano'])) / 1e6,
+            'status': 'error' if sp.get('status', {}).get('code') == STATUS_ERROR else 'ok',
+            'attributes': {a['key']: _attribute_value(a['value']) for a in sp.get('attributes', [])},
+        })
+    return {
+        'trace_id': root['traceId'],
+        'name': root['name'],
+        'started': start / 1e9,
+        'duration_ms': (int(root['endTimeUnixNano']) - start) / 1e6,
+        'status': 'error' if any(r['status'] == 'error' for r in rows) else 'ok',
+        'spans': rows,
+    }
+
+
+def _tail_lines(path, count, block=64 * 1024):
+    with open(path, 'rb') as fh:
+        fh.seek(0, os.SEEK_END)
+        pos = fh.tell()
+        data = b''
+        while pos > 0 and data.count(b'\n') <= count:
+            step = min(block, pos)
+            pos -= step
+            fh.seek(pos)
+            data = fh.read(step) + data
+    return [line for line in data.splitlines() if line.strip()][-count:]
+
+
+def load_traces(limit=50, path=None):
+    """Summaries (see summarize) of the most recent traces, newest first.
+
+    Read from the end of the traces file, so traces from other processes and
+    earlier runs are included; falls back to this process's recent traces.
+    """
+    path = path or TRACES_FILE
+    records = []
+    if os.path.exists(path):
+        for line in _tail_lines(path, limit):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    else:
+        records = list(_recent)[-limit:]
+    traces = [summarize(r) for r in reversed(records)]
+    return [t for t in traces if t is not None]
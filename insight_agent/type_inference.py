@@ -0,0 +1,137 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# Rows inspected per column; larger samples are thinned evenly across the file.
+DEFAULT_SAMPLE_ROWS = 10_000
+# Share of non-null sample values that must parse for a type to be chosen.
+MIN_CONFIDENCE = 0.95
+# A string column with at most this many distinct values (or this share of
+# its sample) is reported as categorical.
+CATEGORICAL_MAX_DISTINCT = 50
+CATEGORICAL_MAX_RATIO = 0.05
+
+DATE_FORMATS = [
+    '%Y-%m-%d', '%Y/%m/%d', '%m/%d/%Y', '%d/%m/%Y', '%m/%d/%y', '%d/%m/%y', '%d-%m-%Y', '%m-%d-%Y',
+    '%d.%m.%Y', '%Y%m%d', '%b %d, %Y', '%d %b %Y', '%B %d, %Y', '%d %B %Y', '%Y-%m',
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%m/%d/%Y %H:%M', '%m/%d/%Y %H:%M:%S', '%d/%m/%Y %H:%M',
+]
+BOOLEAN_VALUES = {'true', 'false', 'yes', 'no', 'y', 'n', 't', 'f'}
+
+_PERCENT = re.compile(r'^[+-]?(\d{1,3}(,\d{3})+|\d+)?(\.\d+)?\s*%$')
+_CURRENCY = re.compile(r'^\(?[+-]?\s*[$€£¥]\s*[+-]?(\d{1,3}(,\d{3})+|\d+)?(\.\d+)?\)?$')
+_NUMBER = re.compile(r'^[+-]?(\d{1,3}(,\d{3})+|\d+)?(\.\d+)?([eE][+-]?\d+)?$')
+_INTEGER = re.compile(r'^[+-]?(\d{1,3}(,\d{3})+|\d+)$')
+
+# Legacy coarse hint for each inferred type (mapping format_hint).
+FORMAT_HINTS = {
+    'integer': 'numeric', 'decimal': 'numeric', 'percent': 'numeric', 'currency': 'numeric',
+    'date': 'datetime', 'datetime': 'datetime',
+    'boolean': 'string', 'categorical': 'string', 'string': 'string',
+}
+
+
+def stratified_sample(df, max_rows=DEFAULT_SAMPLE_ROWS):
+    """Evenly spaced rows across the whole frame (at most max_rows).
+
+    Taking every k-th row rather than the head keeps values from late in the
+    file (new periods, new products) in the sample.
+    """
+    if len(df) <= max_rows:
+        return df
+    positions = np.unique(np.linspace(0, len(df) - 1, max_rows).astype(np.int64))
+    return df.iloc[positions]
+
+
+def _share(mask):
+    return float(mask.mean()) if len(mask) else 0.0
+
+
+def _best_date_format(values):
+    """(format, share parsed) of the date format matching most values."""
+    probe = values.iloc[:200]
+    best, best_share = None, 0.0
+    for fmt in DATE_FORMATS:
+        share = _share(pd.to_datetime(probe, format=fmt, errors='coerce').notna())
+        if share > best_share:
+            best, best_share = fmt, share
+            if share == 1.0:
+                break
+    if best is None:
+        return None, 0.0
+    # Confirm on the full sample
+    return best, _share(pd.to_datetime(values, format=best, errors='coerce').notna())
+
+
+def _result(inferred_type, confidence, date_format=''):
+    return {
+        'inferred_type': inferred_type,
+        'format_hint': FORMAT_HINTS[inferred_type],
+        'date_format': date_format,
+        'confidence': round(float(confidence), 3),
+    }
+
+
+def infer_column(series):
+    """Infer the type of one (sampled) column with vectorized passes.
+
+    Returns:
+        dict: inferred_type (integer, decimal, percent, currency, date,
+        datetime, boolean, categorical or string), format_hint (numeric,
+        datetime or string), date_format (strftime pattern for dates) and
+        confidence (share of non-null values matching the type).
+    """
+    values = series.dropna()
+    if pd.api.types.is_bool_dtype(series):
+        return _result('boolean', 1.0)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        has_time = len(values) and bool((values != values.dt.normalize()).any())
+        return _result('datetime' if has_time else 'date', 1.0)
+    if pd.api.types.is_numeric_dtype(series):
+        if pd.api.types.is_integer_dtype(series) or bool((values % 1 == 0).all()):
+            return _result('integer', 1.0)
+        return _result('decimal', 1.0)
+
+    text = values.astype(str).str.strip()
+    text = text[text != '']
+    if text.empty:
+        return _result('string', 0.0)
+
+    lowered = text.str.lower()
+    share = _share(lowered.isin(BOOLEAN_VALUES))
+    if share >= MIN_CONFIDENCE:
+        return _result('boolean', share)
+    share = _share(text.str.match(_PERCENT))
+    if share >= MIN_CONFIDENCE:
+        return _result('percent', share)
+    share = _share(text.str.match(_CURRENCY))
+    if share >= MIN_CONFIDENCE:
+        return _result('currency', share)
+    is_number = text.str.match(_NUMBER) & text.str.contains(r'\d', regex=True)
+    share = _share(is_number)
+    if share >= MIN_CONFIDENCE:
+        int_share = _share(text.str.match(_INTEGER))
+        if int_share >= share:
+            return _result('integer', int_share)
+        return _result('decimal', share)
+
+    date_format, share = _best_date_format(text)
+    if date_format and share >= MIN_CONFIDENCE:
+        return _result('datetime' if '%H' in date_format else 'date', share, date_format)
+
+    distinct = text.nunique()
+    if distinct <= CATEGORICAL_MAX_DISTINCT or distinct <= CATEGORICAL_MAX_RATIO * len(text):
+        return _result('categorical', 1.0 - distinct / len(text) if len(text) > 1 else 1.0)
+    return _result('string', 1.0)
+
+
+def infer_types(df, max_rows=DEFAULT_SAMPLE_ROWS):
+    """Infer every column's type from a bounded, evenly spread sample.
+
+    Returns:
+        dict: column name -> infer_column() result, in column order.
+    """
+    sample = stratified_sample(df, max_rows)
+    return {col: infer_column(sample[col]) for col in sample.columns}
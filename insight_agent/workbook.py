@@ -0,0 +1,484 @@
+"""Streaming Excel reader: worksheet rows to Arrow batches and a Parquet spill.
+
+Workbooks are read row by row, with python-calamine when it is installed and
+openpyxl in read-only mode otherwise, and converted straight into Arrow
+record batches, so memory stays bounded by the batch size instead of the
+sheet. spill() writes the batches to a Parquet file keyed by the workbook's
+content, sheet and header row (rewriting it in the rare case a column's type
+widens partway through); every later step (header checks, profiling,
+onboarding chunks, a retried job) reads that file instead of parsing the
+workbook again.
+"""
+import os
+import datetime
+
+
+# Parsed workbooks, one Parquet file per (content, sheet, header row).
+SPILL_DIR = os.path.join('domain', 'cache', 'ingest')
+# Spilled workbooks kept; the least recently used beyond this are deleted.
+SPILL_MAX_FILES = 8
+# Worksheet rows per Arrow batch.
+BATCH_ROWS = 50_000
+# Bumped when the conversion changes, so older spills are not reused.
+SPILL_FORMAT = 2
+
+
+def _engine(streaming=False):
+    """Workbook reader: 'calamine' when python-calamine is importable, else 'openpyxl'.
+
+    With streaming=True openpyxl is preferred: calamine loads the whole sheet
+    up front, while openpyxl in read-only mode stops at the last row asked
+    for, which is what reading a header or a bounded sample needs.
+    """
+    if streaming:
+        try:
+            import openpyxl  # noqa: F401
+            return 'openpyxl'
+        except ImportError:
+            pass
+    try:
+        import python_calamine  # noqa: F401
+        return 'calamine'
+    except ImportError:
+        return 'openpyxl'
+
+
+def _pick_sheet(names, sheet):
+    """Index of the requested sheet (name or 0-based position; default the first)."""
+    if sheet is None or sheet == '':
+        return 0
+    if isinstance(sheet, int):
+        if 0 <= sheet < len(names):
+            return sheet
+    elif sheet in names:
+        return names.index(sheet)
+    raise ValueError(f"Sheet {sheet!r} not found. Sheets: {names}.")
+
+
+def _iter_rows(file_obj, sheet=None, streaming=False):
+    """Yield the raw cell values of each worksheet row as a list."""
+    from insight_agent.ingest import file_name, rewind
+
+    rewind(file_obj)
+    engine = _engine(streaming)
+    if engine == 'openpyxl' and file_name(file_obj).lower().endswith('.xls') and streaming:
+        engine = _engine()
+    if engine == 'calamine':
+        from python_calamine import CalamineWorkbook
+
+        book = CalamineWorkbook.from_object(file_obj)
+        try:
+            index = _pick_sheet(list(book.sheet_names), sheet)
+            worksheet = book.get_sheet_by_index(index)
+            # Rows start at the sheet's first row but cells at its first used
+            # column; pad them so positions match openpyxl's
+            pad = [None] * (worksheet.start[1] if worksheet.start else 0)
+            for row in worksheet.iter_rows():
+                yield pad + row if pad else row
+        finally:
+            book.close()
+        return
+
+    if file_name(file_obj).lower().endswith('.xls'):
+        # openpyxl only reads .xlsx; legacy workbooks go through pandas (xlrd)
+        import pandas as pd
+
+        frame = pd.read_excel(file_obj, sheet_name=sheet or 0, header=None)
+        for row in frame.itertuples(index=False):
+            yield [None if v != v else v for v in row]
+        return
+
+    import openpyxl
+
+    book = openpyxl.load_workbook(file_obj, read_only=True, data_only=True, keep_links=False)
+    try:
+        index = _pick_sheet(book.sheetnames, sheet)
+        worksheet = book.worksheets[index]
+        # Read-only sheets trust the file's stored dimensions, which some writers get wrong
+        worksheet.reset_dimensions()
+        for row in worksheet.iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        book.close()
+
+
+def _cell(value):
+    """Normalise a cell from either engine: blanks to None, whole floats to int, dates to datetime."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value if value.strip() else None
+    if isinstance(value, float):
+        if value != value:
+            return None
+        return int(value) if value.is_integer() and abs(value) < 2 ** 53 else value
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day)
+    if isinstance(value, (datetime.time, datetime.timedelta)):
+        return str(value)
+    return value
+
+
+def _header(row):
+    """Column names from the header row, named and deduplicated like pandas."""
+    cells = list(row)
+    while cells and _cell(cells[-1]) is None:
+        cells.pop()
+    names, seen = [], {}
+    for i, value in enumerate(cells):
+        value = _cell(value)
+        name = f"Unnamed: {i}" if value is None else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _column_type(values):
+    """Arrow type of a batch of (normalised) cells, or None if they are all empty."""
+    import pyarrow as pa
+
+    kinds = {type(v) for v in values if v is not None}
+    if not kinds:
+        return None
+    if kinds == {bool}:
+        return pa.bool_()
+    if kinds == {int}:
+        return pa.int64()
+    if kinds <= {int, float}:
+        return pa.float64()
+    if kinds == {datetime.datetime}:
+        return pa.timestamp('us')
+    # Mixed or text: keep the text
+    return pa.string()
+
+
+def _widen(current, arrow_type):
+    """Narrowest type holding both: integers widen to floats, anything else mixed to strings."""
+    import pyarrow as pa
+
+    if current is None or current == arrow_type:
+        return arrow_type or current
+    if arrow_type is None:
+        return current
+    if {current, arrow_type} == {pa.int64(), pa.float64()}:
+        return pa.float64()
+    return pa.string()
+
+
+def _column_array(values, arrow_type):
+    import pyarrow as pa
+
+    if pa.types.is_string(arrow_type):
+        return pa.array([v if v is None or isinstance(v, str) else str(v) for v in values], type=arrow_type)
+    if pa.types.is_floating(arrow_type):
+        values = [float(v) if isinstance(v, int) and not isinstance(v, bool) else v for v in values]
+    return pa.array(values, type=arrow_type)
+
+
+# SpreadsheetML namespaces read by _xlsx_header
+_MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_DOC_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+
+def _column_index(ref):
+    """0-based column of a cell reference such as 'AB12'."""
+    index = 0
+    for char in ref:
+        if not char.isalpha():
+            break
+        index = index * 26 + ord(char.upper()) - ord('A') + 1
+    return index - 1
+
+
+def _xlsx_sheet_path(archive, sheet):
+    from xml.etree import ElementTree as ET
+
+    book = ET.fromstring(archive.read('xl/workbook.xml'))
+    sheets = [(el.get('name'), el.get(_DOC_REL_NS + 'id')) for el in book.iter(_MAIN_NS + 'sheet')]
+    index = _pick_sheet([name for name, _ in sheets], sheet)
+    rels = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    target = next(el.get('Target') for el in rels.iter(_PKG_REL_NS + 'Relationship')
+                  if el.get('Id') == sheets[index][1])
+    return target.lstrip('/') if target.startswith('/') else 'xl/' + target
+
+
+def _shared_strings(archive, wanted):
+    """Text of the shared strings whose indexes are in `wanted`, reading no further than needed."""
+    from xml.etree import ElementTree as ET
+
+    found = {}
+    if not wanted:
+        return found
+    with archive.open('xl/sharedStrings.xml') as fh:
+        index = 0
+        for _, el in ET.iterparse(fh):
+            if el.tag != _MAIN_NS + 'si':
+                continue
+            if index in wanted:
+                found[index] = ''.join(t.text or '' for t in el.iter(_MAIN_NS + 't'))
+            el.clear()
+            index += 1
+            if index > max(wanted):
+                break
+    return found
+
+
+def _xlsx_header(file_obj, sheet, header_row):
+    """Header cells of an .xlsx sheet, parsing its XML only up to that row.
+
+    openpyxl scans the whole sheet on opening when the file has no
+    <dimension> record (common for generated workbooks), so headers are read
+    straight from the archive instead. Numeric header cells keep their
+    number; a date-formatted header reads as its serial number.
+    """
+    import zipfile
+    from xml.etree import ElementTree as ET
+
+    with zipfile.ZipFile(file_obj) as archive:
+        cells, number = None, -1
+        with archive.open(_xlsx_sheet_path(archive, sheet)) as fh:
+            for _, el in ET.iterparse(fh):
+                if el.tag != _MAIN_NS + 'row':
+                    continue
+                number = int(el.get('r')) - 1 if el.get('r') else number + 1
+                if number == header_row:
+                    cells = {}
+                    for position, cell in enumerate(el.iter(_MAIN_NS + 'c')):
+                        col = _column_index(cell.get('r')) if cell.get('r') else position
+                        value = cell.find(_MAIN_NS + 'v')
+                        if cell.get('t') == 'inlineStr':
+                            cells[col] = ''.join(t.text or '' for t in cell.iter(_MAIN_NS + 't'))
+                        elif value is not None and value.text is not None:
+                            cells[col] = (cell.get('t'), value.text)
+                if number >= header_row:
+                    # A row missing from the XML is an empty row
+                    cells = {} if cells is None else cells
+                    break
+                el.clear()
+        if cells is None:
+            raise ValueError(f"Header row {header_row + 1} is past the end of the sheet.")
+        strings = _shared_strings(archive, {int(v[1]) for v in cells.values()
+                                            if isinstance(v, tuple) and v[0] == 's'})
+
+    row = [None] * (max(cells) + 1 if cells else 0)
+    for col, value in cells.items():
+        if isinstance(value, tuple):
+            kind, text = value
+            if kind == 's':
+                value = strings.get(int(text))
+            elif kind in ('str', 'e'):
+                value = text
+            elif kind == 'b':
+                value = text == '1'
+            else:
+                value = float(text)
+        row[col] = value
+    return row
+
+
+def read_header(file_obj, sheet=None, header_row=0):
+    """Column names of a worksheet, reading no further than its header row.
+
+    Raises:
+        ValueError: if the sheet or header row does not exist.
+    """
+    import zipfile
+    from xml.etree import ElementTree as ET
+    from insight_agent.ingest import file_name, rewind
+
+    if file_name(file_obj).lower().endswith(('.xlsx', '.xlsm')):
+        try:
+            return _header(_xlsx_header(file_obj, sheet, header_row))
+        except (KeyError, StopIteration, zipfile.BadZipFile, ET.ParseError):
+            # Not a plain SpreadsheetML package; let the workbook engines try
+            rewind(file_obj)
+    rows = _iter_rows(file_obj, sheet, streaming=True)
+    try:
+        for number, row in enumerate(rows):
+            if number == header_row:
+                return _header(row)
+    finally:
+        rows.close()
+    raise ValueError(f"Header row {header_row + 1} is past the end of the sheet.")
+
+
+def iter_batches(file_obj, sheet=None, header_row=0, batch_rows=BATCH_ROWS, streaming=False):
+    """Yield a worksheet as Arrow record batches.
+
+    Column types follow the cells: booleans, integers, floats and dates keep
+    their type, anything mixed or textual becomes a string. A type only
+    widens as rows arrive (integers to floats, anything mixed to strings),
+    so a batch may have a wider schema than the ones before it; spill()
+    rewrites the earlier batches when that happens. A column still empty
+    when the first batch is yielded is a string column. Entirely empty rows
+    are skipped.
+
+    Args:
+        file_obj: path or file-like object of an .xlsx/.xls workbook.
+        sheet: sheet name or 0-based index; the first sheet by default.
+        header_row (int): 0-based row holding the column names; rows above
+            it (titles, notes) are skipped.
+        batch_rows (int): rows per batch.
+        streaming (bool): prefer the reader that stops early (see _engine),
+            for callers that only take the first batch.
+
+    Yields:
+        pyarrow.RecordBatch: consecutive batches; a sheet without data rows
+        yields one empty batch so callers can still read its columns.
+
+    Raises:
+        ValueError: if the sheet or header row does not exist.
+    """
+    import pyarrow as pa
+
+    rows = _iter_rows(file_obj, sheet, streaming)
+    names = None
+    for number, row in enumerate(rows):
+        if number == header_row:
+            names = _header(row)
+            break
+    if names is None:
+        raise ValueError(f"Header row {header_row + 1} is past the end of the sheet.")
+
+    types = [None] * len(names)
+    width = len(names)
+    columns = [[] for _ in names]
+    count = 0
+
+    def flush():
+        for i, col in enumerate(columns):
+            types[i] = _widen(types[i], _column_type(col)) or pa.string()
+        schema = pa.schema(list(zip(names, types)))
+        arrays = [_column_array(col, arrow_type) for col, arrow_type in zip(columns, types)]
+        for col in columns:
+            col.clear()
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    for row in rows:
+        cells = [_cell(v) for v in row[:width]]
+        if not any(v is not None for v in cells):
+            continue
+        cells.extend([None] * (width - len(cells)))
+        for col, value in zip(columns, cells):
+            col.append(value)
+        count += 1
+        if count % batch_rows == 0:
+            yield flush()
+    if count % batch_rows or count == 0:
+        yield flush()
+
+
+def _prune(keep):
+    try:
+        spills = [os.path.join(SPILL_DIR, f) for f in os.listdir(SPILL_DIR) if f.endswith('.parquet')]
+    except OSError:
+        return
+    spills.sort(key=os.path.getmtime, reverse=True)
+    for path in spills[SPILL_MAX_FILES:]:
+        if os.path.abspath(path) != os.path.abspath(keep):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _rewrite(source, dest, schema):
+    """Copy a spill, row group by row group, into a new file of a widened schema.
+
+    Returns:
+        pyarrow.parquet.ParquetWriter: open on `dest` for the batches still to come.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = pq.ParquetWriter(dest, schema, compression='zstd')
+    try:
+        written = pq.ParquetFile(source)
+        try:
+            for i in range(written.num_row_groups):
+                table = written.read_row_group(i)
+                arrays = [column if column.type == field.type
+                          else _column_array(column.to_pylist(), field.type)
+                          for column, field in zip(table.columns, schema)]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        finally:
+            written.close()
+    except BaseException:
+        writer.close()
+        os.remove(dest)
+        raise
+    return writer
+
+
+def spill(file_obj, sheet=None, header_row=0):
+    """Parse a worksheet once into Parquet and return the file's path.
+
+    The file is named after the workbook's content hash, sheet and header
+    row, so asking again for the same workbook returns the existing file
+    without reading the workbook.
+
+    Args:
+        file_obj: path or file-like object of an .xlsx/.xls workbook.
+        sheet: sheet name or 0-based index; the first sheet by default.
+        header_row (int): 0-based row holding the column names.
+
+    Returns:
+        str: path of the Parquet file.
+    """
+    import pyarrow.parquet as pq
+    from insight_agent.ingest import content_hash, rewind
+
+    key = content_hash(file_obj, salt=f"{SPILL_FORMAT}|{sheet}|{header_row}")
+    path = os.path.join(SPILL_DIR, f"{key}.parquet")
+    if key and os.path.exists(path):
+        os.utime(path)
+        return path
+
+    os.makedirs(SPILL_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    writer = None
+    widenings = 0
+    try:
+        for batch in iter_batches(file_obj, sheet, header_row, batch_rows=BATCH_ROWS):
+            if writer is not None and batch.schema != writer.schema:
+                # A column widened: copy what is written so far into the new schema
+                writer.close()
+                writer, written = None, tmp_path
+                widenings += 1
+                tmp_path = f"{path}.{os.getpid()}.{widenings}.tmp"
+                try:
+                    writer = _rewrite(written, tmp_path, batch.schema)
+                finally:
+                    os.remove(written)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, batch.schema, compression='zstd')
+            writer.write_batch(batch)
+        writer.close()
+        writer = None
+        if key:
+            os.replace(tmp_path, path)
+        else:
+            path = tmp_path
+    finally:
+        if writer is not None:
+            writer.close()
+            os.remove(tmp_path)
+        rewind(file_obj)
+    _prune(path)
+    return path
+
+
+def to_frame(batch):
+    """Convert a spilled batch to pandas with the nullable dtypes used for CSV chunks."""
+    import pandas as pd
+    import pyarrow as pa
+
+    mapper = {pa.int64(): pd.Int64Dtype(), pa.bool_(): pd.BooleanDtype()}.get
+    return batch.to_pandas(types_mapper=mapper)
@@ -0,0 +1,76 @@
+import json
+import asyncio
+
+
+class _Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class RateLimitError(Exception):
+    """Stand-in for a provider 429."""
+
+    status_code = 429
+
+
+class FakeLLM:
+    """Local stand-in for litellm.acompletion used by tests and benchmarks.
+
+    Replies with {"sql": ...} after a fixed latency, optionally streaming the
+    reply in small chunks and failing every Nth call with a rate limit.
+
+    Args:
+        sql (str or callable): SQL to return, or a function prompt -> SQL.
+        latency (float): seconds before the reply (or first chunk) arrives.
+        chunk_size (int): characters per streamed chunk.
+        chunk_delay (float): seconds between streamed chunks.
+        rate_limit_every (int): if set, every Nth call raises RateLimitError.
+        trailing_text (str): text the model keeps generating after the JSON
+            object, to show the streaming parser returning early.
+    """
+
+    def __init__(self, sql='SELECT * FROM data', latency=0.05, chunk_size=8, chunk_delay=0.0,
+                 rate_limit_every=None, trailing_text=''):
+        self.sql = sql
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.rate_limit_every = rate_limit_every
+        self.trailing_text = trailing_text
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.chunks_sent = 0
+
+    def _reply(self, messages):
+        prompt = messages[-1]['content'] if messages else ''
+        sql = self.sql(prompt) if callable(self.sql) else self.sql
+        return json.dumps({'sql': sql}) + self.trailing_text
+
+    async def _stream(self, text):
+        try:
+            for i in range(0, len(text), self.chunk_size):
+                if self.chunk_delay:
+                    await asyncio.sleep(self.chunk_delay)
+                self.chunks_sent += 1
+                yield _Obj(choices=[_Obj(delta=_Obj(content=text[i:i + self.chunk_size]))])
+        finally:
+            self.in_flight -= 1
+
+    async def acompletion(self, messages=None, stream=False, **kwargs):
+        self.calls += 1
+        call_no = self.calls
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.rate_limit_every and call_no % self.rate_limit_every == 0:
+                raise RateLimitError('rate limited')
+        except BaseException:
+            self.in_flight -= 1
+            raise
+        text = self._reply(messages)
+        if stream:
+            return self._stream(text)
+        self.in_flight -= 1
+        return _Obj(choices=[_Obj(message=_Obj(content=text))])
@@ -0,0 +1,92 @@
+import os
+import json
+
+from insight_agent.catalog import Catalog
+
+
+def _write_kind(root, kind, mapping, profile=None, description=None):
+    kind_dir = root / 'kinds' / kind / 'v1'
+    kind_dir.mkdir(parents=True, exist_ok=True)
+    (kind_dir / 'mapping_effective.json').write_text(json.dumps(mapping))
+    if description is not None:
+        (kind_dir / 'description.md').write_text(description)
+    if profile is not None:
+        dataset_dir = root / 'datasets' / kind
+        dataset_dir.mkdir(parents=True, exist_ok=True)
+        (dataset_dir / 'profile.json').write_text(json.dumps(profile))
+
+
+def test_catalog_loads_typed_metadata(tmp_path):
+    mapping = [
+        {"original_name": "Retailer", "canonical_name": "retailer", "type": "Location attribution",
+         "description": "Retailer banner", "filter_display_order": "2"},
+        {"original_name": "Dollar Sales", "canonical_name": "dollar_sales", "type": "POS measure",
+         "description": "Dollar sales", "filter_display_order": ""},
+    ]
+    profile = {
+        "retailer": {"values": ["A", "B"], "filter_display_order": 2},
+        "brand": {"values": ["X"], "filter_display_order": 1},
+        "dollar_sales": {"dtype": "numeric", "count": 3},
+    }
+    _write_kind(tmp_path, 'k1', mapping, profile, 'Weekly POS data')
+    catalog = Catalog(root=str(tmp_path))
+
+    assert catalog.kinds() == ['k1']
+    entry = catalog.get('k1')
+    assert entry.version == 'v1'
+    assert entry.description == 'Weekly POS data'
+    assert entry.mapping == mapping
+    assert entry.column('retailer').filter_display_order == 2
+    assert entry.column('dollar_sales').filter_display_order is None
+    assert entry.column('dollar_sales').is_measure
+    assert [col for col, _ in entry.filters()] == ['brand', 'retailer']
+
+
+def test_catalog_reuses_entries_until_files_change(tmp_path):
+    _write_kind(tmp_path, 'k1', [{"original_name": "A", "canonical_name": "a"}])
+    catalog = Catalog(root=str(tmp_path))
+    first = catalog.get('k1')
+    assert catalog.get('k1') is first
+
+    _write_kind(tmp_path, 'k1', [{"original_name": "A", "canonical_name": "a"},
+                                 {"original_name": "B", "canonical_name": "b"}])
+    second = catalog.get('k1')
+    assert second is not first
+    assert [c.canonical_name for c in second.columns] == ['a', 'b']
+
+    os.makedirs(tmp_path / 'kinds' / 'k2')
+    assert catalog.kinds() == ['k1', 'k2']
+    catalog.invalidate('k1')
+    assert catalog.get('k1') is not second
+
+
+def test_catalog_defaults_to_latest_version(tmp_path):
+    _write_kind(tmp_path, 'k1', [{"original_name": "A", "canonical_name": "a"}])
+    v2 = tmp_path / 'kinds' / 'k1' / 'v2'
+    v2.mkdir()
+    (v2 / 'mapping_effective.json').write_text(json.dumps([{"original_name": "A", "canonical_name": "a2"}]))
+    catalog = Catalog(root=str(tmp_path))
+    assert catalog.versions('k1') == ['v1', 'v2']
+    assert catalog.get('k1').columns[0].canonical_name == 'a2'
+    assert catalog.get('k1', 'v1').columns[0].canonical_name == 'a'
+
+
+def test_catalog_lists_versions_only_when_the_kind_directory_changes(tmp_path, monkeypatch):
+    from insight_agent import catalog as catalog_module
+
+    _write_kind(tmp_path, 'k1', [{"original_name": "A", "canonical_name": "a"}])
+    catalog = Catalog(root=str(tmp_path))
+    listed = []
+    listdir = os.listdir
+    monkeypatch.setattr(catalog_module.os, 'listdir', lambda path: listed.append(path) or listdir(path))
+    for _ in range(3):
+        assert catalog.get('k1').version == 'v1'
+    assert len(listed) == 1
+
+    v2 = tmp_path / 'kinds' / 'k1' / 'v2'
+    v2.mkdir()
+    (v2 / 'mapping_effective.json').write_text(json.dumps([{"original_name": "A", "canonical_name": "a2"}]))
+    # A new version directory changes the kind directory's mtime
+    os.utime(tmp_path / 'kinds' / 'k1', ns=(0, os.stat(tmp_path / 'kinds' / 'k1').st_mtime_ns + 1))
+    assert catalog.get('k1').version == 'v2'
+    assert len(listed) == 2
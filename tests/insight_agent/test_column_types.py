@@ -0,0 +1,70 @@
+import pandas as pd
+import pyarrow as pa
+
+from insight_agent.column_types import TableCaster, sort_keys, sort_table, storage_kind
+
+
+MAPPING = [
+    {"original_name": "Week", "canonical_name": "week", "type": "Time", "data_type": "date",
+     "date_format": "%m/%d/%Y"},
+    {"original_name": "Retailer", "canonical_name": "retailer", "type": "Location attribution", "data_type": "text"},
+    {"original_name": "Units", "canonical_name": "units", "type": "POS measure", "data_type": "integer"},
+    {"original_name": "Dollars", "canonical_name": "dollars", "type": "POS measure", "data_type": "",
+     "inferred_type": "currency"},
+    {"original_name": "Promo", "canonical_name": "promo", "type": "Flag", "data_type": "boolean"},
+]
+
+
+def test_storage_kind_prefers_declared_data_type():
+    assert storage_kind({'data_type': 'Whole Number', 'inferred_type': 'string'}) == 'integer'
+    assert storage_kind({'data_type': '', 'inferred_type': 'percent'}) == 'float'
+    assert storage_kind({'format_hint': 'datetime'}) == 'timestamp'
+    assert storage_kind({}) is None
+
+
+def test_storage_kind_matches_whole_words():
+    assert storage_kind({'data_type': 'account', 'inferred_type': 'string'}) == 'string'
+    assert storage_kind({'data_type': 'weekday', 'inferred_type': 'string'}) == 'string'
+    assert storage_kind({'data_type': 'update', 'inferred_type': 'string'}) == 'string'
+    assert storage_kind({'data_type': 'print'}) is None
+    assert storage_kind({'data_type': 'int64'}) == 'integer'
+    assert storage_kind({'data_type': 'datetime64[ns]'}) == 'timestamp'
+    assert storage_kind({'data_type': 'Dollars'}) == 'currency'
+    assert storage_kind({'data_type': 'unit counts'}) == 'integer'
+
+
+def test_caster_produces_compact_types():
+    caster = TableCaster(MAPPING)
+    chunk = pd.DataFrame({
+        'week': ['01/06/2024', '01/13/2024', 'bad'],
+        'retailer': ['Walmart', 'Target', 'Walmart'],
+        'units': ['1,200', '3', None],
+        'dollars': ['$1,200.50', '(4.25)', '$0.10'],
+        'promo': ['Y', 'n', 'yes'],
+    })
+    table = caster.to_arrow(caster.cast_frame(chunk))
+    schema = table.schema
+    assert schema.field('week').type == pa.date32()
+    assert pa.types.is_dictionary(schema.field('retailer').type)
+    assert schema.field('units').type == pa.int64()
+    assert schema.field('dollars').type == pa.decimal128(18, 2)
+    assert schema.field('promo').type == pa.bool_()
+    assert table.column('units').to_pylist() == [1200, 3, None]
+    assert [float(v) for v in table.column('dollars').to_pylist()] == [1200.5, -4.25, 0.1]
+    assert table.column('promo').to_pylist() == [True, False, True]
+    assert caster.coerced == {'week': 1}
+
+
+def test_mostly_unparseable_column_is_kept_as_text():
+    caster = TableCaster([{"original_name": "a", "canonical_name": "a", "format_hint": "numeric"}])
+    table = caster.to_arrow(caster.cast_frame(pd.DataFrame({'a': ['store1', 'store2', '3']})))
+    assert table.column('a').to_pylist() == ['store1', 'store2', '3']
+    assert caster.coerced == {}
+
+
+def test_sort_keys_and_sort_table():
+    assert sort_keys(MAPPING) == ['week']
+    assert sort_keys(MAPPING + [{"canonical_name": "retailer", "sort_order": 2},
+                                {"canonical_name": "week", "sort_order": 1}]) == ['week', 'retailer']
+    table = pa.table({'week': [3, 1, None, 2], 'v': ['c', 'a', 'n', 'b']})
+    assert sort_table(table, ['week', 'missing']).column('v').to_pylist() == ['a', 'b', 'c', 'n']
@@ -0,0 +1,42 @@
+import os
+import shutil
+import pandas as pd
+import pytest
+from insight_agent.connection_manager import ConnectionManager
+
+
+def test_cursor_reuses_database_until_parquet_changes(tmp_path):
+    kind = 'test_pool_kind'
+    datasets_dir = os.path.join('domain', 'catalog', 'datasets', kind)
+    os.makedirs(datasets_dir, exist_ok=True)
+    dest = os.path.join(datasets_dir, 'latest.parquet')
+    p = tmp_path / 'sample.parquet'
+    pd.DataFrame({'a': [1, 2, 3]}).to_parquet(p)
+    shutil.copy(p, dest)
+
+    manager = ConnectionManager(threads=2)
+    try:
+        with manager.cursor(kind) as cur:
+            assert cur.execute('SELECT sum(a) FROM data').fetchone()[0] == 6
+            assert cur.execute("SELECT current_setting('threads')").fetchone()[0] == 2
+        first = manager._databases[kind]
+        with manager.cursor(kind) as cur:
+            cur.execute('SELECT count(*) FROM data').fetchone()
+        # Same file on disk -> same pooled database
+        assert manager._databases[kind] is first
+
+        # Rewriting the parquet invalidates the pooled database
+        pd.DataFrame({'a': [10, 20]}).to_parquet(dest)
+        with manager.cursor(kind) as cur:
+            assert cur.execute('SELECT sum(a) FROM data').fetchone()[0] == 30
+        assert manager._databases[kind] is not first
+    finally:
+        manager.close()
+        shutil.rmtree(datasets_dir, ignore_errors=True)
+
+
+def test_cursor_missing_dataset_raises():
+    manager = ConnectionManager()
+    with pytest.raises(FileNotFoundError):
+        with manager.cursor('no_such_kind'):
+            pass
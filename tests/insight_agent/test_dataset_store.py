@@ -0,0 +1,225 @@
+import os
+import json
+import shutil
+import pandas as pd
+from insight_agent.instance_manager import onboard_instance
+from insight_agent.dataset_store import load_manifest, dataset_dir
+from insight_agent.query_executor import execute_query
+
+
+def _write_kind(kind):
+    kind_dir = os.path.join('domain', 'catalog', 'kinds', kind, 'v1')
+    os.makedirs(kind_dir, exist_ok=True)
+    mapping = [
+        {"original_name": "Week", "canonical_name": "week", "type": "Time", "partition_order": 1},
+        {"original_name": "Retailer", "canonical_name": "retailer", "type": "Location", "filter_display_order": 1, "partition_order": 2},
+        {"original_name": "Sales", "canonical_name": "sales", "type": "POS measure"},
+    ]
+    with open(os.path.join(kind_dir, 'mapping_effective.json'), 'w') as f:
+        json.dump(mapping, f)
+
+
+def _week_csv(path, week, retailers):
+    rows = [{'Week': week, 'Retailer': r, 'Sales': i + 1.0} for i, r in enumerate(retailers)]
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+def test_partitioned_append_and_replace(tmp_path):
+    kind = 'mock_partitioned_kind'
+    _write_kind(kind)
+    try:
+        w1 = tmp_path / 'w1.csv'
+        _week_csv(w1, '2024-01-01', ['Walmart', 'Target'])
+        ok, msg = onboard_instance(kind, str(w1))
+        assert ok, msg
+
+        w2 = tmp_path / 'w2.csv'
+        _week_csv(w2, '2024-01-08', ['Walmart'])
+        ok, msg = onboard_instance(kind, str(w2), mode='append')
+        assert ok, msg
+
+        manifest = load_manifest(kind)
+        assert manifest['version'] == 2
+        assert manifest['layout'] == 'partitioned'
+        assert manifest['partition_keys'] == ['week', 'retailer']
+        assert manifest['rows'] == 3
+        assert len(manifest['files']) == 3
+        assert any('week=2024-01-08/retailer=Walmart' in f for f in manifest['files'])
+
+        res = execute_query(kind, 'SELECT retailer, sum(sales) AS s FROM data GROUP BY retailer ORDER BY retailer')
+        assert res['retailer'].tolist() == ['Target', 'Walmart']
+        assert res['s'].tolist() == [2.0, 2.0]
+
+        # Appends merge into the existing profile instead of rebuilding it
+        with open(os.path.join(dataset_dir(kind), 'profile.json')) as pf:
+            prof = json.load(pf)
+        assert prof['sales']['count'] == 3
+        assert set(prof['retailer']['values']) == {'Walmart', 'Target'}
+
+        # Replace drops the previous files
+        ok, msg = onboard_instance(kind, str(w2))
+        assert ok, msg
+        manifest = load_manifest(kind)
+        assert manifest['rows'] == 1 and len(manifest['files']) == 1
+        res = execute_query(kind, 'SELECT count(*) AS n FROM data')
+        assert res['n'].tolist() == [1]
+    finally:
+        shutil.rmtree(dataset_dir(kind), ignore_errors=True)
+        shutil.rmtree(os.path.join('domain', 'catalog', 'kinds', kind), ignore_errors=True)
+
+
+def test_append_requires_partition_keys(tmp_path):
+    kind = 'mock_unpartitioned_kind'
+    kind_dir = os.path.join('domain', 'catalog', 'kinds', kind, 'v1')
+    os.makedirs(kind_dir, exist_ok=True)
+    with open(os.path.join(kind_dir, 'mapping_effective.json'), 'w') as f:
+        json.dump([{"original_name": "a", "canonical_name": "a"}], f)
+    inst = tmp_path / 'i.csv'
+    inst.write_text('a\n1\n')
+    try:
+        ok, msg = onboard_instance(kind, str(inst), mode='append')
+        assert ok is False
+        assert 'partition' in msg
+    finally:
+        shutil.rmtree(dataset_dir(kind), ignore_errors=True)
+        shutil.rmtree(os.path.join('domain', 'catalog', 'kinds', kind), ignore_errors=True)
+
+
+def _write_keyed_kind(kind):
+    kind_dir = os.path.join('domain', 'catalog', 'kinds', kind, 'v1')
+    os.makedirs(kind_dir, exist_ok=True)
+    mapping = [
+        {"original_name": "Week", "canonical_name": "week", "type": "Time", "partition_order": 1, "key_order": 1},
+        {"original_name": "Store", "canonical_name": "store", "type": "Location", "filter_display_order": 1,
+         "key_order": 2},
+        {"original_name": "Sales", "canonical_name": "sales", "type": "POS measure"},
+    ]
+    with open(os.path.join(kind_dir, 'mapping_effective.json'), 'w') as f:
+        json.dump(mapping, f)
+
+
+def test_upsert_rewrites_only_touched_partitions_and_skips_unchanged_files(tmp_path):
+    kind = 'mock_upsert_kind'
+    _write_keyed_kind(kind)
+    try:
+        base = tmp_path / 'base.csv'
+        pd.DataFrame({'Week': ['2024-01-01'] * 2 + ['2024-01-08'] * 2, 'Store': ['A', 'B', 'A', 'B'],
+                      'Sales': [1.0, 2.0, 3.0, 4.0]}).to_csv(base, index=False)
+        ok, msg = onboard_instance(kind, str(base))
+        assert ok, msg
+        untouched = [f for f in load_manifest(kind)['files'] if 'week=2024-01-01' in f]
+
+        # The same file again is recognised without rewriting anything
+        ok, msg = onboard_instance(kind, str(base))
+        assert ok and msg.startswith('No changes'), msg
+        assert load_manifest(kind)['version'] == 1
+
+        # Correct store B, add store C in the second week; the last duplicate wins
+        delta = tmp_path / 'delta.csv'
+        pd.DataFrame({'Week': ['2024-01-08'] * 3, 'Store': ['B', 'C', 'B'],
+                      'Sales': [40.0, 5.0, 41.0]}).to_csv(delta, index=False)
+        ok, msg = onboard_instance(kind, str(delta), mode='upsert')
+        assert ok, msg
+        assert '1 rows inserted, 1 updated' in msg
+
+        manifest = load_manifest(kind)
+        assert manifest['rows'] == 5
+        assert [f for f in manifest['files'] if 'week=2024-01-01' in f] == untouched
+        assert not os.path.exists(os.path.join(dataset_dir(kind), 'staging'))
+        res = execute_query(kind, 'SELECT week, store, sales FROM data ORDER BY week, store')
+        assert res['sales'].tolist() == [1.0, 2.0, 3.0, 41.0, 5.0]
+
+        # The profile is merged from per-file states, matching a full rebuild
+        with open(os.path.join(dataset_dir(kind), 'profile.json')) as pf:
+            prof = json.load(pf)
+        assert prof['sales']['count'] == 5
+        assert prof['sales']['max'] == 41.0
+        assert set(prof['store']['values']) == {'A', 'B', 'C'}
+
+        ok, msg = onboard_instance(kind, str(delta), mode='upsert')
+        assert ok and msg.startswith('No changes'), msg
+    finally:
+        shutil.rmtree(dataset_dir(kind), ignore_errors=True)
+        shutil.rmtree(os.path.join('domain', 'catalog', 'kinds', kind), ignore_errors=True)
+
+
+def test_upsert_requires_key_columns(tmp_path):
+    kind = 'mock_partitioned_kind_nokeys'
+    _write_kind(kind)
+    inst = tmp_path / 'w.csv'
+    _week_csv(inst, '2024-01-01', ['Walmart'])
+    try:
+        ok, msg = onboard_instance(kind, str(inst), mode='upsert')
+        assert ok is False
+        assert 'key_order' in msg
+    finally:
+        shutil.rmtree(dataset_dir(kind), ignore_errors=True)
+        shutil.rmtree(os.path.join('domain', 'catalog', 'kinds', kind), ignore_errors=True)
+
+
+def test_upsert_merges_into_a_dataset_written_before_manifests(tmp_path):
+    kind = 'mock_legacy_upsert_kind'
+    kind_dir = os.path.join('domain', 'catalog', 'kinds', kind, 'v1')
+    os.makedirs(kind_dir, exist_ok=True)
+    with open(os.path.join(kind_dir, 'mapping_effective.json'), 'w') as f:
+        json.dump([{"original_name": "Store", "canonical_name": "store", "type": "Location", "key_order": 1},
+                   {"original_name": "Sales", "canonical_name": "sales", "type": "POS measure"}], f)
+    # The baseline layout: a bare latest.parquet without manifest.json
+    os.makedirs(dataset_dir(kind), exist_ok=True)
+    pd.DataFrame({'store': ['A', 'B'], 'sales': [1.0, 2.0]}).to_parquet(
+        os.path.join(dataset_dir(kind), 'latest.parquet'))
+    delta = tmp_path / 'delta.csv'
+    pd.DataFrame({'Store': ['B', 'C'], 'Sales': [20.0, 3.0]}).to_csv(delta, index=False)
+    try:
+        ok, msg = onboard_instance(kind, str(delta), mode='upsert')
+        assert ok, msg
+        assert '1 rows inserted, 1 updated' in msg
+        assert load_manifest(kind)['rows'] == 3
+        res = execute_query(kind, 'SELECT store, sales FROM data ORDER BY store')
+        assert res['sales'].tolist() == [1.0, 20.0, 3.0]
+    finally:
+        shutil.rmtree(dataset_dir(kind), ignore_errors=True)
+        shutil.rmtree(os.path.join('domain', 'catalog', 'kinds', kind), ignore_errors=True)
+
+
+def test_append_to_a_dataset_written_before_manifests_asks_for_a_replace(tmp_path):
+    kind = 'mock_legacy_append_kind'
+    _write_kind(kind)
+    legacy = os.path.join(dataset_dir(kind), 'latest.parquet')
+    os.makedirs(dataset_dir(kind), exist_ok=True)
+    pd.DataFrame({'week': ['2024-01-01'], 'retailer': ['Walmart'], 'sales': [1.0]}).to_parquet(legacy)
+    w2 = tmp_path / 'w2.csv'
+    _week_csv(w2, '2024-01-08', ['Walmart'])
+    try:
+        ok, msg = onboard_instance(kind, str(w2), mode='append')
+        assert ok is False and 'replace first' in msg
+        # Nothing was written over the existing rows
+        assert load_manifest(kind) is None
+        assert execute_query(kind, 'SELECT count(*) AS n FROM data')['n'].tolist() == [1]
+    finally:
+        shutil.rmtree(dataset_dir(kind), ignore_errors=True)
+        shutil.rmtree(os.path.join('domain', 'catalog', 'kinds', kind), ignore_errors=True)
+
+
+def test_append_without_saved_sketches_profiles_the_whole_dataset(tmp_path):
+    kind = 'mock_unsketched_append_kind'
+    _write_kind(kind)
+    try:
+        w1 = tmp_path / 'w1.csv'
+        _week_csv(w1, '2024-01-01', ['Walmart', 'Target'])
+        ok, msg = onboard_instance(kind, str(w1))
+        assert ok, msg
+        # As for data profiled before profile_state.json was saved
+        os.remove(os.path.join(dataset_dir(kind), 'profile_state.json'))
+
+        w2 = tmp_path / 'w2.csv'
+        _week_csv(w2, '2024-01-08', ['Costco'])
+        ok, msg = onboard_instance(kind, str(w2), mode='append')
+        assert ok, msg
+        with open(os.path.join(dataset_dir(kind), 'profile.json')) as pf:
+            prof = json.load(pf)
+        assert prof['sales']['count'] == 3
+        assert set(prof['retailer']['values']) == {'Walmart', 'Target', 'Costco'}
+    finally:
+        shutil.rmtree(dataset_dir(kind), ignore_errors=True)
+        shutil.rmtree(os.path.join('domain', 'catalog', 'kinds', kind), ignore_errors=True)
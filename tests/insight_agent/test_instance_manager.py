@@ -50,14 +50,13 @@ def test_onboard_instance_success(tmp_path):
     assert isinstance(prof['store_id'], dict)
     assert set(prof['store_id']['values']) == {'store1','store2'}
     assert prof['store_id']['filter_display_order'] == 1
+    # Non-filterable columns are profiled for statistics only
+    assert prof['label']['distinct_estimate'] == 3
+    assert 'values' not in prof['label']
 
-    # cleanup dataset and profile
-    try:
-        os.remove(latest_path)
-        os.remove(profile_path)
-        os.removedirs(os.path.dirname(latest_path))
-    except Exception:
-        pass
+    # cleanup dataset, profile and manifest
+    import shutil
+    shutil.rmtree(os.path.dirname(latest_path), ignore_errors=True)
 
     # cleanup mapping
     try:
@@ -65,3 +64,144 @@ def test_onboard_instance_success(tmp_path):
         os.removedirs(os.path.dirname(os.path.dirname(kind_dir)))
     except Exception:
         pass
+
+
+def test_onboard_instance_streams_chunks(tmp_path):
+    kind_dir = os.path.join('domain', 'catalog', 'kinds', 'mock_stream_kind', 'v1')
+    os.makedirs(kind_dir, exist_ok=True)
+    mapping = [
+        {"original_name": "Store", "canonical_name": "store_id", "type": "market_or_store", "filter_display_order": 1},
+        {"original_name": "Units", "canonical_name": "units", "type": "POS measure", "filter_display_order": ""},
+    ]
+    import json
+    with open(os.path.join(kind_dir, 'mapping_effective.json'), 'w') as f:
+        json.dump(mapping, f)
+
+    # Integer column with a blank, a decimal and text after the first chunk must keep one schema
+    later = {20: '', 22: '2.5', 24: 'lots'}
+    inst_path = tmp_path / 'instance.csv'
+    with open(inst_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Store', 'Units'])
+        for i in range(25):
+            writer.writerow([f'store{i % 3}', later.get(i, i)])
+
+    progress = []
+    with open(inst_path, 'rb') as inst_f:
+        success, message = onboard_instance('mock_stream_kind', inst_f,
+                                            progress_callback=lambda rows, frac: progress.append((rows, frac)),
+                                            chunksize=10)
+    assert success is True, message
+    # Values that do not fit the column's type are reported, not silently changed
+    assert 'units: 2' in message
+
+    import pandas as pd
+    import pyarrow.parquet as pq
+    latest_path = os.path.join('domain', 'catalog', 'datasets', 'mock_stream_kind', 'latest.parquet')
+    # one row group per chunk
+    assert pq.ParquetFile(latest_path).metadata.num_row_groups == 3
+    df_saved = pd.read_parquet(latest_path)
+    assert len(df_saved) == 25
+    assert df_saved['units'].isna().sum() == 3
+    assert str(pq.read_schema(latest_path).field('units').type) == 'int64'
+    assert df_saved['units'].sum() == sum(i for i in range(25) if i not in later)
+    assert [rows for rows, _ in progress][:3] == [10, 20, 25]
+    assert progress[-1] == (25, 1.0)
+
+    with open(os.path.join('domain', 'catalog', 'datasets', 'mock_stream_kind', 'profile.json')) as pf:
+        prof = json.load(pf)
+    assert prof['store_id']['values'] == ['store0', 'store1', 'store2']
+
+    import shutil
+    shutil.rmtree(os.path.join('domain', 'catalog', 'datasets', 'mock_stream_kind'), ignore_errors=True)
+    shutil.rmtree(os.path.join('domain', 'catalog', 'kinds', 'mock_stream_kind'), ignore_errors=True)
+
+
+def _typed_kind(kind):
+    import json
+    kind_dir = os.path.join('domain', 'catalog', 'kinds', kind, 'v1')
+    os.makedirs(kind_dir, exist_ok=True)
+    mapping = [
+        {"original_name": "Week", "canonical_name": "week", "data_type": "date"},
+        {"original_name": "Units", "canonical_name": "units", "data_type": "integer", "type": "POS measure"},
+        {"original_name": "Store", "canonical_name": "store", "data_type": "string"},
+    ]
+    with open(os.path.join(kind_dir, 'mapping_effective.json'), 'w') as f:
+        json.dump(mapping, f)
+
+
+def test_wrong_header_is_rejected_before_any_row_is_parsed(tmp_path, monkeypatch):
+    import shutil
+    from insight_agent import ingest
+    kind = 'mock_header_kind'
+    _typed_kind(kind)
+    inst_path = tmp_path / 'wrong.csv'
+    inst_path.write_text('Week,Units,Region\n' + '2024-01-01,1,x\n' * 1000)
+
+    def no_parse(*args, **kwargs):
+        raise AssertionError('rows were parsed')
+
+    monkeypatch.setattr(ingest, 'iter_chunks', no_parse)
+    monkeypatch.setattr(ingest, 'content_hash', no_parse)
+    try:
+        success, message = onboard_instance(kind, str(inst_path))
+        assert success is False
+        assert "Missing: ['Store']" in message and "Extra: ['Region']" in message
+    finally:
+        shutil.rmtree(os.path.join('domain', 'catalog', 'kinds', kind), ignore_errors=True)
+
+
+def test_preview_reports_conversion_error_rates_without_writing(tmp_path):
+    import shutil
+    from insight_agent.dataset_store import dataset_dir
+    from insight_agent.instance_manager import preview_instance
+    kind = 'mock_preview_kind'
+    _typed_kind(kind)
+    inst_path = tmp_path / 'inst.csv'
+    with open(inst_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Store', 'Week', 'Units'])
+        for i in range(20):
+            writer.writerow([f's{i}', 'soon' if i < 2 else '2024-01-01', 'lots' if i == 5 else i])
+    try:
+        success, message, report = preview_instance(kind, str(inst_path), sample_rows=10)
+        assert success is True
+        by_column = {r['column']: r for r in report}
+        assert by_column['Week']['checked'] == 10 and by_column['Week']['failed'] == 2
+        assert by_column['Week']['error_rate'] == 0.2 and by_column['Week']['examples'] == ['soon']
+        assert by_column['Units']['failed'] == 1 and by_column['Units']['stored_as'] == 'integer'
+        assert by_column['Store']['failed'] == 0
+        assert 'Week, Units' in message
+        assert not os.path.exists(dataset_dir(kind))
+
+        success, message, report = preview_instance(kind, str(tmp_path / 'missing.csv'))
+        assert success is False and report == []
+    finally:
+        shutil.rmtree(os.path.join('domain', 'catalog', 'kinds', kind), ignore_errors=True)
+
+
+def test_onboard_instance_uses_the_latest_kind_version(tmp_path):
+    import json
+    import shutil
+    import pandas as pd
+    from insight_agent.catalog import get_catalog
+
+    kind = 'mock_versioned_kind'
+    for version, canonical in (('v1', 'units_v1'), ('v2', 'units')):
+        kind_dir = os.path.join('domain', 'catalog', 'kinds', kind, version)
+        os.makedirs(kind_dir, exist_ok=True)
+        with open(os.path.join(kind_dir, 'mapping_effective.json'), 'w') as f:
+            json.dump([{"original_name": "Units", "canonical_name": canonical, "type": "POS measure"}], f)
+    get_catalog().invalidate(kind)
+    inst_path = tmp_path / 'instance.csv'
+    inst_path.write_text('Units\n1\n2\n')
+    try:
+        success, message = onboard_instance(kind, str(inst_path))
+        assert success, message
+        # Prompts describe the latest version, so the data must use its names
+        df = pd.read_parquet(os.path.join('domain', 'catalog', 'datasets', kind, 'latest.parquet'))
+        assert list(df.columns) == ['units']
+    finally:
+        shutil.rmtree(os.path.join('domain', 'catalog', 'datasets', kind), ignore_errors=True)
+        shutil.rmtree(os.path.join('domain', 'catalog', 'kinds', kind), ignore_errors=True)
+        get_catalog().invalidate(kind)
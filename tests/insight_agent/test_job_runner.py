@@ -0,0 +1,84 @@
+import os
+import csv
+import json
+import shutil
+
+import pandas as pd
+import pytest
+
+from insight_agent.job_runner import JobRunner, JobStore
+
+
+@pytest.fixture
+def kind():
+    kind = 'test_kind_jobs'
+    kind_dir = os.path.join('domain', 'catalog', 'kinds', kind, 'v1')
+    os.makedirs(kind_dir, exist_ok=True)
+    mapping = [
+        {"original_name": "Store", "canonical_name": "store_id", "type": "market_or_store", "filter_display_order": 1},
+        {"original_name": "Units", "canonical_name": "units", "type": "POS measure", "data_type": "integer"},
+    ]
+    with open(os.path.join(kind_dir, 'mapping_effective.json'), 'w') as f:
+        json.dump(mapping, f)
+    yield kind
+    shutil.rmtree(os.path.join('domain', 'catalog', 'kinds', kind), ignore_errors=True)
+    shutil.rmtree(os.path.join('domain', 'catalog', 'datasets', kind), ignore_errors=True)
+
+
+def _instance(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Store', 'Units'])
+        for i in range(rows):
+            writer.writerow([f'store{i % 3}', i])
+    return str(path)
+
+
+def test_onboarding_job_runs_in_a_worker_process(kind, tmp_path):
+    runner = JobRunner(workers=2, db_path=str(tmp_path / 'jobs' / 'jobs.sqlite3'))
+    try:
+        with open(_instance(tmp_path / 'instance.csv', 50), 'rb') as upload:
+            job_id = runner.submit('onboard_instance', kind, {'instance_file': upload}, mode='replace')
+        job = runner.wait(job_id, timeout=120)
+        assert job['status'] == 'succeeded', job['message']
+        assert job['rows'] == 50 and job['progress'] == 1.0
+        assert job['duration_s'] > 0 and job['pid'] != os.getpid()
+        # The uploaded copy is removed once the job succeeded
+        assert not os.path.exists(os.path.join(runner.jobs_dir, job_id))
+        df = pd.read_parquet(os.path.join('domain', 'catalog', 'datasets', kind, 'latest.parquet'))
+        assert len(df) == 50
+    finally:
+        runner.shutdown()
+
+
+def test_failed_job_can_be_retried_and_queued_job_cancelled(tmp_path):
+    runner = JobRunner(workers=1, db_path=str(tmp_path / 'jobs' / 'jobs.sqlite3'))
+    try:
+        path = _instance(tmp_path / 'instance.csv', 5)
+        failing = runner.submit('onboard_instance', 'no_such_kind_jobs', {'instance_file': path})
+        queued = runner.submit('onboard_instance', 'no_such_kind_jobs', {'instance_file': path})
+        # Jobs of one kind never overlap, so the second waits for the first
+        assert runner.cancel(queued) is True
+        assert runner.get(queued)['status'] == 'cancelled'
+
+        job = runner.wait(failing, timeout=120)
+        assert job['status'] == 'failed'
+        assert runner.retry(failing) is True
+        job = runner.wait(failing, timeout=120)
+        assert job['status'] == 'failed' and job['attempts'] == 2
+        assert runner.retry(queued) is True
+    finally:
+        runner.shutdown()
+
+
+def test_jobs_left_running_are_marked_interrupted(tmp_path):
+    db_path = str(tmp_path / 'jobs.sqlite3')
+    store = JobStore(db_path)
+    job_id = store.create('onboard_instance', 'k', {'files': {}})
+    store.update(job_id, status='running')
+    runner = JobRunner(workers=1, db_path=db_path)
+    try:
+        job = runner.get(job_id)
+        assert job['status'] == 'failed' and 'Interrupted' in job['message']
+    finally:
+        runner.shutdown()
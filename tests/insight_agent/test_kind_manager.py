@@ -92,3 +92,30 @@ def test_create_kind_failure_missing_columns(tmp_path):
         success, message = create_kind(f, 'test_kind_invalid')
 
     assert success is False
+
+
+def test_create_kind_reports_progress_and_can_be_cancelled(tmp_path):
+    import shutil
+    import pytest
+
+    mapping_path = tmp_path / "mapping.csv"
+    mapping_path.write_text("original_name,canonical_name,type,description,data_type\na,A,string,desc,text\n")
+    sample_path = tmp_path / "sample.csv"
+    sample_path.write_text("a\n1\n2\n")
+    kind_dir = os.path.join('domain', 'catalog', 'kinds', 'test_kind_cancel')
+    calls = []
+
+    def cancel_after_inference(rows, fraction):
+        calls.append((rows, fraction))
+        if fraction == 0.6:
+            raise RuntimeError('cancelled')
+
+    try:
+        with open(mapping_path, 'rb') as mapping_f, open(sample_path, 'rb') as sample_f:
+            with pytest.raises(RuntimeError):
+                create_kind(mapping_f, 'test_kind_cancel', sample_f, progress_callback=cancel_after_inference)
+        assert calls == [(0, 0.1), (2, 0.6)]
+        # Stopped before the mapping that makes the kind usable
+        assert not os.path.exists(os.path.join(kind_dir, 'v1', 'mapping_effective.json'))
+    finally:
+        shutil.rmtree(kind_dir, ignore_errors=True)
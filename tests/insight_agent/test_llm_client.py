@@ -12,3 +12,59 @@ def test_get_sql_from_prompt_monkeypatch(monkeypatch):
 
     sql = get_sql_from_prompt('irrelevant')
     assert "SELECT * FROM table" in sql
+
+
+def test_streaming_parser_returns_on_closing_brace():
+    from insight_agent.llm_client import StreamingSQLParser
+    parser = StreamingSQLParser()
+    assert parser.feed('Sure! {"sql": "SELECT \'{x}\' AS a, \\"b') is None
+    assert parser.feed('\\" FROM data"}') == 'SELECT \'{x}\' AS a, "b" FROM data'
+
+
+def test_async_client_batch_respects_concurrency_and_retries():
+    import asyncio
+    from insight_agent.llm_client import AsyncLLMClient
+    from fake_llm import FakeLLM
+
+    fake = FakeLLM(sql=lambda prompt: f"SELECT '{prompt}'", latency=0.01, rate_limit_every=4)
+    client = AsyncLLMClient(max_concurrency=3, timeout=1.0, max_retries=3, backoff=0.001,
+                            acompletion=fake.acompletion)
+    results = asyncio.run(client.abatch([f"q{i}" for i in range(10)]))
+    assert results == [f"SELECT 'q{i}'" for i in range(10)]
+    assert fake.max_in_flight <= 3
+    # Every 4th call was rate limited and retried
+    assert fake.calls > 10
+
+
+def test_async_client_stops_reading_stream_once_sql_is_complete():
+    import asyncio
+    from insight_agent.llm_client import AsyncLLMClient
+    from fake_llm import FakeLLM
+
+    fake = FakeLLM(sql='SELECT 1', latency=0, chunk_size=4, trailing_text=' and some explanation' * 20)
+    client = AsyncLLMClient(acompletion=fake.acompletion)
+    assert asyncio.run(client.aget_sql('q')) == 'SELECT 1'
+    full_chunks = len(json.dumps({'sql': 'SELECT 1'}) + fake.trailing_text) // 4
+    assert fake.chunks_sent < full_chunks
+
+
+def test_async_client_times_out():
+    import asyncio
+    import pytest
+    from insight_agent.llm_client import AsyncLLMClient
+    from fake_llm import FakeLLM
+
+    fake = FakeLLM(latency=0.5)
+    client = AsyncLLMClient(timeout=0.05, max_retries=1, backoff=0.001, acompletion=fake.acompletion)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(client.aget_sql('q'))
+    assert fake.calls == 2
+
+
+def test_importing_the_client_does_not_import_litellm():
+    import subprocess
+    import sys
+
+    code = "import sys, insight_agent.llm_client; print('litellm' in sys.modules, 'dotenv' in sys.modules)"
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert out.split() == ['False', 'False']
@@ -0,0 +1,78 @@
+import json
+import numpy as np
+import pandas as pd
+from insight_agent.profiler import DatasetProfiler, HyperLogLog, TopK, Histogram
+
+
+def test_profile_low_cardinality_is_exact():
+    profiler = DatasetProfiler({'retailer': 1})
+    profiler.update(pd.DataFrame({'retailer': ['a', 'b', None], 'sales': [1.0, 2.0, 3.0]}))
+    profiler.update(pd.DataFrame({'retailer': ['a', 'c', 'a'], 'sales': [4.0, None, 6.0]}))
+    profile = profiler.to_profile()
+
+    retailer = profile['retailer']
+    assert retailer['filter_display_order'] == 1
+    assert retailer['values'][0] == 'a'
+    assert set(retailer['values']) == {'a', 'b', 'c'}
+    assert tuple(retailer['top_values'][0]) == ('a', 3)
+    assert retailer['null_count'] == 1
+    assert retailer['distinct_estimate'] == 3
+    assert (retailer['min'], retailer['max']) == ('a', 'c')
+
+    sales = profile['sales']
+    assert 'values' not in sales
+    assert sales['count'] == 6 and sales['null_count'] == 1
+    assert (sales['min'], sales['max']) == (1.0, 6.0)
+    assert sum(sales['histogram']['counts']) == 5
+    # profile.json must be serialisable
+    json.dumps(profile)
+
+
+def test_high_cardinality_uses_fixed_memory():
+    rng = np.random.default_rng(0)
+    hll = HyperLogLog()
+    topk = TopK(k=50)
+    for _ in range(5):
+        chunk = pd.Series(rng.integers(0, 200_000, 50_000)).astype(str)
+        hll.update(chunk)
+        topk.update(chunk)
+    true_distinct = 200_000 * (1 - np.exp(-250_000 / 200_000))
+    assert abs(hll.estimate() - true_distinct) / true_distinct < 0.05
+    assert len(topk.counts) <= 50
+    assert hll.registers.nbytes == 4096
+
+
+def test_histogram_widens_range_with_fixed_bins():
+    hist = Histogram(bins=8)
+    hist.update(pd.Series([0.0, 1.0, 2.0]))
+    hist.update(pd.Series([-100.0, 500.0]))
+    out = hist.to_dict()
+    assert len(hist.counts) == 8
+    assert sum(out['counts']) == 5
+    assert out['edges'][0] <= -100.0 and out['edges'][-1] >= 500.0
+
+
+def test_profiler_state_roundtrip_and_merge():
+    a = DatasetProfiler({'store': 1})
+    a.update(pd.DataFrame({'store': ['s1', 's2'], 'units': [1, 2]}))
+    b = DatasetProfiler({'store': 1})
+    b.update(pd.DataFrame({'store': ['s2', 's3'], 'units': [3, 4]}))
+
+    restored = DatasetProfiler.from_state(json.loads(json.dumps(a.to_state())))
+    restored.merge(b)
+    profile = restored.to_profile()
+    assert set(profile['store']['values']) == {'s1', 's2', 's3'}
+    assert profile['units']['count'] == 4
+    assert (profile['units']['min'], profile['units']['max']) == (1, 4)
+
+
+def test_datetime_top_values_survive_a_state_roundtrip():
+    profiler = DatasetProfiler({'week': 1})
+    profiler.update(pd.DataFrame({'week': pd.to_datetime(['2024-01-01', '2024-01-08', '2024-01-01'])}))
+    # Appends resume from the saved state and keep counting fresh chunks
+    profiler = DatasetProfiler.from_state(json.loads(json.dumps(profiler.to_state())))
+    profiler.update(pd.DataFrame({'week': pd.to_datetime(['2024-01-08', '2024-01-01'])}))
+    week = profiler.to_profile()['week']
+    assert week['values'] == ['2024-01-01T00:00:00', '2024-01-08T00:00:00']
+    assert [tuple(v) for v in week['top_values']] == [('2024-01-01T00:00:00', 3), ('2024-01-08T00:00:00', 2)]
+    assert week['distinct_estimate'] == 2
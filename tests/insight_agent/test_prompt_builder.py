@@ -0,0 +1,77 @@
+import os
+import json
+import shutil
+from insight_agent.prompt_builder import build_prompt, estimate_tokens, select_columns
+
+
+def _write_wide_kind(kind, n_measures=100):
+    kind_dir = os.path.join('domain', 'catalog', 'kinds', kind, 'v1')
+    os.makedirs(kind_dir, exist_ok=True)
+    mapping = [
+        {"original_name": "Retailer", "canonical_name": "retailer", "type": "Location attribution", "description": "Retailer banner"},
+        {"original_name": "Brand", "canonical_name": "brand", "type": "Product attribution", "description": "Brand name"},
+        {"original_name": "Dollar Sales", "canonical_name": "dollar_sales", "type": "POS measure", "description": "Dollar sales"},
+    ]
+    mapping += [{"original_name": f"Metric {i}", "canonical_name": f"metric_{i}", "type": "POS measure",
+                 "description": f"Some unrelated measure number {i}"} for i in range(n_measures)]
+    with open(os.path.join(kind_dir, 'mapping_effective.json'), 'w') as f:
+        json.dump(mapping, f)
+    return kind_dir
+
+
+def test_schema_pruned_to_budget_keeps_relevant_columns():
+    kind = 'mock_wide_kind'
+    kind_dir = _write_wide_kind(kind)
+    try:
+        full = build_prompt(kind, 'dollar sales by brand', prune_schema=False)
+        pruned = build_prompt(kind, 'dollar sales by brand', {'retailer': 'Walmart'}, schema_token_budget=100)
+        assert estimate_tokens(pruned) < estimate_tokens(full) / 3
+        assert '- dollar_sales ' in pruned and '- brand ' in pruned
+        # Filtered columns are always described
+        assert '- retailer ' in pruned
+        assert 'less relevant columns omitted' in pruned
+        assert 'metric_99' in full
+    finally:
+        shutil.rmtree(os.path.dirname(kind_dir), ignore_errors=True)
+
+
+def test_pinned_columns_are_kept_past_the_budget():
+    columns = [{'canonical_name': f'col_{i}', 'name_tokens': {'col'}, 'desc_tokens': set(), 'is_measure': False,
+                'cost': 10} for i in range(5)]
+    # The question matches nothing; col_3 and col_4 are pinned and alone exceed the budget
+    assert select_columns(columns, 'unrelated', {'col_3': 'x', 'col_4': True}, token_budget=15) == [3, 4]
+    assert select_columns(columns, 'unrelated', {'col_4': True}, token_budget=20) == [0, 4]
+
+
+def test_static_context_refreshes_when_mapping_changes():
+    kind = 'mock_wide_kind_refresh'
+    kind_dir = _write_wide_kind(kind, n_measures=1)
+    try:
+        assert 'new_col' not in build_prompt(kind, 'q')
+        with open(os.path.join(kind_dir, 'mapping_effective.json'), 'w') as f:
+            json.dump([{"original_name": "New", "canonical_name": "new_col", "description": "added later"}], f)
+        assert '- new_col ' in build_prompt(kind, 'q')
+    finally:
+        shutil.rmtree(os.path.dirname(kind_dir), ignore_errors=True)
+
+
+def test_join_prompt_describes_each_kind_and_its_join_keys():
+    kinds = ['mock_join_pos', 'mock_join_store']
+    pos_dir = _write_wide_kind(kinds[0], n_measures=50)
+    store_dir = os.path.join('domain', 'catalog', 'kinds', kinds[1], 'v1')
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, 'mapping_effective.json'), 'w') as f:
+        json.dump([
+            {"original_name": "Retailer", "canonical_name": "retailer", "type": "Location attribution"},
+            {"original_name": "Region", "canonical_name": "region", "type": "Location attribution"},
+        ], f)
+    try:
+        prompt = build_prompt(kinds, 'dollar sales by region', schema_token_budget=120)
+        assert 'Table mock_join_pos (dataset: mock_join_pos)' in prompt
+        assert 'Table mock_join_store (dataset: mock_join_store)' in prompt
+        assert '- mock_join_pos.retailer = mock_join_store.retailer' in prompt
+        assert '- region ' in prompt and '- dollar_sales ' in prompt
+        assert "table named 'data'" not in prompt
+    finally:
+        for d in (pos_dir, store_dir):
+            shutil.rmtree(os.path.dirname(d), ignore_errors=True)
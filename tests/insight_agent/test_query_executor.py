@@ -32,3 +32,107 @@ def test_execute_query(tmp_path):
         os.removedirs(os.path.join(datasets_dir, kind))
     except Exception:
         pass
+
+
+def test_execute_query_applies_validated_filters():
+    import json
+    import shutil
+    import pytest
+
+    kind = 'test_kind_filters'
+    dataset_dir = os.path.join('domain', 'catalog', 'datasets', kind)
+    os.makedirs(dataset_dir, exist_ok=True)
+    pd.DataFrame({'retailer': ['A', 'B', 'A', 'C'], 'sales': [1, 2, 3, 4]}).to_parquet(
+        os.path.join(dataset_dir, 'latest.parquet'))
+    profile = {'retailer': {'values': ['A', 'B', 'C'], 'filter_display_order': 1, 'distinct_estimate': 3},
+               'sales': {'dtype': 'numeric', 'distinct_estimate': 4}}
+    with open(os.path.join(dataset_dir, 'profile.json'), 'w') as f:
+        json.dump(profile, f)
+    try:
+        # The SQL ignores the filter; it is applied server-side anyway
+        res = execute_query(kind, 'SELECT SUM(sales) AS s FROM my_table', filters={'retailer': 'A'})
+        assert res['s'].iloc[0] == 4
+        res = execute_query(kind, 'WITH t AS (SELECT * FROM data) SELECT COUNT(*) AS n FROM t',
+                            filters={'retailer': ['A', 'B']})
+        assert res['n'].iloc[0] == 3
+        # A CTE of the LLM's own named like the view does not clash with the filter's
+        res = execute_query(kind, 'WITH data AS (SELECT * FROM data WHERE sales > 1) '
+                                  'SELECT COUNT(*) AS n, MAX(data.sales) AS top FROM data',
+                            filters={'retailer': 'A'})
+        assert res['n'].iloc[0] == 1 and res['top'].iloc[0] == 3
+        # Empty selections are ignored
+        assert execute_query(kind, 'SELECT * FROM data', filters={'retailer': ''}).shape[0] == 4
+        with pytest.raises(ValueError):
+            execute_query(kind, 'SELECT * FROM data', filters={'retailer': "A' OR 1=1 --"})
+        with pytest.raises(ValueError):
+            execute_query(kind, 'SELECT * FROM data', filters={'sales': 1})
+    finally:
+        shutil.rmtree(dataset_dir, ignore_errors=True)
+
+
+def test_execute_query_parses_sql_and_caps_rows():
+    import shutil
+    import pytest
+    from insight_agent.sql_analyzer import QueryRejected
+
+    kind = 'test_kind_analyzer'
+    dataset_dir = os.path.join('domain', 'catalog', 'datasets', kind)
+    os.makedirs(dataset_dir, exist_ok=True)
+    pd.DataFrame({'d': pd.to_datetime(['2024-01-01', '2025-02-01'] * 50), 'note': ['FROM x'] * 100}).to_parquet(
+        os.path.join(dataset_dir, 'latest.parquet'))
+    try:
+        # FROM inside EXTRACT and string literals is left alone; CTEs still resolve
+        res = execute_query(kind, "WITH t AS (SELECT * FROM sales WHERE note = 'FROM x') "
+                                  "SELECT EXTRACT(year FROM d) AS y, COUNT(*) AS n FROM t GROUP BY 1 ORDER BY 1")
+        assert res['y'].tolist() == [2024, 2025]
+        assert res['n'].tolist() == [50, 50]
+
+        res = execute_query(kind, 'SELECT * FROM sales', max_rows=10)
+        assert len(res) == 10 and res.attrs['truncated']
+        assert not execute_query(kind, 'SELECT * FROM sales LIMIT 5', max_rows=10).attrs['truncated']
+
+        for sql in ['DROP TABLE data', 'SELECT 1; SELECT 2', "SELECT * FROM read_csv('secrets.csv')"]:
+            with pytest.raises(QueryRejected):
+                execute_query(kind, sql)
+        # A cross join whose estimate exceeds the ceiling is refused before it runs
+        os.environ['QUERY_MAX_ESTIMATED_ROWS'] = '1000'
+        with pytest.raises(QueryRejected):
+            execute_query(kind, 'SELECT COUNT(*) FROM sales a, sales b, sales c')
+    finally:
+        os.environ.pop('QUERY_MAX_ESTIMATED_ROWS', None)
+        shutil.rmtree(dataset_dir, ignore_errors=True)
+
+
+def test_execute_query_joins_kinds_as_named_views():
+    import json
+    import shutil
+    import pytest
+    from insight_agent.query_executor import prepare_query
+    from insight_agent.sql_analyzer import QueryRejected, table_names
+
+    kinds = ['test kind POS', 'test kind Store']
+    assert table_names(kinds) == {'test kind POS': 'test_kind_pos', 'test kind Store': 'test_kind_store'}
+    dirs = [os.path.join('domain', 'catalog', 'datasets', kind) for kind in kinds]
+    for d in dirs:
+        os.makedirs(d, exist_ok=True)
+    pd.DataFrame({'store_id': [1, 1, 2, 3], 'retailer': ['A', 'A', 'B', 'A'], 'sales': [1, 2, 3, 4]}).to_parquet(
+        os.path.join(dirs[0], 'latest.parquet'))
+    pd.DataFrame({'store_id': [1, 2, 3], 'region': ['east', 'west', 'west']}).to_parquet(
+        os.path.join(dirs[1], 'latest.parquet'))
+    with open(os.path.join(dirs[0], 'profile.json'), 'w') as f:
+        json.dump({'retailer': {'values': ['A', 'B'], 'distinct_estimate': 2}}, f)
+    try:
+        sql = ('SELECT s.region, SUM(p.sales) AS sales FROM test_kind_pos p '
+               'JOIN "test kind Store" s ON p.store_id = s.store_id GROUP BY 1 ORDER BY 1')
+        res = execute_query(kinds, sql)
+        assert res.to_dict('list') == {'region': ['east', 'west'], 'sales': [3, 7]}
+        # Filters scope the first kind
+        res = execute_query(kinds, sql, filters={'retailer': 'A'})
+        assert res.to_dict('list') == {'region': ['east', 'west'], 'sales': [3, 4]}
+        with pytest.raises(QueryRejected, match='Available tables'):
+            prepare_query(kinds, 'SELECT * FROM data')
+        # The single-kind view still works on its own
+        assert execute_query(kinds[1], 'SELECT COUNT(*) AS n FROM anything')['n'].iloc[0] == 3
+    finally:
+        for d in dirs:
+            shutil.rmtree(d, ignore_errors=True)
@@ -0,0 +1,88 @@
+import os
+import time
+import shutil
+
+import pandas as pd
+import pytest
+
+from insight_agent.query_pool import QueryPool, QueryCancelled, QueryQueueFull, QueryTimeout
+
+SLOW_SQL = 'SELECT COUNT(*) AS n FROM data a, data b, data c WHERE a.x + b.x + c.x = -1'
+
+
+@pytest.fixture
+def kind():
+    kind = 'test_kind_pool'
+    dataset_dir = os.path.join('domain', 'catalog', 'datasets', kind)
+    os.makedirs(dataset_dir, exist_ok=True)
+    pd.DataFrame({'x': range(3000)}).to_parquet(os.path.join(dataset_dir, 'latest.parquet'))
+    yield kind
+    shutil.rmtree(dataset_dir, ignore_errors=True)
+
+
+def test_pool_runs_queries_and_reports_metrics(kind):
+    pool = QueryPool(workers=2, queue_size=2)
+    try:
+        handle = pool.submit(kind, 'SELECT COUNT(*) AS n FROM data')
+        assert handle.result(timeout=30)['n'].iloc[0] == 3000
+        assert handle.status == 'completed'
+        paged = pool.submit(kind, 'SELECT * FROM data', page_size=100).result(timeout=30)
+        assert paged.page(0).num_rows == 100
+        paged.close()
+        stats = pool.stats()
+        assert stats['completed'] == 2 and stats['queue_depth'] == 0 and 'avg_run_s' in stats
+    finally:
+        pool.shutdown()
+
+
+def test_pool_interrupts_at_timeout_and_on_cancel(kind, monkeypatch):
+    # Let the deliberately slow query past the cost check
+    monkeypatch.setenv('QUERY_MAX_ESTIMATED_ROWS', str(10 ** 12))
+    pool = QueryPool(workers=1, queue_size=1, timeout=0.3)
+    try:
+        started = time.monotonic()
+        with pytest.raises(QueryTimeout):
+            pool.submit(kind, SLOW_SQL).result(timeout=30)
+        assert time.monotonic() - started < 10
+
+        running = pool.submit(kind, SLOW_SQL, timeout=0)
+        queued = pool.submit(kind, 'SELECT 1')
+        # Admission control: one worker plus one queue slot are taken
+        with pytest.raises(QueryQueueFull):
+            pool.submit(kind, 'SELECT 1')
+        assert pool.cancel(queued.id)
+        time.sleep(0.2)
+        assert pool.cancel(running.id)
+        with pytest.raises(QueryCancelled):
+            running.result(timeout=30)
+        with pytest.raises(QueryCancelled):
+            queued.result(timeout=1)
+        stats = pool.stats()
+        assert stats['timed_out'] == 1 and stats['cancelled'] == 2 and stats['rejected'] == 1
+    finally:
+        pool.shutdown()
+
+
+def test_pool_does_not_start_a_query_stopped_before_its_cursor(kind, monkeypatch):
+    from insight_agent import query_executor
+
+    pool = QueryPool(workers=1, queue_size=1)
+    checked = []
+    monkeypatch.setattr(query_executor, 'check_cost', lambda *args: checked.append(args))
+    original = QueryPool._execute
+
+    def stop_first(self, handle, *args):
+        # The cancel lands after the worker picked the query up but before
+        # execute_query hands over its cursor
+        handle._stop('cancel')
+        return original(self, handle, *args)
+
+    monkeypatch.setattr(QueryPool, '_execute', stop_first)
+    try:
+        handle = pool.submit(kind, 'SELECT COUNT(*) AS n FROM data')
+        with pytest.raises(QueryCancelled):
+            handle.result(timeout=30)
+        assert handle.status == 'cancelled'
+        assert checked == []
+    finally:
+        pool.shutdown()
@@ -0,0 +1,98 @@
+import os
+import shutil
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from insight_agent.query_executor import open_result
+from insight_agent.query_result import QueryResult
+
+
+@pytest.fixture
+def kind():
+    kind = 'test_kind_paging'
+    dataset_dir = os.path.join('domain', 'catalog', 'datasets', kind)
+    os.makedirs(dataset_dir, exist_ok=True)
+    pd.DataFrame({'x': range(2500), 'y': ['v'] * 2500}).to_parquet(os.path.join(dataset_dir, 'latest.parquet'))
+    yield kind
+    shutil.rmtree(dataset_dir, ignore_errors=True)
+
+
+def test_result_is_fetched_page_by_page(kind, tmp_path):
+    result = open_result(kind, 'SELECT * FROM data ORDER BY x', page_size=1000)
+    # Only the first page (plus a look-ahead batch) has been read
+    assert result.fetched_rows < 2500 and not result.complete
+    assert result.page(0).column('x').to_pylist()[:3] == [0, 1, 2]
+    assert result.total_rows() == 2500
+    assert result.page(2).num_rows == 500
+    assert result.page(2).column('x')[0].as_py() == 2000
+    assert result.complete and not result.has_page(3)
+
+    out = result.export(str(tmp_path / 'full.parquet'))
+    assert pq.read_table(out).num_rows == 2500
+    out = result.export(str(tmp_path / 'full.csv'), fmt='csv')
+    assert len(pd.read_csv(out)) == 2500
+
+
+def test_small_and_cached_results(kind):
+    result = open_result(kind, 'SELECT COUNT(*) AS n FROM data')
+    assert result.complete and result.total_rows() == 1
+    wrapped = QueryResult.from_table(result.to_table(), page_size=10)
+    assert wrapped.page(0).column('n')[0].as_py() == 2500
+
+    partial = open_result(kind, 'SELECT * FROM data', page_size=100)
+    partial.close()
+    assert partial.page(0).num_rows == 100
+
+
+def test_follow_up_passes_run_on_the_pool_with_its_timeout(kind, tmp_path, monkeypatch):
+    from insight_agent import query_pool
+
+    result = open_result(kind, 'SELECT * FROM data ORDER BY x', page_size=1000)
+    pool = query_pool.QueryPool(workers=1, queue_size=1, timeout=30)
+    monkeypatch.setattr(query_pool, '_pool', pool)
+    try:
+        assert result.total_rows() == 2500
+        assert pq.read_table(result.export(str(tmp_path / 'full.parquet'))).num_rows == 2500
+        assert pool.stats()['completed'] == 2
+
+        # A pass the pool stopped does not run
+        def timed_out(handle, con):
+            raise query_pool.QueryTimeout('stopped')
+
+        stopped = open_result(kind, 'SELECT * FROM data', page_size=100)
+        monkeypatch.setattr(query_pool.QueryHandle, '_attach', timed_out)
+        with pytest.raises(query_pool.QueryTimeout):
+            stopped.total_rows()
+        with pytest.raises(query_pool.QueryTimeout):
+            stopped.export(str(tmp_path / 'stopped.csv'), fmt='csv')
+        stopped.close()
+    finally:
+        result.close()
+        pool.shutdown()
+
+
+def test_later_pages_are_fetched_on_the_pool(kind, monkeypatch):
+    import threading
+    from insight_agent import query_pool
+
+    pool = query_pool.QueryPool(workers=1, queue_size=1, timeout=30)
+    monkeypatch.setattr(query_pool, '_pool', pool)
+    result = open_result(kind, 'SELECT * FROM data ORDER BY x', page_size=1000)
+    threads = []
+    original = QueryResult._fill
+
+    def record(self, rows):
+        threads.append(threading.current_thread())
+        return original(self, rows)
+
+    monkeypatch.setattr(QueryResult, '_fill', record)
+    try:
+        assert result.page(2).num_rows == 500
+        assert threads and threading.main_thread() not in threads
+        assert pool.stats()['completed'] == 1
+        assert result.complete
+    finally:
+        result.close()
+        pool.shutdown()
@@ -0,0 +1,98 @@
+import os
+import json
+import shutil
+import pandas as pd
+from insight_agent.result_cache import ResultCache, normalize_sql
+
+
+def _setup_kind(kind, df):
+    kind_dir = os.path.join('domain', 'catalog', 'kinds', kind, 'v1')
+    os.makedirs(kind_dir, exist_ok=True)
+    with open(os.path.join(kind_dir, 'mapping_effective.json'), 'w') as f:
+        json.dump([{"original_name": "a", "canonical_name": "a"}], f)
+    datasets_dir = os.path.join('domain', 'catalog', 'datasets', kind)
+    os.makedirs(datasets_dir, exist_ok=True)
+    df.to_parquet(os.path.join(datasets_dir, 'latest.parquet'))
+    return kind_dir, datasets_dir
+
+
+def test_normalize_sql_keeps_literals():
+    assert normalize_sql("SELECT  a\n FROM data WHERE b = 'x  y';") == "SELECT a FROM data WHERE b = 'x  y'"
+
+
+def test_sql_and_result_levels(tmp_path):
+    kind = 'mock_cache_kind'
+    kind_dir, datasets_dir = _setup_kind(kind, pd.DataFrame({'a': [1, 2, 3]}))
+    try:
+        cache = ResultCache(root=str(tmp_path / 'cache'))
+        assert cache.get_sql(kind, 'prompt') is None
+        cache.put_sql(kind, 'prompt', 'SELECT sum(a) AS s FROM data')
+        assert cache.get_sql(kind, 'prompt') == 'SELECT sum(a) AS s FROM data'
+
+        sql = 'SELECT sum(a) AS s FROM data'
+        assert cache.get_result(kind, sql) is None
+        cache.put_result(kind, sql, pd.DataFrame({'s': [6]}))
+        # Formatting differences share the entry, and the cache survives a restart
+        reopened = ResultCache(root=str(tmp_path / 'cache'))
+        assert reopened.get_result(kind, 'SELECT sum(a) AS s\nFROM data;')['s'].tolist() == [6]
+        assert reopened.get_sql(kind, 'prompt') == sql
+
+        # A new dataset invalidates results but not generated SQL
+        pd.DataFrame({'a': [10, 20]}).to_parquet(os.path.join(datasets_dir, 'latest.parquet'))
+        assert reopened.get_result(kind, sql) is None
+        assert reopened.get_sql(kind, 'prompt') == sql
+
+        # A mapping change invalidates generated SQL
+        with open(os.path.join(kind_dir, 'mapping_effective.json'), 'w') as f:
+            json.dump([{"original_name": "a", "canonical_name": "a", "description": "changed"}], f)
+        assert reopened.get_sql(kind, 'prompt') is None
+        assert reopened.stats()['hits'] == {'sql': 2, 'result': 1}
+    finally:
+        shutil.rmtree(datasets_dir, ignore_errors=True)
+        shutil.rmtree(os.path.dirname(kind_dir), ignore_errors=True)
+
+
+def test_result_eviction_is_size_bounded(tmp_path):
+    kind = 'mock_cache_evict_kind'
+    kind_dir, datasets_dir = _setup_kind(kind, pd.DataFrame({'a': [1]}))
+    try:
+        probe = ResultCache(root=str(tmp_path / 'probe'))
+        probe.put_result(kind, 'SELECT 0', pd.DataFrame({'x': range(100)}))
+        entry_bytes = probe.stats()['result_bytes']
+
+        cache = ResultCache(root=str(tmp_path / 'cache'), max_bytes=int(entry_bytes * 2.5))
+        for i in range(4):
+            cache.put_result(kind, f'SELECT {i}', pd.DataFrame({'x': range(100)}))
+        stats = cache.stats()
+        assert stats['result_entries'] == 2
+        assert stats['result_bytes'] <= cache.max_bytes
+        # Oldest entries were evicted, newest kept
+        assert cache.get_result(kind, 'SELECT 0') is None
+        assert cache.get_result(kind, 'SELECT 3') is not None
+        assert len(os.listdir(tmp_path / 'cache' / 'results')) == 2
+    finally:
+        shutil.rmtree(datasets_dir, ignore_errors=True)
+        shutil.rmtree(os.path.dirname(kind_dir), ignore_errors=True)
+
+
+def test_hits_do_not_rewrite_the_index(tmp_path):
+    kind = 'mock_cache_recency_kind'
+    kind_dir, datasets_dir = _setup_kind(kind, pd.DataFrame({'a': [1]}))
+    try:
+        cache = ResultCache(root=str(tmp_path / 'cache'))
+        cache.put_sql(kind, 'old', 'SELECT 1')
+        cache.put_sql(kind, 'new', 'SELECT 2')
+        index_path = tmp_path / 'cache' / 'sql_index.json'
+        written = index_path.stat().st_mtime_ns
+        assert cache.get_sql(kind, 'old') == 'SELECT 1'
+        assert index_path.stat().st_mtime_ns == written
+
+        # Recency reaches disk on flush, so a restart still evicts 'new' first
+        cache.flush()
+        reopened = ResultCache(root=str(tmp_path / 'cache'), max_sql_entries=2)
+        reopened.put_sql(kind, 'newest', 'SELECT 3')
+        assert reopened.get_sql(kind, 'old') == 'SELECT 1'
+        assert reopened.get_sql(kind, 'new') is None
+    finally:
+        shutil.rmtree(datasets_dir, ignore_errors=True)
+        shutil.rmtree(os.path.dirname(kind_dir), ignore_errors=True)
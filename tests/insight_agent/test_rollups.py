@@ -0,0 +1,95 @@
+import os
+import json
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from insight_agent.instance_manager import onboard_instance
+from insight_agent.query_executor import execute_query, prepare_query
+from insight_agent.rollups import load_rollups
+
+
+@pytest.fixture(scope='module')
+def kind(tmp_path_factory):
+    kind = 'test_kind_rollups'
+    kind_dir = os.path.join('domain', 'catalog', 'kinds', kind, 'v1')
+    os.makedirs(kind_dir, exist_ok=True)
+    mapping = [
+        {"original_name": "Retailer", "canonical_name": "retailer", "type": "market_or_store",
+         "filter_display_order": 1, "rollup_order": 1},
+        {"original_name": "Brand", "canonical_name": "brand", "type": "Product attribution", "rollup_order": 2},
+        {"original_name": "Item", "canonical_name": "item", "type": "Product attribution"},
+        {"original_name": "Dollars", "canonical_name": "dollars", "type": "POS measure", "data_type": "decimal"},
+        {"original_name": "Units", "canonical_name": "units", "type": "POS measure", "data_type": "integer"},
+    ]
+    with open(os.path.join(kind_dir, 'mapping_effective.json'), 'w') as f:
+        json.dump(mapping, f)
+    rng = np.random.default_rng(0)
+    n = 5000
+    df = pd.DataFrame({
+        'Retailer': rng.choice(['r1', 'r2', 'r3'], n),
+        'Brand': rng.choice([f'b{i}' for i in range(10)], n),
+        'Item': [f'i{i}' for i in range(n)],
+        'Dollars': rng.uniform(0, 100, n).round(2),
+        'Units': rng.integers(0, 50, n),
+    })
+    df.loc[::97, 'Dollars'] = None
+    path = tmp_path_factory.mktemp('rollups') / 'instance.csv'
+    df.to_csv(path, index=False)
+    success, message = onboard_instance(kind, str(path))
+    assert success, message
+    yield kind
+    shutil.rmtree(os.path.join('domain', 'catalog', 'kinds', kind), ignore_errors=True)
+    shutil.rmtree(os.path.join('domain', 'catalog', 'datasets', kind), ignore_errors=True)
+
+
+ROUTED = [
+    'SELECT retailer, SUM(dollars), COUNT(*), AVG(dollars) AS avg_dollars FROM sales GROUP BY retailer ORDER BY retailer',
+    'SELECT brand, retailer, MIN(units), MAX(units), COUNT(dollars) FROM data GROUP BY ALL ORDER BY 1, 2',
+    'SELECT SUM(units) AS units FROM data WHERE retailer = \'r2\'',
+    'SELECT retailer, SUM(dollars) AS dollars FROM data GROUP BY retailer ORDER BY dollars DESC',
+    'SELECT COUNT(DISTINCT brand) AS brands FROM data',
+]
+NOT_ROUTED = [
+    'SELECT item, SUM(units) FROM data GROUP BY item',
+    'SELECT retailer, units FROM data',
+    'SELECT retailer, MEDIAN(units) FROM data GROUP BY retailer',
+    'SELECT SUM(units) FROM data WHERE units > 10',
+    'SELECT a.retailer, SUM(a.units) FROM data a JOIN data b ON a.item = b.item GROUP BY 1',
+]
+
+
+def test_rollups_are_built_for_each_dimension_prefix(kind):
+    meta = load_rollups(kind)
+    assert [r['dimensions'] for r in meta['rollups']] == [['retailer'], ['retailer', 'brand']]
+    assert meta['rollups'][0]['rows'] == 3
+    assert set(meta['measures']) == {'dollars', 'units'}
+
+
+@pytest.mark.parametrize('sql', ROUTED)
+def test_routed_queries_match_the_raw_data(kind, sql, monkeypatch):
+    routed_sql, _ = prepare_query(kind, sql)
+    assert 'rollup_' in routed_sql
+    routed = execute_query(kind, sql)
+    monkeypatch.setenv('QUERY_USE_ROLLUPS', '0')
+    raw = execute_query(kind, sql)
+    assert list(routed.columns) == list(raw.columns)
+    pd.testing.assert_frame_equal(routed, raw, check_dtype=False, rtol=1e-9)
+
+
+@pytest.mark.parametrize('sql', NOT_ROUTED)
+def test_queries_needing_rows_read_the_data(kind, sql):
+    routed_sql, _ = prepare_query(kind, sql)
+    assert 'rollup_' not in routed_sql
+
+
+def test_structured_filters_route_to_a_rollup_holding_the_column(kind, monkeypatch):
+    sql = 'SELECT brand, SUM(units) AS units FROM data GROUP BY brand ORDER BY brand'
+    routed_sql, _ = prepare_query(kind, sql, filters={'retailer': 'r1'})
+    assert 'rollup_2' in routed_sql
+    routed = execute_query(kind, sql, filters={'retailer': 'r1'})
+    monkeypatch.setenv('QUERY_USE_ROLLUPS', '0')
+    raw = execute_query(kind, sql, filters={'retailer': 'r1'})
+    pd.testing.assert_frame_equal(routed, raw, check_dtype=False)
@@ -0,0 +1,106 @@
+import os
+import json
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from insight_agent import sampling
+from insight_agent.dataset_store import dataset_dir
+from insight_agent.instance_manager import onboard_instance
+from insight_agent.query_executor import execute_query, prepare_approximate
+
+
+@pytest.fixture(scope='module')
+def kind(tmp_path_factory):
+    kind = 'test_kind_sampling'
+    kind_dir = os.path.join('domain', 'catalog', 'kinds', kind, 'v1')
+    os.makedirs(kind_dir, exist_ok=True)
+    mapping = [
+        {"original_name": "Retailer", "canonical_name": "retailer", "type": "market_or_store",
+         "filter_display_order": 1},
+        {"original_name": "Brand", "canonical_name": "brand", "type": "Product attribution", "rollup_order": 1},
+        {"original_name": "Dollars", "canonical_name": "dollars", "type": "POS measure", "data_type": "decimal"},
+        {"original_name": "Units", "canonical_name": "units", "type": "POS measure", "data_type": "integer"},
+    ]
+    with open(os.path.join(kind_dir, 'mapping_effective.json'), 'w') as f:
+        json.dump(mapping, f)
+    rng = np.random.default_rng(0)
+    n = 40_000
+    df = pd.DataFrame({
+        # r3 is rare: the stratum floor still samples it
+        'Retailer': rng.choice(['r1', 'r2', 'r3'], n, p=[0.6, 0.395, 0.005]),
+        'Brand': rng.choice([f'b{i}' for i in range(5)], n),
+        'Dollars': rng.uniform(0, 100, n).round(2),
+        'Units': rng.integers(0, 50, n),
+    })
+    df.loc[::97, 'Dollars'] = None
+    path = tmp_path_factory.mktemp('sampling') / 'instance.csv'
+    df.to_csv(path, index=False)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(sampling, 'SAMPLE_ROWS', 2000)
+        success, message = onboard_instance(kind, str(path))
+    assert success, message
+    assert 'Sample built' in message
+    yield kind
+    shutil.rmtree(os.path.join('domain', 'catalog', 'kinds', kind), ignore_errors=True)
+    shutil.rmtree(os.path.join('domain', 'catalog', 'datasets', kind), ignore_errors=True)
+
+
+def test_sample_is_stratified_on_filterable_columns(kind):
+    meta = sampling.load_sample(kind)
+    assert meta['strata_columns'] == ['retailer']
+    assert meta['source_rows'] == 40_000
+    assert 1500 < meta['rows'] < 2700
+    sample = pd.read_parquet(os.path.join(dataset_dir(kind), meta['file']))
+    assert len(sample) == meta['rows']
+    # The rare retailer gets about STRATUM_MIN_ROWS rows instead of 5% of ~200
+    assert (sample['retailer'] == 'r3').sum() >= 15
+    weights = sample.groupby('retailer')[sampling.WEIGHT_COLUMN].sum()
+    assert weights.sum() == pytest.approx(40_000)
+    assert weights['r3'] < weights['r1'] / 10
+
+
+def test_counts_per_stratum_are_exact(kind):
+    sql = 'SELECT retailer, COUNT(*) AS n FROM data GROUP BY retailer ORDER BY retailer'
+    approx = execute_query(kind, sql, approximate=True)
+    exact = execute_query(kind, sql)
+    assert approx.attrs['sample']['error_column'] == sampling.ERROR_COLUMN
+    assert list(approx.columns) == ['retailer', 'n', sampling.ERROR_COLUMN]
+    assert approx['n'].tolist() == exact['n'].tolist()
+
+
+def test_scaled_aggregates_are_close_to_exact(kind):
+    sql = ('SELECT brand, SUM(units), AVG(dollars) AS avg_dollars, COUNT(dollars) FROM data '
+           'WHERE units > 10 GROUP BY brand ORDER BY brand')
+    approx = execute_query(kind, sql, approximate=True)
+    exact = execute_query(kind, sql)
+    assert approx.attrs['sample']['scaled'] == 3
+    assert list(approx.columns) == list(exact.columns) + [sampling.ERROR_COLUMN]
+    for column in exact.columns[1:]:
+        error = (approx[column] - exact[column]).abs() / exact[column]
+        assert (error < 0.15).all(), column
+    assert (approx[sampling.ERROR_COLUMN] > 0).all()
+
+
+def test_row_queries_hide_the_weight(kind):
+    df = execute_query(kind, 'SELECT * FROM data LIMIT 5', approximate=True)
+    assert sampling.WEIGHT_COLUMN not in df.columns
+    assert df.attrs['sample']['error_column'] is None
+
+
+def test_filters_apply_to_the_sample(kind):
+    sql = 'SELECT COUNT(*) AS n FROM data'
+    approx = execute_query(kind, sql, filters={'retailer': 'r3'}, approximate=True)
+    exact = execute_query(kind, sql, filters={'retailer': 'r3'})
+    assert approx['n'].tolist() == exact['n'].tolist()
+
+
+def test_rollup_answers_stay_exact(kind):
+    sql, _, sample = prepare_approximate(kind, 'SELECT brand, SUM(units) FROM data GROUP BY brand')
+    assert sample is None
+    assert 'rollup_' in sql
+    sql, _, sample = prepare_approximate(kind, 'SELECT MAX(units) FROM data d JOIN data e USING (brand)')
+    assert sample is None
+    assert sampling.SAMPLE_TABLE not in sql
@@ -0,0 +1,65 @@
+from insight_agent.semantic_cache import SemanticCache, normalize_question
+from insight_agent.prompt_builder import build_prompt
+
+
+def test_normalize_question_matches_paraphrases():
+    assert normalize_question('total sales by retailer last 4 weeks') == \
+        normalize_question('Sales by retailer, last four weeks')
+
+
+def test_lookup_hits_similar_question_and_tracks_stats(tmp_path):
+    cache = SemanticCache(path=str(tmp_path / 'sem.jsonl'), threshold=0.8)
+    sql = 'SELECT retailer, sum(dollar_sales) FROM data GROUP BY retailer'
+    cache.add('kind_a', 'total sales by retailer last 4 weeks', sql, filters={'market': 'US'}, latency=2.5)
+
+    hit = cache.lookup('kind_a', 'sales by retailer, last four weeks', filters={'market': 'US'})
+    assert hit is not None and hit['sql'] == sql
+    assert hit['similarity'] >= 0.8
+
+    # Different numbers, filters or kind never serve the cached SQL
+    assert cache.lookup('kind_a', 'sales by retailer last 5 weeks', filters={'market': 'US'}) is None
+    assert cache.lookup('kind_a', 'sales by retailer last 4 weeks', filters={'market': 'CA'}) is None
+    assert cache.lookup('kind_b', 'sales by retailer last 4 weeks', filters={'market': 'US'}) is None
+
+    stats = cache.stats()
+    assert stats['lookups'] == 4 and stats['hits'] == 1
+    assert stats['hit_rate'] == 0.25
+    assert stats['latency_saved_s'] == 2.5
+
+    # Entries persist across restarts
+    reopened = SemanticCache(path=str(tmp_path / 'sem.jsonl'))
+    assert reopened.lookup('kind_a', 'Sales by retailer last 4 wks', filters={'market': 'US'})['sql'] == sql
+
+
+def test_negations_and_comparisons_never_serve_the_opposite_question(tmp_path):
+    cache = SemanticCache(path=str(tmp_path / 'sem.jsonl'), threshold=0.8)
+    cache.add('kind_a', 'stores with sales last 4 weeks', 'SELECT store FROM data WHERE sales > 0')
+    cache.add('kind_a', 'top 10 brands by sales last 4 weeks', 'SELECT brand FROM data ORDER BY sales DESC LIMIT 10')
+    cache.add('kind_a', 'retailers with sales > 100 last 4 weeks', 'SELECT retailer FROM data WHERE sales > 100')
+
+    assert cache.lookup('kind_a', 'stores with no sales last 4 weeks') is None
+    assert cache.lookup('kind_a', 'bottom 10 brands by sales last 4 weeks') is None
+    assert cache.lookup('kind_a', 'retailers with sales < 100 last 4 weeks') is None
+    # The same sense in other words still hits
+    assert cache.lookup('kind_a', 'retailers with sales over 100 last four weeks')['sql'].endswith('> 100')
+    assert cache.lookup('kind_a', 'top ten brands by sales, last 4 weeks') is not None
+
+
+def test_a_different_measure_never_hits(tmp_path):
+    cache = SemanticCache(path=str(tmp_path / 'sem.jsonl'), threshold=0.8)
+    cache.add('kind_a', 'total dollars by brand and category for walmart stores in texas last week',
+              'SELECT brand, sum(dollars) FROM data GROUP BY brand')
+
+    assert cache.lookup('kind_a', 'total units by brand and category for walmart stores in texas last week') is None
+    assert cache.lookup('kind_a', 'total dollars by brand and category for walmart stores in texas, last week') is not None
+
+
+def test_examples_feed_prompt(tmp_path):
+    cache = SemanticCache(path=str(tmp_path / 'sem.jsonl'))
+    cache.add('kind_a', 'unit sales by brand', 'SELECT brand, sum(unit_sales) FROM data GROUP BY brand')
+    examples = cache.examples('kind_a', 'dollar sales by brand')
+    assert examples and examples[0][0] == 'unit sales by brand'
+
+    prompt = build_prompt('kind_a', 'dollar sales by brand', examples=examples)
+    assert 'Examples of previously answered questions' in prompt
+    assert 'sum(unit_sales)' in prompt
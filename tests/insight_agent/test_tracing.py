@@ -0,0 +1,92 @@
+import os
+import json
+import shutil
+
+import pandas as pd
+import pytest
+
+from insight_agent import tracing
+from insight_agent.query_pool import QueryPool
+
+
+@pytest.fixture
+def traces(tmp_path, monkeypatch):
+    path = str(tmp_path / 'traces.jsonl')
+    monkeypatch.setattr(tracing, 'TRACES_DIR', str(tmp_path))
+    monkeypatch.setattr(tracing, 'TRACES_FILE', path)
+    tracing.set_enabled(True)
+    yield path
+    tracing.set_enabled(False)
+
+
+@pytest.fixture
+def kind():
+    kind = 'test_kind_tracing'
+    dataset_dir = os.path.join('domain', 'catalog', 'datasets', kind)
+    os.makedirs(dataset_dir, exist_ok=True)
+    pd.DataFrame({'x': range(5000), 'g': [i % 7 for i in range(5000)]}).to_parquet(
+        os.path.join(dataset_dir, 'latest.parquet'))
+    yield kind
+    shutil.rmtree(dataset_dir, ignore_errors=True)
+
+
+def test_disabled_tracing_records_nothing(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, 'TRACES_FILE', str(tmp_path / 'traces.jsonl'))
+    tracing.set_enabled(False)
+    with tracing.span('ask', question='q') as sp:
+        sp.set_attribute('x', 1)
+        assert tracing.span('child') is tracing.NOOP_SPAN
+    assert sp is tracing.NOOP_SPAN
+    assert not os.path.exists(tmp_path / 'traces.jsonl')
+
+
+def test_root_span_exports_an_otlp_trace(traces):
+    with tracing.span('ask', kind='k'):
+        with tracing.span('build_prompt') as child:
+            child.set_attributes(prompt_tokens=12, ratio=0.5)
+        with pytest.raises(ValueError):
+            with tracing.span('query'):
+                raise ValueError('bad sql')
+    with open(traces) as fh:
+        records = [json.loads(line) for line in fh]
+    assert len(records) == 1
+    spans = records[0]['resourceSpans'][0]['scopeSpans'][0]['spans']
+    by_name = {sp['name']: sp for sp in spans}
+    assert set(by_name) == {'ask', 'build_prompt', 'query'}
+    assert len({sp['traceId'] for sp in spans}) == 1
+    assert by_name['ask']['parentSpanId'] == ''
+    assert by_name['build_prompt']['parentSpanId'] == by_name['ask']['spanId']
+    assert {'key': 'prompt_tokens', 'value': {'intValue': '12'}} in by_name['build_prompt']['attributes']
+    assert by_name['query']['status']['code'] == tracing.STATUS_ERROR
+
+    (summary,) = tracing.load_traces()
+    assert summary['name'] == 'ask' and summary['status'] == 'error'
+    assert [sp['depth'] for sp in summary['spans']] == [0, 1, 1]
+    assert summary['spans'][1]['attributes'] == {'prompt_tokens': 12, 'ratio': 0.5}
+
+
+def test_query_spans_follow_the_pool_thread_and_read_duckdb_profiling(traces, kind):
+    pool = QueryPool(workers=1)
+    try:
+        with tracing.span('ask'):
+            df = pool.submit(kind, 'SELECT g, SUM(x) AS s FROM data GROUP BY g').result(timeout=30)
+    finally:
+        pool.shutdown()
+    assert len(df) == 7
+    (summary,) = tracing.load_traces()
+    names = [sp['name'] for sp in summary['spans']]
+    assert names[0] == 'ask' and 'query' in names and 'query.to_pandas' in names
+    execute = next(sp for sp in summary['spans'] if sp['name'] == 'query.execute')
+    assert execute['depth'] == 2
+    assert execute['attributes'].get('rows_scanned') == 5000
+    assert execute['attributes'].get('rows_returned') == 7
+
+
+def test_prepare_span_reports_the_routed_table_not_the_sql_text(traces, kind):
+    from insight_agent.query_executor import execute_query
+
+    with tracing.span('ask'):
+        execute_query(kind, "SELECT g AS rollup_group, 'rollup_x' AS label FROM data LIMIT 1")
+    (summary,) = tracing.load_traces()
+    prepare = next(sp for sp in summary['spans'] if sp['name'] == 'query.prepare')
+    assert prepare['attributes']['rollup'] is False
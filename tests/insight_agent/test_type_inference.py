@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from insight_agent.type_inference import infer_column, infer_types, stratified_sample
+
+
+def test_infer_column_detects_types_and_formats():
+    n = 100
+    cases = {
+        'integer': (pd.Series(['1,200', '35', '-4'] * n), 'numeric'),
+        'decimal': (pd.Series(['1.5', '2', '3.25'] * n), 'numeric'),
+        'percent': (pd.Series(['12%', '3.5 %', '100%'] * n), 'numeric'),
+        'currency': (pd.Series(['$1,200.50', '$3', '($4.00)'] * n), 'numeric'),
+        'boolean': (pd.Series(['Yes', 'no', 'Y'] * n), 'string'),
+        'categorical': (pd.Series(['Walmart', 'Target', 'Kroger'] * n), 'string'),
+    }
+    for expected, (series, hint) in cases.items():
+        info = infer_column(series)
+        assert info['inferred_type'] == expected, (expected, info)
+        assert info['format_hint'] == hint
+        assert info['confidence'] >= 0.95
+
+    info = infer_column(pd.Series(['31/01/2024', '15/02/2024', None] * n))
+    assert (info['inferred_type'], info['date_format'], info['format_hint']) == ('date', '%d/%m/%Y', 'datetime')
+    info = infer_column(pd.Series(['2024-01-31 10:00:00'] * n))
+    assert info['inferred_type'] == 'datetime' and info['date_format'] == '%Y-%m-%d %H:%M:%S'
+    assert infer_column(pd.Series([f'free text {i}' for i in range(3 * n)]))['inferred_type'] == 'string'
+    assert infer_column(pd.Series([1.0, 2.0, np.nan]))['inferred_type'] == 'integer'
+
+
+def test_dirty_values_lower_confidence_not_type():
+    values = ['10'] * 97 + ['n/a', '-', '?']
+    info = infer_column(pd.Series(values))
+    assert info['inferred_type'] == 'integer'
+    assert info['confidence'] == 0.97
+
+
+def test_sample_is_bounded_and_spread():
+    df = pd.DataFrame({'x': np.arange(1_000_000)})
+    sample = stratified_sample(df, 1000)
+    assert len(sample) == 1000
+    assert sample['x'].iloc[0] == 0 and sample['x'].iloc[-1] == 999_999
+    assert infer_types(df)['x']['inferred_type'] == 'integer'
@@ -0,0 +1,103 @@
+import datetime
+
+import pytest
+
+from insight_agent import ingest, workbook
+
+openpyxl = pytest.importorskip('openpyxl')
+
+
+@pytest.fixture(params=['openpyxl', 'calamine'])
+def engine(request, monkeypatch, tmp_path):
+    if request.param == 'calamine':
+        pytest.importorskip('python_calamine')
+    monkeypatch.setattr(workbook, '_engine', lambda streaming=False: request.param)
+    monkeypatch.setattr(workbook, 'SPILL_DIR', str(tmp_path / 'spill'))
+    return request.param
+
+
+def _workbook(path, rows):
+    book = openpyxl.Workbook()
+    book.active.title = 'Notes'
+    book.active.append(['Not the data'])
+    sheet = book.create_sheet('Data')
+    sheet.append(['Weekly POS extract'])
+    sheet.append(['Week', 'Store', 'Units', 'Sales', 'Promo'])
+    for row in rows:
+        sheet.append(row)
+    book.save(path)
+    return str(path)
+
+
+def test_sheet_and_header_row_stream_into_typed_chunks(engine, tmp_path, monkeypatch):
+    rows = [[datetime.datetime(2024, 1, 1 + i), f"S{i % 3}", i, 2 if i == 0 else i * 1.5, i % 2 == 0]
+            for i in range(7)]
+    rows.insert(3, [None] * 5)
+    path = _workbook(tmp_path / 'pos.xlsx', rows)
+
+    chunks = list(ingest.iter_chunks(path, 3, sheet='Data', header_row=1))
+    assert [len(c) for c in chunks] == [3, 3, 1]
+    first = chunks[0]
+    assert list(first.columns) == ['Week', 'Store', 'Units', 'Sales', 'Promo']
+    assert str(first['Units'].dtype) == 'Int64'
+    assert first['Sales'].tolist() == [2.0, 1.5, 3.0]
+    assert first['Week'].iloc[0] == datetime.datetime(2024, 1, 1)
+    assert first['Promo'].tolist() == [True, False, True]
+
+    # Later steps read the spilled Parquet instead of parsing the workbook again
+    def no_parse(*args, **kwargs):
+        raise AssertionError('workbook parsed twice')
+
+    monkeypatch.setattr(workbook, '_iter_rows', no_parse)
+    with open(path, 'rb') as fh:
+        frame = ingest.read_frame(fh, sheet='Data', header_row=1)
+    assert len(frame) == 7 and frame['Store'].tolist()[:3] == ['S0', 'S1', 'S2']
+
+
+def test_types_widen_when_later_rows_do_not_fit_the_first_batch(engine, tmp_path, monkeypatch):
+    import os
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from insight_agent.column_types import TableCaster
+
+    rows = [[datetime.datetime(2024, 1, 1), 'S1', i, i, True] for i in range(4)]
+    rows.append([datetime.datetime(2024, 1, 1), 'S1', 'n/a', 2.5, True])
+    path = _workbook(tmp_path / 'late.xlsx', rows)
+    batches = list(workbook.iter_batches(path, sheet='Data', header_row=1, batch_rows=2))
+    assert [b.schema.field('Sales').type for b in batches] == [pa.int64(), pa.int64(), pa.float64()]
+    assert batches[-1].schema.field('Units').type == pa.string()
+    with pytest.raises(ValueError, match='not found'):
+        list(workbook.iter_batches(path, sheet='Missing'))
+
+    # The spill is rewritten in the widened schema: no value is truncated
+    monkeypatch.setattr(workbook, 'BATCH_ROWS', 2)
+    spilled = workbook.spill(path, sheet='Data', header_row=1)
+    assert pq.ParquetFile(spilled).num_row_groups == 3
+    table = pq.read_table(spilled)
+    assert table.column('Sales').to_pylist() == [0.0, 1.0, 2.0, 3.0, 2.5]
+    assert table.column('Units').to_pylist() == ['0', '1', '2', '3', 'n/a']
+    assert [f for f in os.listdir(workbook.SPILL_DIR) if f.endswith('.tmp')] == []
+
+    # Onboarding casts the text back to the mapping's type and counts the coercion
+    caster = TableCaster([{'original_name': 'Units', 'canonical_name': 'Units', 'data_type': 'integer'}])
+    frame = caster.cast_frame(next(ingest.iter_chunks(path, 10, sheet='Data', header_row=1)))
+    assert frame['Units'].tolist()[:4] == [0, 1, 2, 3] and frame['Units'].isna().iloc[4]
+    assert caster.coerced == {'Units': 1}
+
+
+def test_header_is_read_from_the_sheet_xml_without_the_engines(tmp_path, monkeypatch):
+    rows = [[datetime.datetime(2024, 1, 1), 'S1', i, 1.5, True] for i in range(50)]
+    path = _workbook(tmp_path / 'pos.xlsx', rows)
+
+    def no_parse(*args, **kwargs):
+        raise AssertionError('sheet opened with a workbook engine')
+
+    monkeypatch.setattr(workbook, '_iter_rows', no_parse)
+    assert ingest.read_header(path, sheet='Data', header_row=1) == ['Week', 'Store', 'Units', 'Sales', 'Promo']
+    assert ingest.read_header(path, sheet=1) == ['Weekly POS extract']
+    with open(path, 'rb') as fh:
+        assert ingest.read_header(fh, sheet='Data', header_row=1)[:2] == ['Week', 'Store']
+        assert fh.tell() == 0
+    with pytest.raises(ValueError, match='past the end'):
+        ingest.read_header(path, sheet='Data', header_row=500)
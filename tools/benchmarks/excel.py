@@ -0,0 +1,139 @@
+"""Benchmark Excel ingestion: pandas.read_excel against the streaming spill.
+
+A synthetic .xlsx workbook conforming to a kind's mapping is written for
+each scale, then read in a fresh process by each path:
+
+- read_excel: pandas.read_excel of the whole sheet, then sliced into chunks
+  (the ingestion path before workbook.spill).
+- spill/<engine>: ingest.iter_chunks, which streams the sheet into a Parquet
+  spill with python-calamine or openpyxl; `reread_s` is a second iteration,
+  served from the spill as every later step is.
+
+Wall time and peak RSS are recorded per path and appended to a JSON history.
+
+Usage: python -m tools.benchmarks.excel [--kind "NIQ POS"] [--rows 100000 --rows 500000 ...]
+"""
+import argparse
+import datetime
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from tools.benchmarks import synthetic
+from tools.benchmarks.pipeline import _commit, _peak_rss_mb, load_history, save_history
+
+HISTORY_PATH = os.path.join('domain', 'cache', 'bench', 'excel.json')
+# Rows per chunk handed to onboarding, as in ingest.DEFAULT_CHUNKSIZE.
+CHUNK_ROWS = 100_000
+
+
+def write_workbook(mapping, rows, path, seed=0):
+    """Write a synthetic .xlsx instance file; returns its size in bytes."""
+    import openpyxl
+
+    book = openpyxl.Workbook(write_only=True)
+    sheet = book.create_sheet('Data')
+    header_written = False
+    for frame in synthetic.iter_frames(mapping, rows, seed):
+        if not header_written:
+            sheet.append(list(frame.columns))
+            header_written = True
+        for row in frame.itertuples(index=False):
+            sheet.append([v.item() if hasattr(v, 'item') else v for v in row])
+    book.save(path)
+    return os.path.getsize(path)
+
+
+def _read(path, method):
+    """Read the workbook by one path (runs in a child process)."""
+    result = {}
+    start = time.perf_counter()
+    rows = 0
+    if method == 'read_excel':
+        import pandas as pd
+
+        frame = pd.read_excel(path)
+        for begin in range(0, len(frame), CHUNK_ROWS):
+            rows += len(frame.iloc[begin:begin + CHUNK_ROWS])
+    else:
+        from insight_agent import ingest, workbook
+
+        engine = method.split('/', 1)[1]
+        workbook._engine = lambda streaming=False: engine
+        workbook.SPILL_DIR = os.path.join(os.path.dirname(path), f"spill-{engine}")
+        for chunk in ingest.iter_chunks(path, CHUNK_ROWS):
+            rows += len(chunk)
+        result['spill_mb'] = round(sum(os.path.getsize(os.path.join(workbook.SPILL_DIR, f))
+                                       for f in os.listdir(workbook.SPILL_DIR)) / 1e6, 3)
+        reread = time.perf_counter()
+        for chunk in ingest.iter_chunks(path, CHUNK_ROWS):
+            pass
+        result['reread_s'] = round(time.perf_counter() - reread, 3)
+        result['seconds'] = round(reread - start, 3)
+    result.setdefault('seconds', round(time.perf_counter() - start, 3))
+    result['rows'] = rows
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def methods():
+    """Ingestion paths available here."""
+    found = ['read_excel', 'spill/openpyxl']
+    try:
+        import python_calamine  # noqa: F401
+        found.append('spill/calamine')
+    except ImportError:
+        pass
+    return found
+
+
+def run(kind, scales, seed=0):
+    """Benchmark every scale and return the history entry."""
+    mapping = synthetic.load_mapping(kind)
+    context = multiprocessing.get_context('spawn')
+    results = []
+    with tempfile.TemporaryDirectory(prefix='insight-excel-') as tmp:
+        for rows in scales:
+            path = os.path.join(tmp, f"instance-{rows}.xlsx")
+            start = time.perf_counter()
+            size = write_workbook(mapping, rows, path, seed=seed)
+            scale = {'rows': rows, 'generate_s': round(time.perf_counter() - start, 3),
+                     'xlsx_mb': round(size / 1e6, 3), 'methods': {}}
+            for method in methods():
+                with context.Pool(1, maxtasksperchild=1) as pool:
+                    scale['methods'][method] = pool.apply(_read, (path, method))
+                timing = scale['methods'][method]
+                print(f"{rows:>10,} rows {method:<16} {timing['seconds']:>8.2f}s "
+                      f"peak RSS {timing['peak_rss_mb']} MB"
+                      + (f", re-read {timing['reread_s']:.2f}s" if 'reread_s' in timing else ''), flush=True)
+            os.remove(path)
+            results.append(scale)
+    return {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': _commit(),
+        'kind': kind,
+        'python': sys.version.split()[0],
+        'cpus': os.cpu_count(),
+        'scales': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--kind', default='NIQ POS')
+    parser.add_argument('--rows', type=int, action='append', dest='scales', help='rows per scale (repeatable)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--history', default=HISTORY_PATH)
+    args = parser.parse_args(argv)
+
+    entry = run(args.kind, args.scales or [50_000], seed=args.seed)
+    history = load_history(args.history)
+    history.append(entry)
+    save_history(history, args.history)
+    print(f"Results appended to {args.history}")
+
+
+if __name__ == '__main__':
+    main()
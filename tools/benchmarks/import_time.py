@@ -0,0 +1,130 @@
+"""Measure the import time of the app's modules and check they stay lazy.
+
+Each module is imported in a fresh interpreter (`python -X importtime`), so
+times are cold and independent of import order; the best of several runs is
+kept. A module that pulls in one of the heavy packages it must not import at
+load time (litellm, pandas, ...) fails --check. Results are appended to a
+JSON history and compared with the previous entry.
+
+Usage: python -m tools.benchmarks.import_time [--repeat 5] [--check] [--fail-on-regression]
+"""
+import argparse
+import datetime
+import os
+import subprocess
+import sys
+
+from tools.benchmarks.pipeline import _commit, load_history, save_history
+
+HISTORY_PATH = os.path.join('domain', 'cache', 'bench', 'imports.json')
+DEFAULT_REPEAT = 5
+# Packages that take long to import; modules import them inside the functions that need them.
+HEAVY = ('litellm', 'pandas', 'pyarrow', 'duckdb', 'dotenv')
+# Module -> heavy packages it may import at load time. `resources` is the
+# app's shared-services module (app/ is on the path when Streamlit runs).
+MODULES = {
+    'resources': (),
+    'insight_agent.llm_client': (),
+    'insight_agent.prompt_builder': (),
+    'insight_agent.catalog': (),
+    'insight_agent.tracing': (),
+    'insight_agent.query_pool': (),
+    'insight_agent.job_runner': (),
+    'insight_agent.kind_manager': (),
+    'insight_agent.instance_manager': (),
+    'insight_agent.workbook': (),
+    'insight_agent.sampling': (),
+    'insight_agent.result_cache': (),
+    'insight_agent.semantic_cache': (),
+    'insight_agent.connection_manager': ('duckdb',),
+    'insight_agent.query_executor': ('duckdb',),
+}
+# A module this many times slower than the previous run is reported as a regression.
+REGRESSION_FACTOR = 1.5
+# Imports faster than this are too noisy to compare.
+MIN_COMPARED_MS = 20.0
+
+
+def _measure(module):
+    """One cold import: (milliseconds, heavy packages loaded)."""
+    code = (f"import sys; import {module}; "
+            f"print('HEAVY=' + ','.join(m for m in {HEAVY!r} if m in sys.modules))")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, ['app', os.environ.get('PYTHONPATH')])))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                          env=env, check=True)
+    cumulative_us = 0
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:'):
+            continue
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative_us = int(parts[1])
+    heavy = next(line[len('HEAVY='):] for line in proc.stdout.splitlines() if line.startswith('HEAVY='))
+    return cumulative_us / 1000, [m for m in heavy.split(',') if m]
+
+
+def run(modules=MODULES, repeat=DEFAULT_REPEAT):
+    """Best-of-`repeat` cold import time and heavy imports of each module."""
+    results = {}
+    for module, allowed in modules.items():
+        samples = [_measure(module) for _ in range(repeat)]
+        heavy = samples[0][1]
+        results[module] = {
+            'ms': round(min(ms for ms, _ in samples), 1),
+            'heavy': heavy,
+            'unexpected': [m for m in heavy if m not in allowed],
+        }
+        print(f"{module:<40} {results[module]['ms']:>8.1f} ms  {', '.join(heavy) or '-'}")
+    return {
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': _commit(),
+        'python': sys.version.split()[0],
+        'repeat': repeat,
+        'modules': results,
+    }
+
+
+def compare(previous, current, factor=REGRESSION_FACTOR):
+    """Modules whose import got more than `factor` times slower.
+
+    Returns:
+        list: (module, before_ms, after_ms) for each regression.
+    """
+    regressions = []
+    for module, result in current['modules'].items():
+        base = previous.get('modules', {}).get(module, {}).get('ms')
+        if base and base >= MIN_COMPARED_MS and result['ms'] > base * factor:
+            regressions.append((module, base, result['ms']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--history', default=HISTORY_PATH)
+    parser.add_argument('--check', action='store_true', help='fail if a module imports a heavy package eagerly')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(argv)
+
+    entry = run(repeat=args.repeat)
+    history = load_history(args.history)
+    previous = history[-1] if history else None
+    history.append(entry)
+    save_history(history, args.history)
+    print(f"Results appended to {args.history}")
+
+    failed = False
+    for module, result in entry['modules'].items():
+        if result['unexpected']:
+            print(f"EAGER IMPORT {module} loads {', '.join(result['unexpected'])} at import time")
+            failed = failed or args.check
+    regressions = compare(previous, entry) if previous else []
+    for module, before, after in regressions:
+        print(f"REGRESSION {module}: {before} ms -> {after} ms (vs {previous.get('commit')})")
+    if failed or (regressions and args.fail_on_regression):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
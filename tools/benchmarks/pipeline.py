@@ -0,0 +1,346 @@
+"""Benchmark onboarding and the ask pipeline on synthetic data at several scales.
+
+For each scale a synthetic instance file conforming to the kind's mapping is
+generated, onboarded into a scratch copy of the kind, and queried with a fixed
+battery of representative SQL; prompts go through build_prompt and a fake LLM
+(no network). Each scale runs in a fresh process so peak RSS is its own.
+Results are appended to a JSON history and compared with the previous entry
+for the same kind and scale.
+
+Usage: python -m tools.benchmarks.pipeline [--kind "NIQ POS"] [--rows 10000 --rows 1000000 ...]
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from tools.benchmarks import synthetic
+
+HISTORY_PATH = os.path.join('domain', 'cache', 'bench', 'history.json')
+# Timed runs per query after the cold one.
+DEFAULT_REPEAT = 5
+# A metric this many times slower than the previous run is reported as a regression.
+REGRESSION_FACTOR = 1.25
+QUESTIONS = [
+    'total dollar sales',
+    'dollar sales by market',
+    'top 10 brands by dollar sales',
+    'sales by market and brand',
+    'brand sales in the largest market',
+    'weekly sales trend',
+    'how many brands are there',
+    'average unit sales by market',
+]
+
+
+def _ident(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _lit(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def percentile(values, q):
+    """q-th percentile (0..100) of a list by nearest rank."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+def _timings(samples_s):
+    ms = [s * 1000 for s in samples_s]
+    return {'p50_ms': round(percentile(ms, 50), 3), 'p95_ms': round(percentile(ms, 95), 3),
+            'max_ms': round(max(ms), 3)}
+
+
+def query_battery(mapping):
+    """(name, sql) pairs of representative questions over a mapping's columns.
+
+    Uses the two lowest-cardinality dimensions, the first two measures
+    (dollar measures first) and a period column when there is one.
+    """
+    from insight_agent.column_types import storage_kind
+
+    dims, periods, measures = [], [], []
+    for rec in mapping:
+        name = rec.get('canonical_name') or rec.get('original_name')
+        if synthetic._is_measure(rec):
+            if 'ya' not in name.lower().split('_'):
+                measures.append(name)
+        elif storage_kind(rec) in ('date', 'timestamp') or synthetic.cardinality(rec) == synthetic.WEEKS:
+            periods.append(name)
+        else:
+            dims.append((synthetic.cardinality(rec), name, rec))
+    dims.sort(key=lambda d: d[0])
+    measures.sort(key=lambda m: 'dollar' not in m.lower())
+    if len(dims) < 2 or len(measures) < 2:
+        raise ValueError('The mapping needs at least two dimensions and two measures to benchmark.')
+    (_, d1, d1_rec), (_, d2, _) = dims[0], dims[1]
+    m1, m2 = _ident(measures[0]), _ident(measures[1])
+    d1, d2 = _ident(d1), _ident(d2)
+    battery = [
+        ('total', f"SELECT SUM({m1}) AS total FROM data"),
+        ('by_dimension', f"SELECT {d1}, SUM({m1}) AS total FROM data GROUP BY {d1} ORDER BY total DESC"),
+        ('top_10', f"SELECT {d2}, SUM({m1}) AS total FROM data GROUP BY {d2} ORDER BY total DESC LIMIT 10"),
+        ('two_dimensions', f"SELECT {d1}, {d2}, SUM({m1}) AS m1, SUM({m2}) AS m2 FROM data GROUP BY ALL"),
+        ('filtered', f"SELECT {d2}, SUM({m1}) AS total FROM data "
+                     f"WHERE {d1} = {_lit(synthetic.dimension_value(d1_rec, 0))} GROUP BY {d2}"),
+    ]
+    if periods:
+        period = _ident(periods[0])
+        battery.append(('trend', f"SELECT {period}, SUM({m1}) AS total FROM data GROUP BY {period} ORDER BY {period}"))
+    battery.extend([
+        ('distinct', f"SELECT COUNT(DISTINCT {d2}) AS n FROM data"),
+        ('average', f"SELECT {d1}, AVG({m2}) AS avg_m2 FROM data GROUP BY {d1}"),
+        ('rows', "SELECT * FROM data LIMIT 100"),
+    ])
+    return battery
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KiB elsewhere
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def _dir_bytes(path, sub=None):
+    total = 0
+    for root, _, files in os.walk(os.path.join(path, sub) if sub else path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files if f.endswith('.parquet'))
+    return total
+
+
+def _run_scale(kind, csv_path, rows, repeat):
+    """Onboard one file and time the query battery and ask pipeline (runs in a child process)."""
+    from insight_agent.dataset_store import dataset_dir
+    from tests.insight_agent.fake_llm import FakeLLM
+    from insight_agent.instance_manager import onboard_instance
+    from insight_agent.llm_client import AsyncLLMClient
+    from insight_agent.prompt_builder import build_prompt
+    from insight_agent.query_executor import execute_query
+
+    result = {}
+    start = time.perf_counter()
+    success, message = onboard_instance(kind, csv_path)
+    elapsed = time.perf_counter() - start
+    if not success:
+        raise RuntimeError(message)
+    result['onboard'] = {'seconds': round(elapsed, 3), 'rows_per_s': round(rows / elapsed, 1),
+                         'peak_rss_mb': _peak_rss_mb()}
+    base = dataset_dir(kind)
+    result['dataset_mb'] = round(_dir_bytes(base) / 1e6, 3)
+    result['rollups_mb'] = round(_dir_bytes(base, 'rollups') / 1e6, 3)
+
+    battery = query_battery(synthetic.load_mapping(kind))
+    queries = {}
+    for name, sql in battery:
+        start = time.perf_counter()
+        execute_query(kind, sql, max_rows=10_000)
+        cold = time.perf_counter() - start
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            execute_query(kind, sql, max_rows=10_000)
+            samples.append(time.perf_counter() - start)
+        queries[name] = dict(_timings(samples), cold_ms=round(cold * 1000, 3))
+    result['queries'] = queries
+
+    prompt_samples = []
+    for _ in range(repeat):
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            build_prompt(kind, question)
+            prompt_samples.append(time.perf_counter() - start)
+    result['build_prompt'] = _timings(prompt_samples)
+
+    # Ask end to end: prompt -> (fake) LLM -> SQL execution, one question after another
+    answers = [sql for _, sql in battery]
+    llm = FakeLLM(sql=lambda prompt: answers[llm.calls % len(answers)], latency=0.0)
+    client = AsyncLLMClient(acompletion=llm.acompletion, max_retries=0)
+
+    async def ask_all():
+        llm_samples, ask_samples = [], []
+        for _ in range(repeat):
+            for question in QUESTIONS:
+                start = time.perf_counter()
+                prompt = build_prompt(kind, question)
+                llm_start = time.perf_counter()
+                sql = await client.aget_sql(prompt)
+                llm_samples.append(time.perf_counter() - llm_start)
+                execute_query(kind, sql, max_rows=10_000)
+                ask_samples.append(time.perf_counter() - start)
+        return llm_samples, ask_samples
+
+    start = time.perf_counter()
+    llm_samples, ask_samples = asyncio.run(ask_all())
+    total = time.perf_counter() - start
+    result['llm_client'] = _timings(llm_samples)
+    result['ask'] = dict(_timings(ask_samples), questions_per_s=round(len(ask_samples) / total, 2))
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def _prepare_kind(kind, bench_kind, rollup_dims):
+    source = os.path.join('domain', 'catalog', 'kinds', kind, 'v1')
+    target = os.path.join('domain', 'catalog', 'kinds', bench_kind, 'v1')
+    shutil.rmtree(os.path.dirname(target), ignore_errors=True)
+    shutil.rmtree(os.path.join('domain', 'catalog', 'datasets', bench_kind), ignore_errors=True)
+    os.makedirs(target)
+    mapping = synthetic.load_mapping(kind)
+    for rec in mapping:
+        name = rec.get('canonical_name') or rec.get('original_name')
+        rec['rollup_order'] = rollup_dims.index(name) + 1 if name in rollup_dims else ''
+    with open(os.path.join(target, 'mapping_effective.json'), 'w') as fh:
+        json.dump(mapping, fh, indent=2)
+    description = os.path.join(source, 'description.md')
+    if os.path.exists(description):
+        shutil.copy(description, target)
+    return mapping
+
+
+def _cleanup_kind(bench_kind):
+    shutil.rmtree(os.path.join('domain', 'catalog', 'kinds', bench_kind), ignore_errors=True)
+    shutil.rmtree(os.path.join('domain', 'catalog', 'datasets', bench_kind), ignore_errors=True)
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(kind, scales, repeat=DEFAULT_REPEAT, rollup_dims=(), seed=0, keep=False):
+    """Benchmark every scale and return the history entry."""
+    import duckdb
+
+    bench_kind = f"bench_{kind}"
+    mapping = _prepare_kind(kind, bench_kind, list(rollup_dims))
+    context = multiprocessing.get_context('spawn')
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix='insight-bench-') as tmp:
+            for rows in scales:
+                csv_path = os.path.join(tmp, f"instance-{rows}.csv")
+                start = time.perf_counter()
+                size = synthetic.generate(mapping, rows, csv_path, seed=seed)
+                generate_s = time.perf_counter() - start
+                with context.Pool(1, maxtasksperchild=1) as pool:
+                    scale = pool.apply(_run_scale, (bench_kind, csv_path, rows, repeat))
+                os.remove(csv_path)
+                scale = dict({'rows': rows, 'generate_s': round(generate_s, 3), 'csv_mb': round(size / 1e6, 3)},
+                             **scale)
+                results.append(scale)
+                print(f"{rows:>12,} rows: onboard {scale['onboard']['seconds']:.2f}s, "
+                      f"ask p50 {scale['ask']['p50_ms']:.1f} ms, peak RSS {scale['peak_rss_mb']} MB", flush=True)
+    finally:
+        if not keep:
+            _cleanup_kind(bench_kind)
+    return {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': _commit(),
+        'kind': kind,
+        'rollup_dims': list(rollup_dims),
+        'repeat': repeat,
+        'python': sys.version.split()[0],
+        'duckdb': duckdb.__version__,
+        'cpus': os.cpu_count(),
+        'scales': results,
+    }
+
+
+def _latency_metrics(scale):
+    """Flat {metric: value} of the figures where larger is worse."""
+    metrics = {'onboard.seconds': scale['onboard']['seconds'], 'peak_rss_mb': scale['peak_rss_mb'],
+               'dataset_mb': scale['dataset_mb'], 'ask.p50_ms': scale['ask']['p50_ms'],
+               'build_prompt.p50_ms': scale['build_prompt']['p50_ms']}
+    for name, timing in scale['queries'].items():
+        metrics[f"queries.{name}.p50_ms"] = timing['p50_ms']
+    return metrics
+
+
+def compare(previous, current, factor=REGRESSION_FACTOR):
+    """Metrics of `current` more than `factor` times worse than in `previous`.
+
+    Returns:
+        list: (rows, metric, before, after) for each regression.
+    """
+    before_by_rows = {s['rows']: s for s in previous.get('scales', [])}
+    regressions = []
+    for scale in current['scales']:
+        before = before_by_rows.get(scale['rows'])
+        if before is None:
+            continue
+        old, new = _latency_metrics(before), _latency_metrics(scale)
+        for metric, value in new.items():
+            base = old.get(metric)
+            # Sub-millisecond timings are too noisy to compare
+            if value is None or not base or (metric.endswith('_ms') and base < 1.0):
+                continue
+            if value > base * factor:
+                regressions.append((scale['rows'], metric, base, value))
+    return regressions
+
+
+def load_history(path=HISTORY_PATH):
+    try:
+        with open(path, 'r') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return []
+
+
+def save_history(history, path=HISTORY_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fh:
+        json.dump(history, fh, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--kind', default='NIQ POS')
+    parser.add_argument('--rows', type=int, action='append', dest='scales',
+                        help='rows per scale (repeatable; 10K to 100M)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--rollup-dim', action='append', dest='rollup_dims', default=[],
+                        help='canonical dimension to build rollups on (repeatable, coarsest first)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--history', default=HISTORY_PATH)
+    parser.add_argument('--keep', action='store_true', help='keep the scratch kind and its dataset')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(argv)
+
+    entry = run(args.kind, args.scales or [10_000, 100_000], repeat=args.repeat, rollup_dims=args.rollup_dims,
+                seed=args.seed, keep=args.keep)
+    history = load_history(args.history)
+    previous = next((h for h in reversed(history)
+                     if h.get('kind') == entry['kind'] and h.get('rollup_dims') == entry['rollup_dims']), None)
+    history.append(entry)
+    save_history(history, args.history)
+    print(f"Results appended to {args.history}")
+
+    regressions = compare(previous, entry) if previous else []
+    for rows, metric, before, after in regressions:
+        print(f"REGRESSION {rows:,} rows {metric}: {before} -> {after} (vs {previous.get('commit')})")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Report tokens per prompt with and without schema pruning.
+
+Usage: python -m tools.benchmarks.prompt_tokens [--kind "NIQ POS"] [--budget 300 ...]
+"""
+import argparse
+import time
+
+from insight_agent.prompt_builder import build_prompt, estimate_tokens, _static_context
+
+QUESTIONS = [
+    'dollar sales by brand',
+    'total sales by retailer last 4 weeks',
+    'which categories grew unit sales versus year ago',
+    'average volume price by market',
+    'top 10 brands by %ACV distribution',
+    'promo dollar sales share by category',
+]
+
+
+def run(kind, budgets, repeat=200):
+    rows = []
+    for question in QUESTIONS:
+        row = {'question': question,
+               'full': estimate_tokens(build_prompt(kind, question, prune_schema=False))}
+        for budget in budgets:
+            row[budget] = estimate_tokens(build_prompt(kind, question, schema_token_budget=budget))
+        rows.append(row)
+
+    # Per-request build time with a cold and a warm static-context cache
+    _static_context.cache_clear()
+    start = time.perf_counter()
+    build_prompt(kind, QUESTIONS[0])
+    cold_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    for i in range(repeat):
+        build_prompt(kind, QUESTIONS[i % len(QUESTIONS)])
+    warm_ms = (time.perf_counter() - start) * 1000 / repeat
+    return rows, cold_ms, warm_ms
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--kind', default='NIQ POS')
+    parser.add_argument('--budget', type=int, action='append', dest='budgets')
+    args = parser.parse_args(argv)
+    budgets = args.budgets or [1200, 300, 150]
+
+    rows, cold_ms, warm_ms = run(args.kind, budgets)
+    header = ['question', 'full'] + [f'budget={b}' for b in budgets]
+    print(' | '.join(header))
+    for row in rows:
+        print(' | '.join([row['question'], str(row['full'])] + [str(row[b]) for b in budgets]))
+    for b in budgets:
+        mean_full = sum(r['full'] for r in rows) / len(rows)
+        mean_b = sum(r[b] for r in rows) / len(rows)
+        print(f"budget={b}: mean tokens {mean_full:.0f} -> {mean_b:.0f} ({100 * (1 - mean_b / mean_full):.0f}% fewer)")
+    print(f"build_prompt: cold {cold_ms:.2f} ms, cached {warm_ms:.3f} ms per prompt")
+
+
+if __name__ == '__main__':
+    main()
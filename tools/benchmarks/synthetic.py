@@ -0,0 +1,134 @@
+"""Generate synthetic instance files that conform to a kind's mapping.
+
+Usage: python -m tools.benchmarks.synthetic --kind "NIQ POS" --rows 1000000 --out pos.csv
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from insight_agent.column_types import storage_kind
+
+# Rows generated per chunk; files of any size are written with flat memory.
+DEFAULT_CHUNK_ROWS = 500_000
+# Weekly periods a dataset spans.
+WEEKS = 104
+FIRST_WEEK = '2023-01-07'
+# Distinct values of a dimension by a keyword of its name or mapping type, checked in order.
+CARDINALITY = [
+    ('time', WEEKS), ('week', WEEKS), ('period', WEEKS),
+    ('store', 2000), ('item', 5000), ('upc', 5000), ('sku', 5000),
+    ('geograph', 50), ('market', 50), ('retailer', 25), ('location', 50),
+    ('category', 20), ('brand', 200), ('manufacturer', 60),
+]
+DEFAULT_CARDINALITY = 100
+# Skew of dimension values (Zipf exponent); real POS data is dominated by a few brands and markets.
+SKEW = 0.8
+
+
+def _canonical(rec):
+    orig = rec.get('original_name')
+    return rec.get('canonical_name', orig) or orig
+
+
+def _is_measure(rec):
+    return 'measure' in str(rec.get('type', '') or '').lower()
+
+
+def cardinality(rec):
+    """Number of distinct values generated for a dimension column."""
+    words = f"{_canonical(rec)} {rec.get('original_name', '')} {rec.get('type', '')}".lower()
+    for word, count in CARDINALITY:
+        if word in words:
+            return count
+    return DEFAULT_CARDINALITY
+
+
+def dimension_value(rec, index):
+    """The index-th value of a dimension column (0 is the most frequent)."""
+    label = str(rec.get('original_name') or _canonical(rec))
+    return f"{label} {index:04d}"
+
+
+def _weights(count):
+    weights = 1.0 / np.arange(1, count + 1) ** SKEW
+    return weights / weights.sum()
+
+
+class _ColumnGenerator:
+    def __init__(self, rec):
+        self.rec = rec
+        self.kind = storage_kind(rec)
+        self.measure = _is_measure(rec)
+        name = f"{_canonical(rec)} {rec.get('original_name', '')} {rec.get('data_type', '')}".lower()
+        self.percent = '%' in name or 'pct' in name or 'percent' in name
+        if not self.measure and self.kind not in ('date', 'timestamp', 'boolean'):
+            count = cardinality(rec)
+            self.values = np.array([dimension_value(rec, i) for i in range(count)], dtype=object)
+            self.weights = _weights(count)
+
+    def __call__(self, rng, rows):
+        if self.kind in ('date', 'timestamp'):
+            weeks = rng.integers(0, WEEKS, rows)
+            return pd.Timestamp(FIRST_WEEK) + pd.to_timedelta(weeks * 7, unit='D')
+        if self.kind == 'boolean':
+            return rng.random(rows) < 0.5
+        if not self.measure:
+            return self.values[rng.choice(len(self.values), rows, p=self.weights)]
+        if self.percent:
+            return rng.uniform(0, 100, rows).round(1)
+        if self.kind == 'integer':
+            return rng.poisson(20, rows)
+        return rng.lognormal(3.0, 1.0, rows).round(2)
+
+
+def iter_frames(mapping, rows, seed=0, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yield DataFrames (original column names) totalling `rows` rows.
+
+    Values are deterministic for a seed: dimensions are drawn with a Zipf
+    skew from a fixed vocabulary per column (see dimension_value), dates are
+    weekly, and measures follow log-normal (amounts), Poisson (integer
+    counts) or uniform (percent) distributions.
+    """
+    generators = [(rec.get('original_name'), _ColumnGenerator(rec)) for rec in mapping if rec.get('original_name')]
+    for number, start in enumerate(range(0, rows, chunk_rows)):
+        size = min(chunk_rows, rows - start)
+        rng = np.random.default_rng([seed, number])
+        yield pd.DataFrame({name: gen(rng, size) for name, gen in generators})
+
+
+def generate(mapping, rows, path, seed=0, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Write a synthetic CSV instance file for a mapping.
+
+    Returns:
+        int: size of the written file in bytes.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', newline='') as fh:
+        for i, frame in enumerate(iter_frames(mapping, rows, seed, chunk_rows)):
+            frame.to_csv(fh, index=False, header=(i == 0), date_format='%Y-%m-%d')
+    return os.path.getsize(path)
+
+
+def load_mapping(kind):
+    """The kind's effective mapping records."""
+    path = os.path.join('domain', 'catalog', 'kinds', kind, 'v1', 'mapping_effective.json')
+    with open(path, 'r') as fh:
+        return json.load(fh)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--kind', default='NIQ POS')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args(argv)
+    size = generate(load_mapping(args.kind), args.rows, args.out, seed=args.seed)
+    print(f"Wrote {args.rows:,} rows ({size / 1e6:.1f} MB) to {args.out}")
+
+
+if __name__ == '__main__':
+    main()